@@ -0,0 +1,60 @@
+"""
+一括見積り (bulk_quote.quote_many) のベンチマーク
+
+    python benchmarks/bench_bulk_quote.py [--rows N] [--workers N]
+
+商品 × 割引 × 枚数 × プリント位置数 × 色数 の what-if 表を N 件作り、
+自プロセスだけで計算した場合とプロセスプールを使った場合の時間を比べる。
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bulk_quote  # noqa: E402
+from product_catalog import PRODUCT_NAMES  # noqa: E402
+
+COLORS = ["ホワイト", "ライトグレー", "ダークグレー"]
+
+
+def what_if_grid(rows):
+    grid = itertools.product(
+        PRODUCT_NAMES,
+        ["早割", "通常"],
+        range(10, 301, 10),
+        range(1, 5),
+        range(1, 4),
+        ["", "中"],
+    )
+    for item, discount, qty, positions, colors, full_color in itertools.islice(itertools.cycle(grid), rows):
+        config = {"productName": item, "discountOption": discount, "totalQuantity": str(qty)}
+        for p in range(1, positions + 1):
+            config[f"printPositionNo{p}"] = str(p)
+            for c in range(colors):
+                config[f"printColorOption{p}_{c + 1}"] = COLORS[c]
+            if full_color:
+                config[f"fullColorSize{p}"] = full_color
+        yield config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+    if args.workers:
+        bulk_quote.BULK_QUOTE_WORKERS = args.workers
+
+    configs = list(what_if_grid(args.rows))
+    for name, inline_rows in (("inline", len(configs)), ("pool", 0)):
+        start = time.perf_counter()
+        n = sum(1 for _ in bulk_quote.quote_many(configs, max_rows=0, inline_rows=inline_rows))
+        elapsed = time.perf_counter() - start
+        print(f"{name:6s}: {n} rows in {elapsed:.3f}s ({elapsed / n * 1e6:.1f} us/row)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+カンタン見積りの状態遷移 (estimate_flow.advance) のベンチマーク
+
+    python benchmarks/bench_estimate_flow.py [--number N]
+
+LINE SDK なしで、全ステップを通る入力列を N 回流して1ステップあたりの時間を測る。
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import estimate_flow  # noqa: E402
+
+SINGLE_FLOW = ["学生", "14日目以降", "特になし", "ゲームシャツ", "20～29枚", "前のみ", "前 or 背中 2色"]
+BOTH_FLOW = ["一般", "14日目以内", "3,500円以内", "フーデッドライトパーカー", "100枚以上", "前と背中",
+             "前と背中 前2色 背中2色", "ネーム&背番号セット"]
+
+
+def run(messages):
+    session = estimate_flow.new_session()
+    for msg in messages:
+        result = estimate_flow.advance(session, msg)
+        session = result.session
+    assert result.reply == estimate_flow.COMPLETE
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, flow in (("前のみ", SINGLE_FLOW), ("前と背中", BOTH_FLOW)):
+        t = timeit.timeit(lambda: run(flow), number=args.number)
+        print(f"{name:6s}: {t / args.number * 1e6:7.2f} us/flow, "
+              f"{t / (args.number * len(flow)) * 1e6:6.2f} us/step")
+
+
+if __name__ == "__main__":
+    main()
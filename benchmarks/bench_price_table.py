@@ -0,0 +1,76 @@
+"""
+価格表のメモリ使用量・検索速度のベンチマーク
+
+    python benchmarks/bench_price_table.py [--scale N]
+
+--scale N で商品名を変えた複製を N 倍作り、商品・年度が増えた場合を想定する。
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PRICE_TABLE_2025 import PRICE_TABLE  # noqa: E402
+from price_index import PriceIndex  # noqa: E402
+
+
+def scaled_rows(scale):
+    rows = []
+    for n in range(scale):
+        for row in PRICE_TABLE:
+            r = dict(row)
+            # 実データと同様に行ごとに別の文字列オブジェクトを持たせる
+            r["item"] = "".join([row["item"], f"#{n}" if n else ""])
+            r["discount_type"] = "".join([row["discount_type"]])
+            rows.append(r)
+    return rows
+
+
+def measure(build):
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def linear_find(rows, item_name, discount_type, quantity):
+    for row in rows:
+        if (row["item"] == item_name
+                and row["discount_type"] == discount_type
+                and row["min_qty"] <= quantity <= row["max_qty"]):
+            return row
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    source = scaled_rows(args.scale)
+    dict_rows, dict_size = measure(lambda: scaled_rows(args.scale))
+    index, index_size = measure(lambda: PriceIndex(source))
+
+    print(f"rows: {len(dict_rows)}")
+    print(f"memory  dict list : {dict_size / 1024:8.1f} KiB")
+    print(f"memory  compact   : {index_size / 1024:8.1f} KiB (インデックス込み)")
+
+    # 最後の商品・最大枚数帯 = 線形探索の最悪ケース
+    last = source[-1]
+    key = (last["item"], last["discount_type"], last["min_qty"])
+    t_linear = timeit.timeit(lambda: linear_find(dict_rows, *key), number=args.number)
+    t_index = timeit.timeit(lambda: index.find(*key), number=args.number)
+    t_read = timeit.timeit(lambda: index.find(*key)["unit_price"], number=args.number)
+    per = 1e6 / args.number
+    print(f"lookup  linear    : {t_linear * per:8.2f} us")
+    print(f"lookup  index     : {t_index * per:8.2f} us")
+    print(f"lookup+read index : {t_read * per:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+列指向版 (vector_estimate) と1件ずつの計算 (web_order_estimate) のベンチマーク
+
+    python benchmarks/bench_vector_estimate.py [--rows 100000 1000000] [--seed N]
+
+ランダムなフォームを作り、次の時間を比べる。結果は全件一致することも確認する。
+- scalar : compute_web_order_estimate を1件ずつ (キャッシュなし)
+- vector : 列を作ってから estimate_columns (列の作成は encode として別に表示)
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import vector_estimate  # noqa: E402
+from PRICE_TABLE_2025 import COLOR_ATTR_MAP, SPECIAL_SINGLE_COLOR_FEE, FULLCOLOR_SIZE_FEE, BACK_NAME_FEE  # noqa: E402
+from product_catalog import PRODUCT_NAMES  # noqa: E402
+from web_order_estimate import compute_web_order_estimate  # noqa: E402
+
+COLORS = list(COLOR_ATTR_MAP) + list(BACK_NAME_FEE)
+EDGE_COLORS = list(SPECIAL_SINGLE_COLOR_FEE) + ["ホワイト", "ブラック", ""]
+
+
+def random_forms(rows, seed=0):
+    rnd = random.Random(seed)
+    forms = []
+    for _ in range(rows):
+        data = {
+            "productName": rnd.choice(PRODUCT_NAMES + ["未登録の商品"]),
+            "discountOption": rnd.choice(["早割", "いっしょ割", "リピータ割", ""]),
+            "totalQuantity": str(rnd.choice([0, 1, 9, 10, 19, 20, 35, 50, 99, 100, 250, 500, 1000, 5000])),
+        }
+        for p in range(1, 5):
+            if rnd.random() < 0.5:
+                continue
+            data[f"printPositionNo{p}"] = str(p)
+            for i in range(1, rnd.randint(0, 3) + 1):
+                data[f"printColorOption{p}_{i}"] = rnd.choice(COLORS)
+            if rnd.random() < 0.3:
+                data[f"fullColorSize{p}"] = rnd.choice(list(FULLCOLOR_SIZE_FEE) + ["特大"])
+            if rnd.random() < 0.3:
+                data[f"singleColor{p}"] = rnd.choice(EDGE_COLORS)
+            if rnd.random() < 0.3:
+                data[f"edgeType{p}"] = rnd.choice(["なし", "フチ付き", "カスタム"])
+                data[f"edgeCustomTextColor{p}"] = rnd.choice(EDGE_COLORS)
+                data[f"edgeCustomEdgeColor{p}"] = rnd.choice(EDGE_COLORS)
+                data[f"edgeCustomEdgeColor2_{p}"] = rnd.choice(EDGE_COLORS)
+        forms.append(data)
+    return forms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        forms = random_forms(rows, seed=args.seed)
+
+        start = time.perf_counter()
+        scalar = [compute_web_order_estimate(f) for f in forms]
+        t_scalar = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cols = vector_estimate.encode_forms(forms)
+        t_encode = time.perf_counter() - start
+        start = time.perf_counter()
+        result = vector_estimate.estimate_columns(cols)
+        t_vector = time.perf_counter() - start
+
+        assert vector_estimate.to_dicts(result) == scalar, "スカラー版と結果が一致しません"
+        print(f"{rows:>8} rows: scalar {t_scalar:6.3f}s / vector {t_vector:6.3f}s "
+              f"(x{t_scalar / t_vector:.0f}) / encode {t_encode:6.3f}s")
+
+
+if __name__ == "__main__":
+    main()
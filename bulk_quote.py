@@ -0,0 +1,252 @@
+"""
+Web オーダー見積りの一括計算
+
+営業が「この商品・枚数・色数ならいくら？」を大量に試すための一括見積り。
+JSONL (1行1件の dict) か CSV (1行目がフォームの項目名) を読み、
+calculate_web_order_estimate の結果をプロセスプールで計算して、終わった塊から順に返す。
+
+    python bulk_quote.py grid.csv -o quotes.jsonl
+    python bulk_quote.py grid.jsonl --format csv --workers 4 > quotes.csv
+
+各結果は {"index": 入力の行番号(0始まり), "input": 入力, "estimate": 内訳} か
+{"index": ..., "input": ..., "error": メッセージ}。
+"""
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+
+import price_index
+from web_order_estimate import calculate_web_order_estimate
+
+BULK_QUOTE_WORKERS = int(os.environ.get("BULK_QUOTE_WORKERS", "0")) or os.cpu_count() or 1
+BULK_QUOTE_CHUNK_SIZE = int(os.environ.get("BULK_QUOTE_CHUNK_SIZE", "500"))
+BULK_QUOTE_MAX_ROWS = int(os.environ.get("BULK_QUOTE_MAX_ROWS", "20000"))
+# これより少ない件数はプロセスに渡すより自プロセスで計算した方が速い
+BULK_QUOTE_INLINE_ROWS = int(os.environ.get("BULK_QUOTE_INLINE_ROWS", "2000"))
+
+ESTIMATE_FIELDS = (
+    "unit_price", "total_price", "base_unit", "pos_add_fee", "color_fee",
+    "back_name_fee", "option_ink_extra", "fullcolor_extra", "qty", "price_version",
+)
+
+
+class BulkQuoteError(ValueError):
+    """入力の形式が不正、または件数が上限を超えている"""
+
+
+# -----------------------
+# 入力の読み込み
+# -----------------------
+def detect_format(name):
+    """ファイル名 / Content-Type から jsonl か csv かを決める"""
+    name = (name or "").lower()
+    if name.endswith(".csv") or "csv" in name:
+        return "csv"
+    return "jsonl"
+
+
+def read_configs(lines, fmt="jsonl"):
+    """
+    テキスト行のイテレータから見積り条件 (dict) を順に返す。
+    CSV の空欄は未入力として扱う。
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(lines):
+            yield {k: v for k, v in row.items() if k and v not in (None, "")}
+        return
+    if fmt != "jsonl":
+        raise BulkQuoteError(f"未対応の形式です: {fmt}")
+    for n, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise BulkQuoteError(f"{n}行目: JSON として読めません ({e})") from None
+        if not isinstance(data, dict):
+            raise BulkQuoteError(f"{n}行目: オブジェクトではありません")
+        yield data
+
+
+# -----------------------
+# 計算
+# -----------------------
+def quote_one(index, config):
+    try:
+        return {"index": index, "input": config, "estimate": calculate_web_order_estimate(config)}
+    except (TypeError, ValueError) as e:
+        return {"index": index, "input": config, "error": f"見積りできません ({type(e).__name__}: {e})"}
+
+
+def _init_worker(rows, version):
+    # spawn / forkserver のワーカーはモジュールを読み直すので、親プロセスの現在の価格表に合わせる
+    if version != price_index.PRICE_INDEX.version:
+        price_index.reload_price_index(rows, version=version)
+
+
+def _quote_chunk(chunk):
+    # プロセスプールのワーカー側。同じ条件はワーカーごとの LRU キャッシュに乗る。
+    # 受け渡しの pickle を減らすため入力は返さず、親プロセスで付け直す
+    results = []
+    for index, config in chunk:
+        result = quote_one(index, config)
+        del result["input"]
+        results.append(result)
+    return results
+
+
+def _chunks(configs, size, max_rows):
+    chunk = []
+    for index, config in enumerate(configs):
+        if max_rows and index >= max_rows:
+            raise BulkQuoteError(f"一度に見積りできるのは {max_rows} 件までです")
+        chunk.append((index, config))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    一括見積り用のプロセスプールを返す (初回に作成、fork 後の子プロセスでは作り直す)。
+    スレッドの動いている Web ワーカーから fork するとロックを持ったままの状態が子にコピーされるので、
+    forkserver (無い環境では spawn) で起動し、作成時点の価格表を initializer で渡す。
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            index = price_index.PRICE_INDEX
+            rows = [dict(row) for row in index.table]
+            _pool = multiprocessing.get_context(method).Pool(
+                BULK_QUOTE_WORKERS, initializer=_init_worker, initargs=(rows, index.version)
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@price_index.on_price_reload
+def close_pool(index=None):
+    """
+    価格表の差し替え後は古い価格表を持つワーカーを捨てる (次回の呼び出しで作り直す)。
+    計算中の塊は終わるまで待ってからワーカーを終了させる。
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and _pool_pid == os.getpid():
+        pool.close()
+        pool.join()
+
+
+def quote_many(configs, ordered=False, max_rows=BULK_QUOTE_MAX_ROWS, chunk_size=BULK_QUOTE_CHUNK_SIZE,
+               inline_rows=BULK_QUOTE_INLINE_ROWS):
+    """
+    見積り条件のイテレータを一括計算し、結果を計算が終わった塊の順に返す。
+    ordered=True なら入力順に返す。
+    件数が inline_rows 以下なら自プロセスで計算する。
+    """
+    chunks = _chunks(configs, chunk_size, max_rows)
+
+    # 先頭から inline_rows 件までは読みながら溜め、それを超えたらプールに回す
+    head = []
+    for chunk in chunks:
+        head.append(chunk)
+        if sum(len(c) for c in head) > inline_rows:
+            break
+    else:
+        for chunk in head:
+            for index, config in chunk:
+                yield quote_one(index, config)
+        return
+
+    # 結果に付け直すため、計算中の塊の入力だけ持っておく
+    pending = {}
+
+    def all_chunks():
+        for chunk in itertools.chain(head, chunks):
+            pending[chunk[0][0]] = chunk
+            yield chunk
+
+    pool = get_pool()
+    imap = pool.imap if ordered else pool.imap_unordered
+    for results in imap(_quote_chunk, all_chunks()):
+        chunk = pending.pop(results[0]["index"])
+        for (_, config), result in zip(chunk, results):
+            yield {"index": result.pop("index"), "input": config, **result}
+
+
+# -----------------------
+# 出力
+# -----------------------
+def iter_jsonl(results):
+    for result in results:
+        yield json.dumps(result, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def iter_csv(results):
+    """
+    入力の項目と内訳を横に並べた CSV を返す。
+    入力の項目は先頭の結果で決まるので、CSV 入力 (全行同じ項目) での利用を想定する。
+    """
+    buf = io.StringIO()
+    writer = None
+    for result in results:
+        if writer is None:
+            input_fields = list(result["input"])
+            writer = csv.writer(buf)
+            writer.writerow(["index"] + input_fields + list(ESTIMATE_FIELDS) + ["error"])
+        estimate = result.get("estimate") or {}
+        writer.writerow(
+            [result["index"]]
+            + [result["input"].get(k, "") for k in input_fields]
+            + [estimate.get(k, "") for k in ESTIMATE_FIELDS]
+            + [result.get("error", "")]
+        )
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Web オーダー見積りを JSONL / CSV から一括計算する")
+    parser.add_argument("input", nargs="?", default="-", help="入力ファイル (省略時は標準入力)")
+    parser.add_argument("-o", "--output", default="-", help="出力先 (省略時は標準出力)")
+    parser.add_argument("--input-format", choices=["jsonl", "csv"], help="入力形式 (省略時は拡張子で判定)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="出力形式 (省略時は出力先の拡張子で判定)")
+    parser.add_argument("--workers", type=int, help="プロセス数")
+    parser.add_argument("--ordered", action="store_true", help="入力順に出力する")
+    parser.add_argument("--max-rows", type=int, default=0, help="件数の上限 (0 なら無制限)")
+    args = parser.parse_args()
+
+    if args.workers:
+        BULK_QUOTE_WORKERS = args.workers
+
+    in_fmt = args.input_format or detect_format(args.input)
+    out_fmt = args.format or detect_format(args.output)
+    fin = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8-sig")
+    fout = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        results = quote_many(read_configs(fin, in_fmt), ordered=args.ordered, max_rows=args.max_rows)
+        for text in (iter_csv if out_fmt == "csv" else iter_jsonl)(results):
+            fout.write(text)
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
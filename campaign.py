@@ -0,0 +1,348 @@
+"""
+キャンペーン告知の一斉送信 (multicast)
+
+カタログ発送・早割締切などのお知らせを、宛先リストに multicast でまとめて送る。
+
+- 宛先はファイル (1行1ID、または CSV の列)・スプレッドシートの列・注文ジャーナルから読む
+- 500 件ずつのバッチに分け、複数スレッドで送る (送信間隔はレートリミッターで制限)
+- バッチごとの送信結果を SQLite に記録するので、途中で止まっても同じキャンペーン名で再実行すれば続きから送る
+- バッチごとの retry key を付けるので、送信直後に落ちて再送しても LINE 側で重複が弾かれる
+- 終了時に件数・スループット・失敗率を表示する
+
+    python campaign.py early-bird-2026 --file user_ids.txt --text "早割の締切は今週末です！"
+    python campaign.py catalog-0601 --sheet 簡易見積 --column ユーザーID --flex-json message.json
+    python campaign.py reorder-0901 --journal WebOrderRequests --text "追加注文のご案内です"
+"""
+import csv
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from retry_policy import is_retryable_error
+
+# multicast 1回あたりの宛先の上限
+MULTICAST_LIMIT = 500
+
+USER_ID_PATTERN = re.compile(r"^U[0-9a-f]{32}$")
+
+
+# -----------------------
+# 宛先の読み込み
+# -----------------------
+def unique_user_ids(values):
+    """ユーザーIDの形式のものだけを、重複を除いて順に返す"""
+    seen = set()
+    for value in values:
+        value = (value or "").strip()
+        if USER_ID_PATTERN.match(value) and value not in seen:
+            seen.add(value)
+            yield value
+
+
+def read_recipients_file(path, column=None):
+    """1行1IDのテキスト、または column 列を持つ CSV から宛先を読む"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if column:
+            return list(unique_user_ids(row.get(column) for row in csv.DictReader(f)))
+        return list(unique_user_ids(f))
+
+
+def read_recipients_worksheet(ws, column):
+    """ワークシートの1行目が column の列から宛先を読む"""
+    headers = ws.row_values(1)
+    if column not in headers:
+        raise ValueError(f"ワークシート {ws.title} に列 {column} がありません")
+    return list(unique_user_ids(ws.col_values(headers.index(column) + 1)[1:]))
+
+
+def read_recipients_journal(journal, title=None):
+    """注文ジャーナルに記録のあるユーザーを宛先にする (スプレッドシートの API を使わない)"""
+    return list(unique_user_ids(journal.user_ids(title)))
+
+
+# -----------------------
+# レートリミッター
+# -----------------------
+class RateLimiter:
+    """1秒あたり rate 回まで (burst 回までは続けて可) に制限するトークンバケット"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# -----------------------
+# 送信
+# -----------------------
+class CampaignSender:
+    """
+    send_batch(user_ids, retry_key) でバッチを1つ送る関数を受け取り、キャンペーンを送り切る。
+    進み具合は path の SQLite に残る。
+    """
+
+    def __init__(self, path, campaign_id, send_batch, batch_size=MULTICAST_LIMIT, workers=4,
+                 rate=10.0, max_attempts=5, backoff_base=2.0, logger=None):
+        if not 1 <= batch_size <= MULTICAST_LIMIT:
+            raise ValueError(f"batch_size は 1〜{MULTICAST_LIMIT} で指定してください")
+        self.path = path
+        self.campaign_id = campaign_id
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.workers = workers
+        self.limiter = RateLimiter(rate, burst=workers)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.logger = logger
+        self._local = threading.local()
+        self._init_db()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS campaign_batches ("
+            " campaign_id TEXT NOT NULL,"
+            " batch_no INTEGER NOT NULL,"
+            " user_ids TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " sent_at REAL,"
+            " PRIMARY KEY (campaign_id, batch_no))"
+        )
+
+    def prepare(self, user_ids):
+        """
+        宛先をバッチに分けて記録する。既に記録済みのキャンペーンなら何もしない
+        (再開時は最初に記録したバッチをそのまま使う)。記録済みのバッチ数を返す。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM campaign_batches WHERE campaign_id = ?", (self.campaign_id,)
+            ).fetchone()[0]
+            if count == 0:
+                batches = [user_ids[i:i + self.batch_size] for i in range(0, len(user_ids), self.batch_size)]
+                conn.executemany(
+                    "INSERT INTO campaign_batches (campaign_id, batch_no, user_ids, size) VALUES (?, ?, ?, ?)",
+                    [(self.campaign_id, n, json.dumps(batch), len(batch)) for n, batch in enumerate(batches)]
+                )
+                count = len(batches)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def retry_key(self, batch_no):
+        # 同じキャンペーン・同じバッチなら再実行しても同じキー
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"campaign:{self.campaign_id}:{batch_no}"))
+
+    def _send(self, batch_no, user_ids, attempts):
+        while True:
+            self.limiter.acquire()
+            attempts += 1
+            try:
+                self.send_batch(user_ids, self.retry_key(batch_no))
+                status, error = "sent", None
+            except Exception as e:
+                # 409: 同じ retry key で受け付け済み (前回の実行で送れていた)
+                if getattr(e, "status_code", None) == 409:
+                    status, error = "sent", None
+                elif is_retryable_error(e) and attempts < self.max_attempts:
+                    delay = self.backoff_base * (2 ** (attempts - 1))
+                    if self.logger:
+                        self.logger.warning("バッチ %d を %.0f 秒後に再送します: %r", batch_no, delay, e)
+                    self._record(batch_no, "pending", attempts, repr(e))
+                    time.sleep(delay)
+                    continue
+                else:
+                    status, error = "failed", repr(e)
+                    if self.logger:
+                        self.logger.error("バッチ %d (%d 件) の送信に失敗しました: %r", batch_no, len(user_ids), e)
+            self._record(batch_no, status, attempts, error)
+            return status
+
+    def _record(self, batch_no, status, attempts, error):
+        self._conn().execute(
+            "UPDATE campaign_batches SET status = ?, attempts = ?, error = ?, sent_at = ?"
+            " WHERE campaign_id = ? AND batch_no = ?",
+            (status, attempts, error, time.time() if status == "sent" else None, self.campaign_id, batch_no)
+        )
+
+    def run(self, retry_failed=False, progress=None):
+        """
+        未送信のバッチを送り、report() を返す。
+        retry_failed=True なら前回失敗したバッチも送り直す。
+        progress(report) を渡すとバッチが終わるたびに呼ぶ。
+        """
+        statuses = ("pending", "failed") if retry_failed else ("pending",)
+        rows = self._conn().execute(
+            f"SELECT batch_no, user_ids, attempts FROM campaign_batches"
+            f" WHERE campaign_id = ? AND status IN ({','.join('?' * len(statuses))}) ORDER BY batch_no",
+            (self.campaign_id,) + statuses
+        ).fetchall()
+
+        start = time.monotonic()
+        done = {"batches": 0, "recipients": 0}
+        lock = threading.Lock()
+
+        def work(row):
+            batch_no, user_ids, attempts = row
+            user_ids = json.loads(user_ids)
+            self._send(batch_no, user_ids, 0 if retry_failed else attempts)
+            with lock:
+                done["batches"] += 1
+                done["recipients"] += len(user_ids)
+            if progress:
+                progress(self.report(elapsed=time.monotonic() - start, this_run=dict(done)))
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="campaign") as pool:
+            for _ in pool.map(work, rows):
+                pass
+        return self.report(elapsed=time.monotonic() - start, this_run=done)
+
+    def report(self, elapsed=None, this_run=None):
+        """バッチ・宛先の件数 (状態別)、失敗率、今回の実行のスループットを返す"""
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*), SUM(size) FROM campaign_batches WHERE campaign_id = ? GROUP BY status",
+            (self.campaign_id,)
+        ).fetchall()
+        batches = {status: n for status, n, _ in rows}
+        recipients = {status: size for status, _, size in rows}
+        total = sum(recipients.values())
+        finished = recipients.get("sent", 0) + recipients.get("failed", 0)
+        data = {
+            "campaign_id": self.campaign_id,
+            "batches": batches,
+            "recipients": recipients,
+            "total_recipients": total,
+            "failure_rate": recipients.get("failed", 0) / finished if finished else 0.0,
+        }
+        if elapsed is not None:
+            data["elapsed"] = round(elapsed, 3)
+            if this_run is not None:
+                data["this_run"] = this_run
+                data["recipients_per_sec"] = round(this_run["recipients"] / elapsed, 1) if elapsed else 0.0
+        return data
+
+
+def dry_run_report(campaign_id, user_ids, batch_size=MULTICAST_LIMIT):
+    """
+    送信せずにバッチ分けだけ行い report() を返す。
+    使い捨てのファイルで行うので、本番の送信状況に "sent" を残さない。
+    """
+    def not_sent(user_ids, retry_key):
+        raise RuntimeError("dry-run では送信しません")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sender = CampaignSender(os.path.join(tmp, "dry_run.sqlite3"), campaign_id, not_sent, batch_size=batch_size)
+        sender.prepare(user_ids)
+        report = sender.report()
+        sender._conn().close()
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+    import sys
+
+    parser = argparse.ArgumentParser(description="キャンペーン告知を multicast で一斉送信する")
+    parser.add_argument("campaign_id", help="キャンペーン名 (再開時も同じ名前を指定)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--file", help="宛先ファイル (1行1ID、--column 指定時は CSV)")
+    source.add_argument("--sheet", help="宛先を読むワークシート名")
+    source.add_argument("--journal", nargs="?", const="", metavar="TITLE",
+                        help="注文ジャーナルから宛先を読む (TITLE でワークシートを絞り込み)")
+    parser.add_argument("--column", help="ユーザーIDの列名 (--sheet では必須)")
+    message = parser.add_mutually_exclusive_group(required=True)
+    message.add_argument("--text", help="送るテキスト")
+    message.add_argument("--flex-json", help="Flex Message の JSON ファイル ({\"altText\": ..., \"contents\": ...})")
+    parser.add_argument("--state", default=os.environ.get("CAMPAIGN_STATE_PATH", "campaigns.sqlite3"),
+                        help="送信状況を記録する SQLite ファイル")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=10.0, help="1秒あたりの multicast 回数の上限")
+    parser.add_argument("--retry-failed", action="store_true", help="前回失敗したバッチも送り直す")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="バッチ分けだけ表示して終わる (送信状況のファイルには記録しない)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logger = logging.getLogger("campaign")
+
+    # line_bot_api・スプレッドシート接続は Bot 本体と同じものを使う
+    from linebot.models import FlexSendMessage, TextSendMessage
+    from graffitees_LINE_BOT import line_bot_api, order_journal, with_spreadsheet
+
+    if args.text:
+        messages = [TextSendMessage(text=args.text)]
+    else:
+        with open(args.flex_json, encoding="utf-8") as f:
+            flex = json.load(f)
+        messages = [FlexSendMessage(alt_text=flex["altText"], contents=flex["contents"])]
+
+    def send_batch(user_ids, retry_key):
+        line_bot_api.multicast(user_ids, messages, retry_key=retry_key)
+
+    recipients = []
+    if args.file:
+        recipients = read_recipients_file(args.file, args.column)
+    elif args.sheet:
+        if not args.column:
+            parser.error("--sheet には --column が必要です")
+        recipients = with_spreadsheet(lambda sh: read_recipients_worksheet(sh.worksheet(args.sheet), args.column))
+    elif args.journal is not None:
+        recipients = read_recipients_journal(order_journal, args.journal or None)
+
+    if args.dry_run:
+        report = dry_run_report(args.campaign_id, recipients)
+        if report["total_recipients"] == 0:
+            parser.error("宛先がありません (--file / --sheet / --journal を指定してください)")
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    sender = CampaignSender(args.state, args.campaign_id, send_batch,
+                            workers=args.workers, rate=args.rate, logger=logger)
+    if sender.prepare(recipients) == 0:
+        parser.error("宛先がありません (--file / --sheet / --journal を指定してください)")
+
+    def progress(report):
+        run = report["this_run"]
+        if run["batches"] % 10 == 0:
+            logger.info("%d バッチ / %d 件送信 (%.1f 件/秒)", run["batches"], run["recipients"],
+                        report["recipients_per_sec"])
+
+    report = sender.run(retry_failed=args.retry_failed, progress=progress)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
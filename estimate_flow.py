@@ -0,0 +1,129 @@
+"""
+カンタン見積りの入力フロー (状態遷移表)
+
+各ステップの有効な回答 (frozenset)・回答の保存先・次のステップと返信を STEPS にまとめ、
+advance() はステップを dict で1回引くだけで遷移する。
+LINE SDK には依存しないので、単体で読み込み・ベンチマークできる。
+返信は名前 (flex_* 関数名) か INVALID / FATAL / COMPLETE で返し、送信は呼び出し側が行う。
+"""
+from typing import Callable, NamedTuple, Optional
+
+from quick_estimate import (
+    ESTIMATE_ITEMS, QUANTITY_MAP, PRINT_POSITIONS, SINGLE_POSITIONS,
+    COLOR_COST_MAP_SINGLE, COLOR_COST_MAP_BOTH, BACK_NAMES, NO_BACK_NAME,
+)
+
+USER_TYPES = ["学生", "一般"]
+USAGE_DATES = ["14日目以降", "14日目以内"]
+BUDGETS = ["特になし", "1,000円以内", "1,500円以内", "2,000円以内", "2,500円以内", "3,000円以内", "3,500円以内"]
+
+# advance() の返信種別 (プロンプト名以外)
+INVALID = "invalid"    # 選択肢以外の入力 → セッション終了
+FATAL = "fatal"        # 想定外のステップ → セッション終了
+COMPLETE = "complete"  # 全項目入力済み → 見積り結果を返す
+
+INVALID_INPUT_TEXT = (
+    "入力内容に誤りがあるようです。 \n"
+    "お手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n"
+    "※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。"
+)
+FATAL_ERROR_TEXT = "エラーが発生しました。見積りフローを終了しました。最初からやり直してください。"
+
+
+class Step(NamedTuple):
+    answer_key: str
+    choices: frozenset
+    # 回答から (次のステップ番号 or None=完了, 返信) を返す
+    next: Callable[[str], tuple]
+    # 回答に付随して保存する値 (割引区分など)
+    extra: Optional[Callable[[str], dict]] = None
+
+
+class Transition(NamedTuple):
+    session: Optional[dict]  # None ならセッションを削除する
+    reply: str               # プロンプト名 / INVALID / FATAL / COMPLETE
+    answers: Optional[dict] = None
+
+
+def _goto(step, reply):
+    return lambda answer: (step, reply)
+
+
+def _after_print_position(answer):
+    # 前のみ/背中のみ と 前と背中 で色数の選択肢が分かれる
+    if answer in SINGLE_POSITIONS:
+        return 7, "flex_color_count_single"
+    return 7, "flex_color_count_both"
+
+
+def build_steps():
+    """
+    状態遷移表を作る。キーはステップ番号、ステップ7のみ (7, is_single)。
+    """
+    return {
+        1: Step("user_type", frozenset(USER_TYPES), _goto(2, "flex_usage_date")),
+        2: Step("usage_date", frozenset(USAGE_DATES), _goto(3, "flex_budget"),
+                extra=lambda a: {"discount_type": "早割" if a == "14日目以降" else "通常"}),
+        3: Step("budget", frozenset(BUDGETS), _goto(4, "flex_item_select")),
+        4: Step("item", frozenset(ESTIMATE_ITEMS), _goto(5, "flex_quantity")),
+        5: Step("quantity", frozenset(QUANTITY_MAP), _goto(6, "flex_print_position")),
+        6: Step("print_position", frozenset(PRINT_POSITIONS), _after_print_position),
+        (7, True): Step("color_count", frozenset(COLOR_COST_MAP_SINGLE), _goto(None, COMPLETE),
+                        extra=lambda a: {"back_name": NO_BACK_NAME}),
+        (7, False): Step("color_count", frozenset(COLOR_COST_MAP_BOTH), _goto(8, "flex_back_name")),
+        8: Step("back_name", frozenset(BACK_NAMES), _goto(None, COMPLETE)),
+    }
+
+
+STEPS = build_steps()
+
+
+def new_session():
+    return {"step": 1, "answers": {}, "is_single": False}
+
+
+def advance(session_data, user_message):
+    """
+    現在のセッションとユーザー入力から次の状態を返す (session_data は書き換えない)
+    """
+    step = session_data["step"]
+    key = (step, bool(session_data.get("is_single"))) if step == 7 else step
+    spec = STEPS.get(key)
+    if spec is None:
+        return Transition(None, FATAL)
+    if user_message not in spec.choices:
+        return Transition(None, INVALID)
+
+    answers = dict(session_data["answers"])
+    answers[spec.answer_key] = user_message
+    if spec.extra is not None:
+        answers.update(spec.extra(user_message))
+
+    next_step, reply = spec.next(user_message)
+    if next_step is None:
+        return Transition(None, reply, answers)
+
+    session = {
+        "step": next_step,
+        "answers": answers,
+        "is_single": user_message in SINGLE_POSITIONS if step == 6 else session_data.get("is_single", False),
+    }
+    return Transition(session, reply, answers)
+
+
+def estimate_result_text(quote_number, est_data, total_price, unit_price):
+    """見積り完了時の返信テキスト"""
+    return (
+        f"概算のお見積りが完了しました。\n\n"
+        f"見積番号: {quote_number}\n"
+        f"属性: {est_data['user_type']}\n"
+        f"使用日: {est_data['usage_date']}（{est_data['discount_type']}）\n"
+        f"予算: {est_data['budget']}\n"
+        f"商品: {est_data['item']}\n"
+        f"枚数: {est_data['quantity']}\n"
+        f"プリント位置: {est_data['print_position']}\n"
+        f"色数: {est_data['color_count']}\n"
+        f"背ネーム・番号: {est_data['back_name']}\n\n"
+        f"【合計金額】¥{total_price:,}\n"
+        f"【1枚あたり】¥{unit_price:,}\n"
+    )
@@ -1,13 +1,22 @@
 ﻿import os
+import csv
+import hashlib
 import json
 import time
+import threading
+import functools
+import atexit
 from datetime import datetime
 import pytz
 
 import gspread
-from flask import Flask, render_template, render_template_string, request, session, abort
+from flask import Flask, Response, render_template, request, session, abort, jsonify, url_for
 import uuid
 from oauth2client.service_account import ServiceAccountCredentials
+from google.auth.exceptions import RefreshError
+
+from order_journal import OrderJournal, JournalFull
+from line_http import pooled_http_client_factory, line_api_stats
 
 # 追加 -----------------------------------
 import requests
@@ -15,7 +24,7 @@ import requests
 
 # line-bot-sdk v2 系
 from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
+from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage, FlexSendMessage, PostbackEvent
 )
@@ -31,59 +40,162 @@ LINE_CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN", "")
 SERVICE_ACCOUNT_FILE = os.environ.get("GCP_SERVICE_ACCOUNT_JSON", "")
 SPREADSHEET_KEY = os.environ.get("SPREADSHEET_KEY", "")
 
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+# LINE API の接続はプールして使い回す (イベント処理ワーカー + 後処理スレッド分)
+LINE_API_POOL_SIZE = int(os.environ.get(
+    "LINE_API_POOL_SIZE", str(int(os.environ.get("LINE_EVENT_WORKERS", "4")) + 4)))
+LINE_API_TIMEOUT = (
+    float(os.environ.get("LINE_API_CONNECT_TIMEOUT", "3.05")),
+    float(os.environ.get("LINE_API_READ_TIMEOUT", "10")),
+)
+
+line_bot_api = LineBotApi(
+    LINE_CHANNEL_ACCESS_TOKEN,
+    timeout=LINE_API_TIMEOUT,
+    http_client=pooled_http_client_factory(
+        pool_size=LINE_API_POOL_SIZE,
+        retries=int(os.environ.get("LINE_API_RETRIES", "2")),
+    ),
+)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
 
 # -----------------------
 # Google Sheets 接続
 # -----------------------
-def get_gspread_client():
+GSPREAD_SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+# アクセストークンの有効期限(60分)より前にクライアントを作り直す秒数
+GSPREAD_CLIENT_TTL = int(os.environ.get("GSPREAD_CLIENT_TTL", "3000"))
+
+# プロセス内で共有する gspread クライアント / Spreadsheet ハンドル
+_gspread_lock = threading.RLock()
+_gspread_cache = {"client": None, "spreadsheet": None, "built_at": 0.0}
+_gspread_stats = {"hits": 0, "misses": 0, "rebuilds": 0, "auth_errors": 0}
+
+
+def _build_gspread_client():
     """
     環境変数 SERVICE_ACCOUNT_FILE (JSONパス or JSON文字列) から認証情報を取り出し、
-    gspread クライアントを返す
+    新しい gspread クライアントを作成する
     """
     if not SERVICE_ACCOUNT_FILE:
         raise ValueError("環境変数 GCP_SERVICE_ACCOUNT_JSON が設定されていません。")
 
     service_account_dict = json.loads(SERVICE_ACCOUNT_FILE)
-
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    credentials = ServiceAccountCredentials.from_json_keyfile_dict(service_account_dict, scope)
+    credentials = ServiceAccountCredentials.from_json_keyfile_dict(service_account_dict, GSPREAD_SCOPE)
     return gspread.authorize(credentials)
 
 
-def get_or_create_worksheet(sheet, title):
+def _gspread_cache_expired():
+    return time.monotonic() - _gspread_cache["built_at"] >= GSPREAD_CLIENT_TTL
+
+
+def get_gspread_client():
     """
-    スプレッドシート内で該当titleのワークシートを取得。
-    なければ新規作成し、ヘッダを書き込む。
+    プロセス内で共有する gspread クライアントを返す。
+    トークン期限切れ前 (GSPREAD_CLIENT_TTL 経過) に自動で作り直す。
+    """
+    with _gspread_lock:
+        client = _gspread_cache["client"]
+        if client is not None and not _gspread_cache_expired():
+            _gspread_stats["hits"] += 1
+            return client
+
+        _gspread_stats["misses"] += 1
+        if client is not None:
+            _gspread_stats["rebuilds"] += 1
+        client = _build_gspread_client()
+        _gspread_cache.update(client=client, spreadsheet=None, built_at=time.monotonic())
+        invalidate_worksheet()
+        return client
+
+
+def get_spreadsheet():
+    """
+    SPREADSHEET_KEY の Spreadsheet ハンドルを返す (open_by_key はクライアント生成時に1回だけ)
+    """
+    with _gspread_lock:
+        client = get_gspread_client()
+        sh = _gspread_cache["spreadsheet"]
+        if sh is None:
+            sh = client.open_by_key(SPREADSHEET_KEY)
+            _gspread_cache["spreadsheet"] = sh
+        return sh
+
+
+def invalidate_gspread_client():
+    """認証エラー時などにキャッシュを破棄し、次回アクセスで作り直させる"""
+    with _gspread_lock:
+        _gspread_cache.update(client=None, spreadsheet=None, built_at=0.0)
+    invalidate_worksheet()
+
+
+def gspread_cache_stats():
+    """クライアントキャッシュのヒット/ミス数を返す"""
+    with _gspread_lock:
+        return dict(_gspread_stats)
+
+
+def _api_error_status(exc):
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _is_auth_error(exc):
+    if isinstance(exc, RefreshError):
+        return True
+    return isinstance(exc, gspread.exceptions.APIError) and _api_error_status(exc) == 401
+
+
+def with_spreadsheet(func):
+    """
+    共有 Spreadsheet を渡して func(sh) を実行する。
+    認証エラーの場合はクライアントを作り直して1度だけ再実行する。
     """
     try:
-        ws = sheet.worksheet(title)
-    except gspread.exceptions.WorksheetNotFound:
-        ws = sheet.add_worksheet(title=title, rows=2000, cols=50)
-        # 必要であればヘッダをセット
-        if title == "CatalogRequests":
-            ws.update('A1:I1', [[
-                "日時",  # ←先頭に日時列
-                "氏名", "郵便番号", "住所", "電話番号",
-                "メールアドレス", "Insta/TikTok名",
-                "在籍予定の学校名と学年", "その他(質問・要望)"
-            ]])
-        elif title == "簡易見積":
-            # 属性カラムを追加したため、A1:M1 で13列に拡張
-            ws.update('A1:M1', [[
-                "日時", "見積番号", "ユーザーID", "属性",
-                "使用日(割引区分)", "予算", "商品名", "枚数",
-                "プリント位置", "色数", "背ネーム",
-                "合計金額", "単価"
-            ]])
-        elif title == "WebOrderRequests":
-            headers = [
+        return func(get_spreadsheet())
+    except (gspread.exceptions.APIError, RefreshError) as e:
+        if not _is_auth_error(e):
+            raise
+        with _gspread_lock:
+            _gspread_stats["auth_errors"] += 1
+        invalidate_gspread_client()
+        return func(get_spreadsheet())
+
+
+# -----------------------
+# ワークシートのヘッダー定義
+# -----------------------
+CATALOG_HEADERS = [
+    "日時",  # ←先頭に日時列
+    "氏名", "郵便番号", "住所", "電話番号",
+    "メールアドレス", "Insta/TikTok名",
+    "在籍予定の学校名と学年", "その他(質問・要望)"
+]
+
+# 属性カラムを追加したため13列
+ESTIMATE_HEADERS = [
+    "日時", "見積番号", "ユーザーID", "属性",
+    "使用日(割引区分)", "予算", "商品名", "枚数",
+    "プリント位置", "色数", "背ネーム",
+    "合計金額", "単価", "価格表"
+]
+
+# 分析用エクスポート (sheet_export.py) での列名。ESTIMATE_HEADERS と同じ順序
+ESTIMATE_COLUMN_KEYS = [
+    "timestamp", "quote_number", "user_id", "user_type",
+    "usage_date", "budget", "item", "quantity",
+    "print_position", "color_count", "back_name",
+    "total_price", "unit_price", "price_version"
+]
+
+if len(ESTIMATE_COLUMN_KEYS) != len(ESTIMATE_HEADERS):
+    raise ValueError("ESTIMATE_COLUMN_KEYS と ESTIMATE_HEADERS の列数が一致しません。")
+
+WEB_ORDER_HEADERS = [
     # 基本情報 --------------------------------------------------------
     "日時",
     "商品名", "品番", "カラー番号", "商品カラー",
@@ -132,17 +244,111 @@ def get_or_create_worksheet(sheet, title):
     "郵便番号", "住所1", "住所2", "お届け先宛名", "学校TEL",
     "代表者", "代表者TEL", "代表者メール",
     "デザイン確認方法", "お支払い方法",
-    "注文番号", "単価", "合計金額"
+    "注文番号", "単価", "合計金額", "価格表"
 ]
-            # ❶ 必要な列数を確保（あとで行追加時に不足すると困るため）
-            ws.resize(rows=2000, cols=len(headers))
-            # ❷ A1 だけを指定してヘッダーを書き込む
+
+WORKSHEET_HEADERS = {
+    "CatalogRequests": CATALOG_HEADERS,
+    "簡易見積": ESTIMATE_HEADERS,
+    "WebOrderRequests": WEB_ORDER_HEADERS,
+}
+
+# プロセス内で解決済みのワークシート { title: Worksheet }
+_worksheet_lock = threading.Lock()
+_worksheet_cache = {}
+
+
+def _resolve_worksheet(sheet, title):
+    """
+    スプレッドシート内で該当titleのワークシートを取得。
+    なければ新規作成し、ヘッダを書き込む。
+    既存シートはヘッダー行を1度だけ確認し、空なら書き込む。
+    """
+    headers = WORKSHEET_HEADERS.get(title)
+    try:
+        ws = sheet.worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        # 必要な列数を確保してから A1 にヘッダーを1回だけ書き込む
+        cols = max(50, len(headers)) if headers else 50
+        ws = sheet.add_worksheet(title=title, rows=2000, cols=cols)
+        if headers:
+            ws.update('A1', [headers])
+        return ws
+
+    if headers:
+        current = ws.row_values(1)
+        if not current:
+            ws.update('A1', [headers])
+        elif len(current) < len(headers) and headers[:len(current)] == current:
+            # 末尾に列が追加された場合はヘッダー行を延ばす
             ws.update('A1', [headers])
-            ws.update('A1', [headers])          # ← 'A1:AZ1' を 'A1' に変更
-            ws.resize(rows=2000, cols=len(headers))   # 念のため列も合わせておく
-            # 新たに Webフォーム注文のヘッダーをセット（必要に応じて列を追加/変更）
+        elif current[:len(headers)] != headers:
+            app.logger.warning("ワークシート %s のヘッダーが定義と一致しません", title)
     return ws
 
+
+def get_or_create_worksheet(sheet, title):
+    """
+    title のワークシートを返す。
+    1プロセスにつき1度だけ解決し、以降はキャッシュしたハンドルを使う。
+    """
+    with _worksheet_lock:
+        ws = _worksheet_cache.get(title)
+        if ws is None:
+            ws = _resolve_worksheet(sheet, title)
+            _worksheet_cache[title] = ws
+        return ws
+
+
+def invalidate_worksheet(title=None):
+    """シート削除/リネーム時などにキャッシュを破棄する (title=None で全件)"""
+    with _worksheet_lock:
+        if title is None:
+            _worksheet_cache.clear()
+        else:
+            _worksheet_cache.pop(title, None)
+
+
+def append_rows_to_worksheet(title, rows):
+    """
+    title のワークシートに複数行をまとめて追記する (API 呼び出し1回)。
+    範囲エラー(400: シートが削除/リネームされた)の場合は取り直して1度だけ再試行する。
+    """
+    def _append(sh):
+        ws = get_or_create_worksheet(sh, title)
+        try:
+            ws.append_rows(rows, value_input_option="USER_ENTERED")
+        except gspread.exceptions.APIError as e:
+            if _api_error_status(e) != 400:
+                raise
+            invalidate_worksheet(title)
+            ws = get_or_create_worksheet(sh, title)
+            ws.append_rows(rows, value_input_option="USER_ENTERED")
+
+    with_spreadsheet(_append)
+
+
+# -----------------------
+# 注文ジャーナル (正本はローカルの SQLite、スプレッドシートへはバックグラウンドでまとめて複製)
+# -----------------------
+ORDER_JOURNAL_PATH = os.environ.get("ORDER_JOURNAL_PATH", "order_journal.sqlite3")
+# 以前の書き込みキューのファイル (未送信の行が残っていれば migrate_legacy_stores でジャーナルへ移す)
+SHEET_QUEUE_PATH = os.environ.get("SHEET_QUEUE_PATH", "sheet_write_queue.sqlite3")
+
+order_journal = OrderJournal(
+    ORDER_JOURNAL_PATH,
+    append_rows_to_worksheet,
+    batch_size=int(os.environ.get("SHEET_QUEUE_BATCH_SIZE", "200")),
+    flush_interval=float(os.environ.get("SHEET_QUEUE_FLUSH_INTERVAL", "2.0")),
+    # 未複製の行がこの数に達したら、空きを待っても空かない書き込みは 503 で断る
+    max_backlog=int(os.environ.get("SHEET_QUEUE_MAX_PENDING", "5000")),
+    full_timeout=float(os.environ.get("SHEET_QUEUE_FULL_TIMEOUT", "5")),
+    logger=app.logger,
+)
+atexit.register(order_journal.stop)
+
+BUSY_TEXT = "ただいま混み合っております。お手数ですが、少し時間をおいてから再度お試しください。"
+
 # ヘッダーと同じ順序でキーを定義 （フォーム上の name と合わせる）
 WEB_ORDER_COLUMN_KEYS = [
     # 基本情報
@@ -194,9 +400,12 @@ WEB_ORDER_COLUMN_KEYS = [
     "representativeName", "representativeTel", "representativeEmail",
     "designCheckMethod", "paymentMethod",
 
-    "orderNo", "unitPrice", "totalPrice"
+    "orderNo", "unitPrice", "totalPrice", "priceVersion"
 ]
 
+if len(WEB_ORDER_COLUMN_KEYS) != len(WEB_ORDER_HEADERS):
+    raise ValueError("WEB_ORDER_COLUMN_KEYS と WEB_ORDER_HEADERS の列数が一致しません。")
+
 def build_web_order_row_values(data: dict) -> list:
     """
     WebOrderRequests のヘッダー順に沿って、必ず同じ数・同じ順序で配列を返す。
@@ -209,10 +418,6 @@ def build_web_order_row_values(data: dict) -> list:
 
 
 def write_to_spreadsheet_for_catalog(form_data: dict):
-    gc = get_gspread_client()
-    sh = gc.open_by_key(SPREADSHEET_KEY)
-    worksheet = get_or_create_worksheet(sh, "CatalogRequests")
-
     # 日本時間の現在時刻
     jst = pytz.timezone('Asia/Tokyo')
     now_jst_str = datetime.now(jst).strftime("%Y/%m/%d %H:%M:%S")
@@ -231,44 +436,57 @@ def write_to_spreadsheet_for_catalog(form_data: dict):
         form_data.get("school_grade", ""),
         form_data.get("other", ""),
     ]
-    worksheet.append_row(new_row, value_input_option="USER_ENTERED")
+    # ジャーナルに記録 (スプレッドシートへはバックグラウンドで複製)
+    order_journal.append("CatalogRequests", new_row, data=form_data)
 
 
 # -----------------------
 # 簡易見積用データ構造
 # -----------------------
 from PRICE_TABLE_2025 import PRICE_TABLE, COLOR_COST_MAP,COLOR_ATTR_MAP,SPECIAL_SINGLE_COLOR_FEE,FULLCOLOR_SIZE_FEE, BACK_NAME_FEE, OPTION_INK_EXTRA
+import price_index
+from price_index import find_price_row
+from price_loader import PriceSheetRefresher, PriceTableWatcher
+from quick_estimate import (
+    ESTIMATE_ITEMS, QUANTITY_MAP, PRINT_POSITIONS, COLOR_COST_MAP_SINGLE, COLOR_COST_MAP_BOTH,
+    BACK_NAMES, quote_estimate
+)
+import estimate_flow
+from web_order_estimate import calculate_web_order_estimate, estimate_cache_info
+from session_store import create_session_store
+from order_ids import new_order_no, new_quote_number
+from order_log import OrderLog
+from ordered_pool import OrderedWorkerPool
+from product_catalog import CATALOG_ASSET
+import bulk_quote
 from collections import defaultdict
 
-# ▼▼▼ 新規: プリント位置が「前のみ/背中のみ」のときの色数選択肢および対応コスト
-COLOR_COST_MAP_SINGLE = {
-    "前 or 背中 1色": (0, 0),
-    "前 or 背中 2色": (1, 0),
-    "前 or 背中 フルカラー": (0, 1),
-}
-
-# ▼▼▼ 新規: プリント位置が「前と背中」のときの色数選択肢および対応コスト
-COLOR_COST_MAP_BOTH = {
-    "前と背中 前1色 背中1色": (0, 0),
-    "前と背中 前2色 背中1色": (1, 0),
-    "前と背中 前1色 背中2色": (1, 0),
-    "前と背中 前2色 背中2色": (2, 0),
-    "前と背中 フルカラー": (0, 2),
-}
-
 # ユーザの見積フロー管理用（簡易的セッション）
-user_estimate_sessions = {}  # { user_id: {"step": n, "answers": {...}, "is_single": bool} }
+# { user_id: {"step": n, "answers": {...}, "is_single": bool} }
+# 次のメッセージが別のワーカーに届いても続きから進められるよう、既定で全ワーカー共有の SQLite に置く
+# (ワーカー1つで動かす場合は ESTIMATE_SESSION_BACKEND=memory でもよい。session_store.py 参照)
+user_estimate_sessions = create_session_store(backend="sqlite", logger=app.logger)
+
+# 処理済みリクエストの冪等キー (Webオーダーの form_token / LINE の webhookEventId)
+# 二重送信・再送で行の追加や push を繰り返さないために使う。
+# 再送が別のワーカーに届いても弾けるよう、既定で全ワーカー共有の SQLite に置く
+submitted_requests = create_session_store("SUBMITTED_REQUEST", table="submitted_requests", ttl=86400,
+                                          backend="sqlite", logger=app.logger)
 
 
-def write_estimate_to_spreadsheet(user_id, estimate_data, total_price, unit_price):
+def claim_request(key, data):
     """
-    計算が終わった見積情報をスプレッドシートの「簡易見積」に書き込む
+    key を処理済みとして登録する。初回なら data、既に登録済みなら登録時の値を返す。
     """
-    gc = get_gspread_client()
-    sh = gc.open_by_key(SPREADSHEET_KEY)
-    worksheet = get_or_create_worksheet(sh, "簡易見積")
+    return submitted_requests.setdefault(key, data)
 
-    quote_number = str(int(time.time()))  # 見積番号を UNIX時間 で仮生成
+
+def write_estimate_to_spreadsheet(user_id, estimate_data, total_price, unit_price, price_version=""):
+    """
+    計算が終わった見積情報をジャーナルに記録する (スプレッドシートの「簡易見積」へはバックグラウンドで複製)
+    price_version は計算に使った価格表の版
+    """
+    quote_number = new_quote_number()
 
     # 日本時間の現在時刻
     jst = pytz.timezone('Asia/Tokyo')
@@ -287,84 +505,61 @@ def write_estimate_to_spreadsheet(user_id, estimate_data, total_price, unit_pric
         estimate_data['color_count'],
         estimate_data['back_name'],
         f"¥{total_price:,}",
-        f"¥{unit_price:,}"
+        f"¥{unit_price:,}",
+        price_version
     ]
-    worksheet.append_row(new_row, value_input_option="USER_ENTERED")
+    order_journal.append(
+        "簡易見積", new_row, record_no=quote_number, user_id=user_id,
+        data={"answers": estimate_data, "total_price": total_price, "unit_price": unit_price,
+              "price_version": price_version},
+    )
 
     return quote_number
 
 
-def find_price_row(item_name, discount_type, quantity):
-    """
-    PRICE_TABLE から該当する行を探し返す。該当しない場合は None
-    """
-    for row in PRICE_TABLE:
-        if (row["item"] == item_name
-            and row["discount_type"] == discount_type
-            and row["min_qty"] <= quantity <= row["max_qty"]):
-            return row
-    return None
-
-
-def calculate_estimate(estimate_data):
+# -----------------------
+# ここからFlex Message定義
+# -----------------------
+class PrebuiltMessage:
     """
-    入力された見積データから合計金額と単価を計算して返す
+    組み立て済みの送信メッセージ。
+    as_json_dict は初回に作った dict をそのまま返す
+    (line_bot_api の reply_message / push_message にそのまま渡せる)。
     """
-    item_name = estimate_data['item']
-    discount_type = estimate_data['discount_type']
-    # 枚数選択肢を実数化
-    quantity_map = {
-        "20～29枚": 20,
-        "30～39枚": 30,
-        "40～49枚": 40,
-        "50～99枚": 50,
-        "100枚以上": 100
-    }
-    quantity = quantity_map.get(estimate_data['quantity'], 1)
 
-    print_position = estimate_data['print_position']
-    color_choice = estimate_data['color_count']
-    back_name = estimate_data.get('back_name', "")
+    __slots__ = ("message", "json_dict")
 
-    row = find_price_row(item_name, discount_type, quantity)
-    if row is None:
-        return 0, 0  # 該当無し
+    def __init__(self, message):
+        self.message = message
+        self.json_dict = message.as_json_dict()
 
-    base_price = row["unit_price"]
+    def as_json_dict(self):
+        return self.json_dict
 
-    # プリント位置追加
-    if print_position in ["前のみ", "背中のみ"]:
-        pos_add = 0
-    else:
-        pos_add = row["pos_add"]
+    def __getattr__(self, name):
+        return getattr(self.message, name)
 
-    if print_position in ["前のみ", "背中のみ"]:
-        color_add_count, fullcolor_add_count = COLOR_COST_MAP_SINGLE[color_choice]
-        # 背ネームはスキップ扱い => 0円
-        back_name_fee = 0
-    else:
-        color_add_count, fullcolor_add_count = COLOR_COST_MAP_BOTH[color_choice]
-        # 背ネームありの場合
-        if back_name == "ネーム&背番号セット":
-            back_name_fee = row["set_name_num"]
-        elif back_name == "ネーム(大)":
-            back_name_fee = row["big_name"]
-        elif back_name == "番号(大)":
-            back_name_fee = row["big_num"]
-        else:
-            back_name_fee = 0
 
-    color_fee = color_add_count * row["color_add"] + fullcolor_add_count * row["fullcolor_add"]
+def prebuilt_flex(builder):
+    """
+    内容が固定の flex_* 関数用デコレータ。
+    初回呼び出しで組み立てて PrebuiltMessage に固め、以降は同じオブジェクトを返す。
+    """
+    lock = threading.Lock()
+    cache = []
 
-    unit_price = base_price + pos_add + color_fee + back_name_fee
-    total_price = unit_price * quantity
+    @functools.wraps(builder)
+    def wrapper():
+        if not cache:
+            with lock:
+                if not cache:
+                    cache.append(PrebuiltMessage(builder()))
+        return cache[0]
 
-    return total_price, unit_price
+    return wrapper
 
 
-# -----------------------
-# ここからFlex Message定義
-# -----------------------
+@prebuilt_flex
 def flex_user_type():
     flex_body = {
         "type": "bubble",
@@ -421,6 +616,7 @@ def flex_user_type():
     return FlexSendMessage(alt_text="属性を選択してください", contents=flex_body)
 
 
+@prebuilt_flex
 def flex_usage_date():
     flex_body = {
         "type": "bubble",
@@ -477,10 +673,10 @@ def flex_usage_date():
     return FlexSendMessage(alt_text="使用日を選択してください", contents=flex_body)
 
 
+@prebuilt_flex
 def flex_budget():
-    budgets = ["特になし", "1,000円以内", "1,500円以内", "2,000円以内", "2,500円以内", "3,000円以内", "3,500円以内"]
     buttons = []
-    for b in budgets:
+    for b in estimate_flow.BUDGETS:
         buttons.append({
             "type": "button",
             "style": "primary",
@@ -525,21 +721,9 @@ def flex_budget():
     return FlexSendMessage(alt_text="予算を選択してください", contents=flex_body)
 
 
+@prebuilt_flex
 def flex_item_select():
-    items = [
-        "ゲームシャツ",
-        "ストライプドライベースボールシャツ",
-        "ドライベースボールシャツ",
-        "ストライプユニフォーム",
-        "バスケシャツ",
-        "ドライTシャツ",
-        "ハイクオリティTシャツ",
-        "ドライポロシャツ",
-        "ドライロングスリーブTシャツ",
-        "クルーネックライトトレーナー",
-        "ジップアップライトパーカー",
-        "フーデッドライトパーカー",
-    ]
+    items = ESTIMATE_ITEMS
 
     item_bubbles = []
     chunk_size = 5
@@ -595,10 +779,10 @@ def flex_item_select():
     return FlexSendMessage(alt_text="商品名を選択してください", contents=carousel)
 
 
+@prebuilt_flex
 def flex_quantity():
-    quantities = ["20～29枚", "30～39枚", "40～49枚", "50～99枚", "100枚以上"]
     buttons = []
-    for q in quantities:
+    for q in QUANTITY_MAP:
         buttons.append({
             "type": "button",
             "style": "primary",
@@ -642,10 +826,10 @@ def flex_quantity():
     return FlexSendMessage(alt_text="必要枚数を選択してください", contents=flex_body)
 
 
+@prebuilt_flex
 def flex_print_position():
-    positions = ["前のみ", "背中のみ", "前と背中"]
     buttons = []
-    for pos in positions:
+    for pos in PRINT_POSITIONS:
         buttons.append({
             "type": "button",
             "style": "primary",
@@ -689,6 +873,7 @@ def flex_print_position():
     return FlexSendMessage(alt_text="プリント位置を選択してください", contents=flex_body)
 
 
+@prebuilt_flex
 def flex_color_count_single():
     color_choices = list(COLOR_COST_MAP_SINGLE.keys())
     buttons_bubbles = []
@@ -736,6 +921,7 @@ def flex_color_count_single():
     return FlexSendMessage(alt_text="色数を選択してください", contents=flex_body)
 
 
+@prebuilt_flex
 def flex_color_count_both():
     color_choices = list(COLOR_COST_MAP_BOTH.keys())
     buttons_bubbles = []
@@ -783,10 +969,10 @@ def flex_color_count_both():
     return FlexSendMessage(alt_text="色数を選択してください", contents=flex_body)
 
 
+@prebuilt_flex
 def flex_back_name():
-    names = ["ネーム&背番号セット", "ネーム(大)", "番号(大)", "背ネーム・番号を使わない"]
     buttons = []
-    for nm in names:
+    for nm in BACK_NAMES:
         buttons.append({
             "type": "button",
             "style": "primary",
@@ -839,6 +1025,7 @@ def flex_back_name():
 # -----------------------
 # お問い合わせ時に返信するFlex Message
 # -----------------------
+@prebuilt_flex
 def flex_inquiry():
     contents = {
         "type": "carousel",
@@ -892,6 +1079,16 @@ def flex_inquiry():
     }
     return FlexSendMessage(alt_text="お問い合わせ情報", contents=contents)
 
+# 固定の Flex Message は起動時に一度呼んで組み立てておく (最初のリクエストで組み立てないため)。
+# 戻り値は各 flex_* 関数がキャッシュしているので、ここでは保持しない
+for _build in (
+    flex_user_type, flex_usage_date, flex_budget, flex_item_select, flex_quantity,
+    flex_print_position, flex_color_count_single, flex_color_count_both, flex_back_name,
+    flex_inquiry,
+):
+    _build()
+del _build
+
 # -----------------------
 # 0) ハンドラ側でキャッチして動的 URL を返す
 # -----------------------
@@ -934,8 +1131,8 @@ def handle_postback(event):
             }
         }
 
-        line_bot_api.reply_message(
-            event.reply_token,
+        reply_or_push(
+            event,
             FlexSendMessage(alt_text="WEBフォーム", contents=flex)
         )
 
@@ -943,16 +1140,107 @@ def handle_postback(event):
 # -----------------------
 # 1) LINE Messaging API 受信 (Webhook)
 # -----------------------
+# reply token は受信から約1分で失効するため、余裕を見てこの秒数を過ぎたら push で送る
+LINE_REPLY_TOKEN_TTL = float(os.environ.get("LINE_REPLY_TOKEN_TTL", "50"))
+
+_line_event_lag_lock = threading.Lock()
+_line_event_lag = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+
+
+def reply_or_push(event, messages):
+    """reply token の期限内なら reply、過ぎていれば push で送る"""
+    user_id = getattr(event.source, "user_id", None)
+    if user_id and time.time() - event.timestamp / 1000 > LINE_REPLY_TOKEN_TTL:
+        line_bot_api.push_message(user_id, messages)
+    else:
+        line_bot_api.reply_message(event.reply_token, messages)
+
+
+def dispatch_line_event(event):
+    """
+    handler.add で登録したハンドラと同じ振り分けで1イベントを処理する。
+    受信 (LINE 側のタイムスタンプ) から処理開始までの遅延を記録する。
+    """
+    lag = max(0.0, time.time() - event.timestamp / 1000)
+    with _line_event_lag_lock:
+        _line_event_lag["count"] += 1
+        _line_event_lag["total"] += lag
+        _line_event_lag["max"] = max(_line_event_lag["max"], lag)
+        _line_event_lag["last"] = lag
+
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_message(event)
+    elif isinstance(event, PostbackEvent):
+        handle_postback(event)
+
+
+def _line_event_key(event):
+    # 同じユーザー (グループ) のイベントは同じワーカーで順番に処理する
+    source = event.source
+    return (getattr(source, "user_id", None)
+            or getattr(source, "group_id", None)
+            or getattr(source, "room_id", None)
+            or "")
+
+
+# キューが満杯のとき、空きを待つ最大秒数 (Webhook の応答が遅れすぎない程度に短く)
+LINE_EVENT_SUBMIT_TIMEOUT = float(os.environ.get("LINE_EVENT_SUBMIT_TIMEOUT", "0.5"))
+
+line_event_pool = OrderedWorkerPool(
+    dispatch_line_event,
+    workers=int(os.environ.get("LINE_EVENT_WORKERS", "4")),
+    max_queue=int(os.environ.get("LINE_EVENT_QUEUE_SIZE", "1000")),
+    name="line-event",
+    logger=app.logger,
+)
+
+
+def line_event_stats():
+    with _line_event_lag_lock:
+        lag = dict(_line_event_lag)
+    data = line_event_pool.stats()
+    data["lag_last"] = lag["last"]
+    data["lag_max"] = lag["max"]
+    data["lag_avg"] = lag["total"] / lag["count"] if lag["count"] else 0.0
+    return data
+
+
 @app.route("/line/callback", methods=["POST"])
 def line_callback():
     signature = request.headers["X-Line-Signature"]
     body = request.get_data(as_text=True)
 
+    # 署名検証とパースだけ行い、イベントはワーカーに渡してすぐ 200 を返す
     try:
-        handler.handle(body, signature)
+        events = handler.parser.parse(body, signature)
     except InvalidSignatureError:
         abort(400, "Invalid signature. Please check your channel access token/channel secret.")
 
+    # スプレッドシートへの複製が大きく遅れている間は受け付けず、LINE の再送に任せる
+    if order_journal.is_full():
+        app.logger.warning("ジャーナルの未複製の行が上限に達しているため Webhook を断りました")
+        return "Busy", 503
+
+    rejected = 0
+    for event in events:
+        # 再送されたイベントは最初の1回だけ処理する
+        event_id = getattr(event, "webhook_event_id", None)
+        if event_id:
+            claimed = {"at": time.time()}
+            if claim_request(f"line:{event_id}", claimed) is not claimed:
+                continue
+        key = _line_event_key(event)
+        if not line_event_pool.submit(key, event, timeout=LINE_EVENT_SUBMIT_TIMEOUT):
+            # この場で処理すると同じユーザーの先のイベントより先に動いてしまうので、処理せずに断る。
+            # 再送されたときに受け付けられるよう、処理済みの記録も消す
+            app.logger.warning("LINE イベントのキューが満杯のため破棄しました (event_id=%s, source=%s)",
+                               event_id, key)
+            if event_id:
+                submitted_requests.pop(f"line:{event_id}", None)
+            rejected += 1
+
+    if rejected:
+        return "Busy", 503
     return "OK", 200
 
 # -----------------------
@@ -965,8 +1253,8 @@ def handle_message(event: MessageEvent):
 
     # 1) お問い合わせ対応
     if user_message == "お問い合わせ":
-        line_bot_api.reply_message(
-            event.reply_token,
+        reply_or_push(
+            event,
             flex_inquiry()
         )
         return
@@ -982,14 +1270,15 @@ def handle_message(event: MessageEvent):
             "その他ご要望などがございましたらメッセージでお送りくださいませ。\n"
             "よろしくお願い致します。"
         )
-        line_bot_api.reply_message(
-            event.reply_token,
+        reply_or_push(
+            event,
             TextSendMessage(text=reply_text)
         )
         return
 
     # すでに見積りフロー中かどうか
-    if user_id in user_estimate_sessions and user_estimate_sessions[user_id]["step"] > 0:
+    session_data = user_estimate_sessions.get(user_id)
+    if session_data and session_data["step"] > 0:
         process_estimate_flow(event, user_message)
         return
 
@@ -1032,8 +1321,8 @@ def send_catalog_info(event: MessageEvent):
         "※応募多数となった場合、配布数の増加や抽選となる可能性があります。\n\n"
         "ご応募お待ちしております🙆"
     )
-    line_bot_api.reply_message(
-        event.reply_token,
+    reply_or_push(
+        event,
         TextSendMessage(text=reply_text)
     )
 
@@ -1043,224 +1332,60 @@ def send_catalog_info(event: MessageEvent):
 # -----------------------
 def start_estimate_flow(event: MessageEvent):
     user_id = event.source.user_id
-    user_estimate_sessions[user_id] = {
-        "step": 1,
-        "answers": {},
-        "is_single": False
-    }
+    user_estimate_sessions[user_id] = estimate_flow.new_session()
 
-    line_bot_api.reply_message(
-        event.reply_token,
+    reply_or_push(
+        event,
         flex_user_type()
     )
 
 
-def process_estimate_flow(event: MessageEvent, user_message: str):
-    user_id = event.source.user_id
-    if user_id not in user_estimate_sessions:
-        return
-
-    session_data = user_estimate_sessions[user_id]
-    step = session_data["step"]
-
-    if step == 1:
-        if user_message in ["学生", "一般"]:
-            session_data["answers"]["user_type"] = user_message
-            session_data["step"] = 2
-            line_bot_api.reply_message(event.reply_token, flex_usage_date())
-        else:
-            del user_estimate_sessions[user_id]
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-            )
-        return
-
-    elif step == 2:
-        if user_message in ["14日目以降", "14日目以内"]:
-            session_data["answers"]["usage_date"] = user_message
-            session_data["answers"]["discount_type"] = "早割" if user_message == "14日目以降" else "通常"
-            session_data["step"] = 3
-            line_bot_api.reply_message(event.reply_token, flex_budget())
-        else:
-            del user_estimate_sessions[user_id]
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-            )
-        return
-
-    elif step == 3:
-        valid_budgets = ["特になし", "1,000円以内", "1,500円以内", "2,000円以内", "2,500円以内", "3,000円以内", "3,500円以内"]
-        if user_message in valid_budgets:
-            session_data["answers"]["budget"] = user_message
-            session_data["step"] = 4
-            line_bot_api.reply_message(event.reply_token, flex_item_select())
-        else:
-            del user_estimate_sessions[user_id]
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-            )
-        return
-
-    elif step == 4:
-        items = [
-            "ゲームシャツ",
-            "ストライプドライベースボールシャツ",
-            "ドライベースボールシャツ",
-            "ストライプユニフォーム",
-            "バスケシャツ",
-            "ドライTシャツ",
-            "ハイクオリティTシャツ",
-            "ドライポロシャツ",
-            "ドライロングスリーブTシャツ",
-            "クルーネックライトトレーナー",
-            "ジップアップライトパーカー",
-            "フーデッドライトパーカー",
-        ]
-        if user_message in items:
-            session_data["answers"]["item"] = user_message
-            session_data["step"] = 5
-            line_bot_api.reply_message(event.reply_token, flex_quantity())
-        else:
-            del user_estimate_sessions[user_id]
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-            )
-        return
-
-    elif step == 5:
-        valid_choices = ["20～29枚", "30～39枚", "40～49枚", "50～99枚", "100枚以上"]
-        if user_message in valid_choices:
-            session_data["answers"]["quantity"] = user_message
-            session_data["step"] = 6
-            line_bot_api.reply_message(event.reply_token, flex_print_position())
-        else:
-            del user_estimate_sessions[user_id]
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-            )
-        return
-
-    elif step == 6:
-        valid_positions = ["前のみ", "背中のみ", "前と背中"]
-        if user_message in valid_positions:
-            session_data["answers"]["print_position"] = user_message
-            session_data["step"] = 7
-
-            if user_message in ["前のみ", "背中のみ"]:
-                session_data["is_single"] = True
-                line_bot_api.reply_message(event.reply_token, flex_color_count_single())
-            else:
-                session_data["is_single"] = False
-                line_bot_api.reply_message(event.reply_token, flex_color_count_both())
-        else:
-            del user_estimate_sessions[user_id]
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-            )
-        return
-
-    elif step == 7:
-        if session_data["is_single"]:
-            if user_message not in COLOR_COST_MAP_SINGLE:
-                del user_estimate_sessions[user_id]
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-                )
-                return
-
-            session_data["answers"]["color_count"] = user_message
-            session_data["answers"]["back_name"] = "なし"
-
-            est_data = session_data["answers"]
-            total_price, unit_price = calculate_estimate(est_data)
-            quote_number = write_estimate_to_spreadsheet(user_id, est_data, total_price, unit_price)
-
-            reply_text = (
-                f"概算のお見積りが完了しました。\n\n"
-                f"見積番号: {quote_number}\n"
-                f"属性: {est_data['user_type']}\n"
-                f"使用日: {est_data['usage_date']}（{est_data['discount_type']}）\n"
-                f"予算: {est_data['budget']}\n"
-                f"商品: {est_data['item']}\n"
-                f"枚数: {est_data['quantity']}\n"
-                f"プリント位置: {est_data['print_position']}\n"
-                f"色数: {est_data['color_count']}\n"
-                f"背ネーム・番号: なし\n\n"
-                f"【合計金額】¥{total_price:,}\n"
-                f"【1枚あたり】¥{unit_price:,}\n"
-            )
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text=reply_text)
-            )
-            del user_estimate_sessions[user_id]
-
-        else:
-            if user_message not in COLOR_COST_MAP_BOTH:
-                del user_estimate_sessions[user_id]
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-                )
-                return
-
-            session_data["answers"]["color_count"] = user_message
-            session_data["step"] = 8
-            line_bot_api.reply_message(event.reply_token, flex_back_name())
+# 状態遷移表 (estimate_flow.STEPS) が返すプロンプト名 → 送信メッセージ
+ESTIMATE_PROMPTS = {
+    "flex_usage_date": flex_usage_date,
+    "flex_budget": flex_budget,
+    "flex_item_select": flex_item_select,
+    "flex_quantity": flex_quantity,
+    "flex_print_position": flex_print_position,
+    "flex_color_count_single": flex_color_count_single,
+    "flex_color_count_both": flex_color_count_both,
+    "flex_back_name": flex_back_name,
+}
+ESTIMATE_INVALID_MESSAGE = PrebuiltMessage(TextSendMessage(text=estimate_flow.INVALID_INPUT_TEXT))
+ESTIMATE_FATAL_MESSAGE = PrebuiltMessage(TextSendMessage(text=estimate_flow.FATAL_ERROR_TEXT))
+ESTIMATE_BUSY_MESSAGE = PrebuiltMessage(TextSendMessage(text=BUSY_TEXT))
 
-        return
 
-    elif step == 8:
-        valid_back_names = ["ネーム&背番号セット", "ネーム(大)", "番号(大)", "背ネーム・番号を使わない"]
-        if user_message in valid_back_names:
-            session_data["answers"]["back_name"] = user_message
-            session_data["step"] = 9
-
-            est_data = session_data["answers"]
-            total_price, unit_price = calculate_estimate(est_data)
-            quote_number = write_estimate_to_spreadsheet(user_id, est_data, total_price, unit_price)
-
-            reply_text = (
-                f"概算のお見積りが完了しました。\n\n"
-                f"見積番号: {quote_number}\n"
-                f"属性: {est_data['user_type']}\n"
-                f"使用日: {est_data['usage_date']}（{est_data['discount_type']}）\n"
-                f"予算: {est_data['budget']}\n"
-                f"商品: {est_data['item']}\n"
-                f"枚数: {est_data['quantity']}\n"
-                f"プリント位置: {est_data['print_position']}\n"
-                f"色数: {est_data['color_count']}\n"
-                f"背ネーム・番号: {est_data['back_name']}\n\n"
-                f"【合計金額】¥{total_price:,}\n"
-                f"【1枚あたり】¥{unit_price:,}\n"
-            )
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text=reply_text)
-            )
-            del user_estimate_sessions[user_id]
-        else:
-            del user_estimate_sessions[user_id]
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="入力内容に誤りがあるようです。 \nお手数をおかけしますが、再度メニューの「カンタン見積り」より、該当の項目を選択タブからお選びください。\n※テキストの直接入力はご利用いただけませんので、ご了承くださいませ。")
-            )
+def process_estimate_flow(event: MessageEvent, user_message: str):
+    user_id = event.source.user_id
+    session_data = user_estimate_sessions.get(user_id)
+    if session_data is None:
         return
 
+    result = estimate_flow.advance(session_data, user_message)
+    if result.session is None:
+        user_estimate_sessions.pop(user_id, None)
     else:
-        del user_estimate_sessions[user_id]
-        line_bot_api.reply_message(
-            event.reply_token,
-            TextSendMessage(text="エラーが発生しました。見積りフローを終了しました。最初からやり直してください。")
-        )
-        return
+        user_estimate_sessions[user_id] = result.session
+
+    if result.reply == estimate_flow.COMPLETE:
+        est_data = result.answers
+        total_price, unit_price, price_version = quote_estimate(est_data)
+        try:
+            quote_number = write_estimate_to_spreadsheet(user_id, est_data, total_price, unit_price, price_version)
+        except JournalFull:
+            # 最後の回答の前に戻し、同じ項目をもう一度選べば続きから見積りできるようにする
+            user_estimate_sessions[user_id] = session_data
+            reply_or_push(event, ESTIMATE_BUSY_MESSAGE)
+            return
+        reply_text = estimate_flow.estimate_result_text(quote_number, est_data, total_price, unit_price)
+        reply_or_push(event, TextSendMessage(text=reply_text))
+    elif result.reply == estimate_flow.INVALID:
+        reply_or_push(event, ESTIMATE_INVALID_MESSAGE)
+    elif result.reply == estimate_flow.FATAL:
+        reply_or_push(event, ESTIMATE_FATAL_MESSAGE)
+    else:
+        reply_or_push(event, ESTIMATE_PROMPTS[result.reply]())
 
 
 # -----------------------
@@ -1271,113 +1396,8 @@ def show_catalog_form():
     token = str(uuid.uuid4())
     session['catalog_form_token'] = token
 
-    html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>カタログ申込フォーム</title>
-    <style>
-        body {{
-            margin: 0;
-            padding: 0;
-            font-family: sans-serif;
-        }}
-        .container {{
-            max-width: 600px; 
-            margin: 0 auto;
-            padding: 1em;
-        }}
-        label {{
-            display: block;
-            margin-bottom: 0.5em;
-        }}
-        input[type=text], input[type=email], textarea {{
-            width: 100%;
-            padding: 0.5em;
-            margin-top: 0.3em;
-            box-sizing: border-box;
-        }}
-        input[type=submit] {{
-            padding: 0.7em 1em;
-            font-size: 1em;
-            margin-top: 1em;
-        }}
-    </style>
-    <script>
-    async function fetchAddress() {{
-        let pcRaw = document.getElementById('postal_code').value.trim();
-        pcRaw = pcRaw.replace('-', '');
-        if (pcRaw.length < 7) {{
-            return;
-        }}
-        try {{
-            const response = await fetch(`https://api.zipaddress.net/?zipcode=${{pcRaw}}`);
-            const data = await response.json();
-            if (data.code === 200) {{
-                // 都道府県・市区町村 部分だけを address_1 に自動入力
-                document.getElementById('address_1').value = data.data.fullAddress;
-            }}
-        }} catch (error) {{
-            console.log("住所検索失敗:", error);
-        }}
-    }}
-    </script>
-</head>
-<body>
-    <div class="container">
-      <h1>カタログ申込フォーム</h1>
-      <p>以下の項目をご記入の上、送信してください。</p>
-      <form action="/submit_form" method="post">
-          <!-- ワンタイムトークン -->
-          <input type="hidden" name="form_token" value="{token}">
-
-          <label>氏名（必須）:
-              <input type="text" name="name" required>
-          </label>
-
-          <label>郵便番号（必須）:<br>
-              <small>※自動で住所補完します。(ブラウザの場合)</small><br>
-              <input type="text" name="postal_code" id="postal_code" onkeyup="fetchAddress()" required>
-          </label>
-
-          <label>都道府県・市区町村（必須）:<br>
-              <small>※郵便番号入力後に自動補完されます。修正が必要な場合は上書きしてください。</small><br>
-              <input type="text" name="address_1" id="address_1" required>
-          </label>
-
-          <label>番地・部屋番号など（必須）:<br>
-              <small>※カタログ送付のために番地や部屋番号を含めた完全な住所の記入が必要です</small><br>
-              <input type="text" name="address_2" id="address_2" required>
-          </label>
-
-          <label>電話番号（必須）:
-              <input type="text" name="phone" required>
-          </label>
-
-          <label>メールアドレス（必須）:
-              <input type="email" name="email" required>
-          </label>
-
-          <label>Insta・TikTok名（必須）:
-              <input type="text" name="sns_account" required>
-          </label>
-
-          <label>2025年度に在籍予定の学校名と学年（未記入可）:
-              <input type="text" name="school_grade">
-          </label>
-
-          <label>その他（質問やご要望など）:
-              <textarea name="other" rows="4"></textarea>
-          </label>
-
-          <input type="submit" value="送信">
-      </form>
-    </div>
-</body>
-</html>
-"""
-    return render_template_string(html_content)
+    # テンプレートは初回にコンパイルされ、以降はキャッシュが使われる
+    return render_template("catalog_form.html", token=token)
 
 
 # -----------------------
@@ -1405,6 +1425,10 @@ def submit_catalog_form():
 
     try:
         write_to_spreadsheet_for_catalog(form_data)
+    except JournalFull:
+        # 同じフォームから送り直せるようにトークンを戻す
+        session['catalog_form_token'] = form_token
+        return BUSY_TEXT, 503
     except Exception as e:
         return f"エラーが発生しました: {e}", 500
 
@@ -1421,177 +1445,291 @@ def show_web_order_form():
     return render_template(
         "web_order_form.html",
         token=token,
-        liff_id=liff_id
+        liff_id=liff_id,
+        catalog_url=url_for("web_order_catalog", v=CATALOG_ASSET.version)
     )
 
+
+@app.route("/web_order_catalog.json")
+def web_order_catalog():
+    """
+    フォーム用の商品カタログ JSON。
+    ?v=<内容ハッシュ> 付きの URL は内容が変わらないので長期キャッシュさせる。
+    """
+    asset = CATALOG_ASSET
+    if request.args.get("v") == asset.version:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=300"
+
+    if asset.version in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        encoding, body = asset.negotiate(request.headers.get("Accept-Encoding"))
+        resp = Response(body, mimetype="application/json")
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+    resp.set_etag(asset.version)
+    resp.headers["Cache-Control"] = cache_control
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
 @app.route("/submit_web_order_form", methods=["POST"])
 def submit_web_order_form():
     # フォームデータ辞書を作成 (未入力は空文字 "")
     form_data = {k: request.form.get(k, "").strip() for k in request.form}
 
-    # 見積計算
-    est = calculate_web_order_estimate(form_data)
-    unit_price  = est["unit_price"]
-    total_price = est["total_price"]
+    # 見積計算 (計算できない注文は注文番号を取らずに断る)
+    try:
+        est = calculate_web_order_estimate(form_data)
+    except (TypeError, ValueError):
+        return "合計枚数が正しくありません。", 400
 
-    # 注文番号などを辞書に追加
+    # form_token を冪等キーにして、二重送信・再送では注文を作り直さない。
+    # 受付が終わるまでは pending のまま登録し、途中で失敗した再送は同じ注文番号・タイムスタンプで続きから受け付ける
     jst = pytz.timezone('Asia/Tokyo')
-    order_no = datetime.now(jst).strftime("%Y%m%d%H%M%S")
+    claim = {
+        "order_no": new_order_no(),
+        "timestamp": datetime.now(jst).strftime("%Y/%m/%d %H:%M:%S"),
+        "pending": True,
+    }
+    form_token = form_data.get("form_token")
+    idempotency_key = f"web_order:{form_token}" if form_token else None
+    if idempotency_key:
+        claim = claim_request(idempotency_key, claim)
+        if not claim.get("pending"):
+            return f"フォーム送信ありがとうございました！（注文番号 {claim['order_no']} で受付済みです）", 200
+    order_no = claim["order_no"]
 
-    # タイムスタンプも同様に追加
-    now_jst_str = datetime.now(jst).strftime("%Y/%m/%d %H:%M:%S")
-    form_data["timestamp"]  = now_jst_str
+    # 注文番号などを辞書に追加
+    form_data["timestamp"]  = claim["timestamp"]
     form_data["orderNo"]    = order_no
-    form_data["unitPrice"]  = unit_price
-    form_data["totalPrice"] = total_price
-
-    # スプレッドシート保存
-    write_to_spreadsheet_for_web_order(form_data)
+    form_data["unitPrice"]  = est["unit_price"]
+    form_data["totalPrice"] = est["total_price"]
+    form_data["priceVersion"] = est["price_version"]
 
-    # ユーザーへプッシュ
-    uid = form_data.get("lineUserId")
-    if uid:
-        summary_msg = make_order_summary(order_no, form_data, est)
-        line_bot_api.push_message(uid, TextSendMessage(text=summary_msg))
+    try:
+        # 注文の内容はジャーナルにだけ記録し (スプレッドシートへはジャーナルが複製)、
+        # 受付ログには LINE 通知の予約として注文番号だけを記録する。
+        # 前回の送信でジャーナルまで記録できていれば、その内容のまま受付ログだけ記録する
+        if order_journal.get(order_no, "WebOrderRequests") is None:
+            write_to_spreadsheet_for_web_order(form_data, est, ref=order_no)
+        skip = () if form_data.get("lineUserId") else ("push",)
+        web_order_log.accept(order_no, {"order_no": order_no}, skip=skip)
+    except JournalFull:
+        return BUSY_TEXT, 503
+
+    if idempotency_key:
+        submitted_requests[idempotency_key] = {"order_no": order_no}
+    return f"フォーム送信ありがとうございました！（注文番号 {order_no}）", 200
+
+
+@app.route("/web_order_status/<order_no>", methods=["GET"])
+def web_order_status(order_no):
+    """注文の後処理 (スプレッドシートへの複製・LINE 通知) の進み具合を返す"""
+    status = web_order_log.status(order_no)
+    if status is None:
+        return jsonify({"error": "注文が見つかりません。"}), 404
+    status.pop("last_error", None)
+    record = order_journal.get(order_no, "WebOrderRequests")
+    # ジャーナル導入前の注文は受付ログに残っている状態 (written など) を使う
+    sheet = record["replica"] if record else status["steps"].get("sheet", "missing")
+    status["steps"]["sheet"] = sheet
+    if sheet in ("failed", "missing"):
+        status["status"] = "failed"
+    elif sheet == "pending" and status["status"] == "completed":
+        status["status"] = "processing"
+    return jsonify(status)
+
+@app.route("/web_order_quote", methods=["POST"])
+def web_order_quote():
+    """
+    入力途中のフォームから見積り内訳を返す (スプレッドシート・LINE には書き込まない)。
+    計算は calculate_web_order_estimate のキャッシュを通る。
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "見積り条件の JSON を読み取れませんでした。"}), 400
+        if not isinstance(data, dict):
+            return jsonify({"error": "見積り条件はオブジェクトで送ってください。"}), 400
+    else:
+        data = request.form
+    form_data = {k: v.strip() if isinstance(v, str) else v for k, v in data.items()}
 
-    return "フォーム送信ありがとうございました！", 200
+    try:
+        est = calculate_web_order_estimate(form_data)
+    except (TypeError, ValueError):
+        return jsonify({"error": "合計枚数が正しくありません。"}), 400
+    return jsonify(est)
 
-def write_to_spreadsheet_for_web_order(data: dict):
-    gc = get_gspread_client()
-    sh = gc.open_by_key(SPREADSHEET_KEY)
-    worksheet = get_or_create_worksheet(sh, "WebOrderRequests")
+@app.route("/web_order_quote/bulk", methods=["POST"])
+def web_order_quote_bulk():
+    """
+    JSONL / CSV の見積り条件をまとめて計算し、終わった順に1行ずつ返す。
+    入力形式は ?format= か Content-Type、出力形式は ?output= (jsonl / csv) で指定する。
+    """
+    in_fmt = request.args.get("format") or bulk_quote.detect_format(request.content_type)
+    out_fmt = request.args.get("output", "jsonl")
+    ordered = request.args.get("ordered") in ("1", "true")
 
+    try:
+        lines = request.get_data(as_text=True).splitlines()
+        configs = list(bulk_quote.read_configs(lines, in_fmt))
+    except (bulk_quote.BulkQuoteError, csv.Error) as e:
+        return jsonify({"error": str(e)}), 400
+    if len(configs) > bulk_quote.BULK_QUOTE_MAX_ROWS:
+        return jsonify({"error": f"一度に見積りできるのは {bulk_quote.BULK_QUOTE_MAX_ROWS} 件までです"}), 413
+
+    results = bulk_quote.quote_many(configs, ordered=ordered)
+    if out_fmt == "csv":
+        return Response(bulk_quote.iter_csv(results), mimetype="text/csv")
+    return Response(bulk_quote.iter_jsonl(results), mimetype="application/x-ndjson")
+
+def write_to_spreadsheet_for_web_order(data: dict, est: dict, ref=None):
     # row_values をヘッダー順に作成
     row_values = build_web_order_row_values(data)
 
-    # 書き込む
-    worksheet.append_row(row_values, value_input_option="USER_ENTERED")
+    # ジャーナルへ (スプレッドシートへの複製はバックグラウンド)。同じ注文番号は1回しか記録しない
+    order_journal.append("WebOrderRequests", row_values, record_no=ref,
+                         user_id=data.get("lineUserId"), data={"form": data, "estimate": est})
 
-    
-def calculate_web_order_estimate(data: dict) -> dict:
-    """Web オーダーフォーム１件ぶんの単価・合計金額を返す"""
-
-    # 1) 基本行を PRICE_TABLE から取得 ------------------------------
-    item          = data.get("productName", "")
-    qty           = int(data.get("totalQuantity", "0") or 0)
-    discount_type = "早割" if data.get("discountOption") == "早割" else "通常"
-
-    # プリント位置数 (printPositionNo1〜4 に値が入っている数)
-    pos_cnt = sum(1 for i in range(1,5) if data.get(f"printPositionNo{i}"))
-
-    # PRICE_TABLE から該当行検索
-    def _find():
-        for row in PRICE_TABLE:
-            if (row["item"] == item 
-                and row["discount_type"] == discount_type 
-                and row["min_qty"] <= qty <= row["max_qty"]):
-                return row
-        return None
-
-    row = _find()
-    if not row:
-        # 見つからない場合は金額0を返すなど、適宜処理
-        return {
-            "unit_price": 0,
-            "total_price": 0,
-            "base_unit": 0,
-            "pos_add_fee": 0,
-            "color_fee": 0,
-            "back_name_fee": 0,
-            "option_ink_extra": 0,
-            "fullcolor_extra": 0,
-            "qty": qty
-        }
 
-    base_unit   = row["unit_price"]
-    pos_add_fee = row["pos_add"] * max(0, pos_cnt-1)
+# -----------------------
+# Webオーダーの後処理 (受付ログ → LINE 通知)
+# -----------------------
+def _web_order_push_step(order):
+    order_no = order["order_no"]
+    if "form" not in order:
+        # 受付ログは注文番号だけを持ち、内容はジャーナルから読む
+        record = order_journal.get(order_no, "WebOrderRequests")
+        if record is None:
+            # 再試行しても現れないので、再試行せずに失敗として記録させる
+            raise LookupError(f"注文 {order_no} がジャーナルにありません")
+        order = {**order, **record["data"]}
+    summary_msg = make_order_summary(order_no, order["form"], order["estimate"])
+    # 再試行で二重に届かないよう、注文番号から決まる retry_key を付ける
+    retry_key = str(uuid.uuid5(uuid.NAMESPACE_URL, f"web_order:{order_no}"))
+    try:
+        line_bot_api.push_message(order["form"]["lineUserId"], TextSendMessage(text=summary_msg),
+                                  retry_key=retry_key)
+    except LineBotApiError as e:
+        if e.status_code == 409:  # 同じ retry_key で送信済み
+            return "done"
+        raise
+    return "done"
+
+
+web_order_log = OrderLog(
+    os.environ.get("ORDER_LOG_PATH", "web_orders.sqlite3"),
+    {"push": _web_order_push_step},
+    max_attempts=int(os.environ.get("ORDER_LOG_MAX_ATTEMPTS", "8")),
+    logger=app.logger,
+)
+atexit.register(web_order_log.stop)
 
-    # 2) プリントカラー追加料金 ------------------------------
-    color_add_cnt    = 0     # 2色なら+1、3色なら+2
-    option_ink_extra = 0
-    fullcolor_extra  = 0
-    back_name_fee    = 0     # 背ネーム・番号セット等の加算
-    # ↑ 従来の背ネーム類はここへ合算していく
+_legacy_migration_lock = threading.Lock()
+_legacy_migrated = False
 
-    for p in range(1,5):
-        if not data.get(f"printPositionNo{p}"):
-            continue
 
-        # 1〜3色入力欄(プリントカラー・オプション)で実際に入力された値を取得
-        color_list = [
-            data.get(f"printColorOption{p}_1"),
-            data.get(f"printColorOption{p}_2"),
-            data.get(f"printColorOption{p}_3"),
-        ]
-        color_list = [c for c in color_list if c]  # 空文字除外
-
-        # 2色指定なら +1、3色指定なら +2
-        if len(color_list) == 2:
-            color_add_cnt += 1
-        elif len(color_list) == 3:
-            color_add_cnt += 2
-
-        # 各色の属性チェック
-        for c in color_list:
-            # (A) ネーム＆背番号セット/ネーム(大)/(小)/番号(大)/(小) が含まれていたら back_name_fee
-            if c in BACK_NAME_FEE:  
-                back_name_fee += BACK_NAME_FEE[c]
-
-            # (B) 特殊カラー(グリッター等)があれば SPECIAL_SINGLE_COLOR_FEE
-            if c in SPECIAL_SINGLE_COLOR_FEE:
-                back_name_fee += SPECIAL_SINGLE_COLOR_FEE[c]
-
-            # (C) COLOR_ATTR_MAP で "オプションインク" なら、option_ink_extra を加算
-            if COLOR_ATTR_MAP.get(c) == "オプションインク":
-                option_ink_extra += OPTION_INK_EXTRA
-
-        # フルカラーオプション
-        fcs = data.get(f"fullColorSize{p}")  # "S"/"M"/"L" など
-        if fcs:
-            fullcolor_extra += FULLCOLOR_SIZE_FEE.get(fcs, 0)  # サイズ別に加算
-
-        # 3) ネーム&番号カラーオプション（単色 or フチ付き）----------------
-        # 単色カラーを選択していた場合
-        single_color = data.get(f"singleColor{p}")
-        if single_color and single_color in SPECIAL_SINGLE_COLOR_FEE:
-            back_name_fee += SPECIAL_SINGLE_COLOR_FEE[single_color]
-
-        # フチ付きタイプを選択していた場合
-        edge_type = data.get(f"edgeType{p}")
-        if edge_type and edge_type != "なし":
-            # たとえばフチ付きは +100円
-            back_name_fee += 100
-
-            # カスタムフチ色の場合、edgeCustomTextColor{p} / edgeCustomEdgeColor{p} / edgeCustomEdgeColor2_{p} の中に
-            # 特殊色があれば追加
-            edge_text = data.get(f"edgeCustomTextColor{p}")
-            edge_col1 = data.get(f"edgeCustomEdgeColor{p}")
-            edge_col2 = data.get(f"edgeCustomEdgeColor2_{p}")
-
-            for ec in (edge_text, edge_col1, edge_col2):
-                if ec and ec in SPECIAL_SINGLE_COLOR_FEE:
-                    back_name_fee += SPECIAL_SINGLE_COLOR_FEE[ec]
-
-    # カラー追加料金 (各1色目はベース料金に含まれている想定)
-    # color_add_cnt * row["color_add"] で追加料金
-    color_fee = color_add_cnt * row["color_add"] + fullcolor_extra + option_ink_extra
-
-    # 4) 単価・合計 ---------------------------------
-    unit_price  = base_unit + pos_add_fee + color_fee + back_name_fee
-    total_price = unit_price * qty
-
-    return {
-        "unit_price":       unit_price,
-        "total_price":      total_price,
-        "base_unit":        base_unit,
-        "pos_add_fee":      pos_add_fee,
-        "color_fee":        color_fee,
-        "back_name_fee":    back_name_fee,
-        "option_ink_extra": option_ink_extra,
-        "fullcolor_extra":  fullcolor_extra,
-        "qty":              qty
-    }
+def migrate_legacy_stores():
+    """
+    以前の版の書き込みキュー・受付ログの "sheet" ステップに残っている行をジャーナルへ移す。
+    プロセスごとに1回だけ行う (start_background_workers から呼ぶ。複数プロセスで重なっても二重には移さない)。
+    """
+    global _legacy_migrated
+    with _legacy_migration_lock:
+        if _legacy_migrated:
+            return
+        _legacy_migrated = True
+        moved = order_journal.import_sheet_queue(SHEET_QUEUE_PATH)
+        # 書き込みキューに積まれる前だった注文
+        pending = web_order_log.orders_in_state("sheet", ("pending",))
+        for order_no, order in pending:
+            write_to_spreadsheet_for_web_order(order["form"], order["estimate"], ref=order_no)
+        legacy = [no for no, _ in web_order_log.orders_in_state("sheet", ("pending", "queued"))]
+        if legacy:
+            web_order_log.mark(legacy, "sheet", "journal")
+        if moved or pending:
+            app.logger.info("以前の書き込みキューから %d 行、受付ログから %d 件をジャーナルに移しました",
+                            moved, len(pending))
+
+
+# -----------------------
+# 価格表の差し替え (PRICE_TABLE_PATH のファイルを監視)
+# -----------------------
+# PRICE_SHEET_TITLE を指定すると、そのワークシートの価格表をスナップショットに取得して使う
+PRICE_SHEET_TITLE = os.environ.get("PRICE_SHEET_TITLE", "")
+# 価格表シートの更新確認に使うセル (例 "P1")。価格を編集したら版番号・更新日時などを書き換える運用にすると、
+# 確認は1セルの読み込みで済む。未指定・空欄なら価格表シートの値全体のハッシュで確認する
+PRICE_SHEET_VERSION_CELL = os.environ.get("PRICE_SHEET_VERSION_CELL", "")
+PRICE_TABLE_PATH = os.environ.get("PRICE_TABLE_PATH", "") or (
+    "price_table_snapshot.json" if PRICE_SHEET_TITLE else "")
+price_table_watcher = None
+price_sheet_refresher = None
+if PRICE_TABLE_PATH:
+    price_table_watcher = PriceTableWatcher(
+        PRICE_TABLE_PATH,
+        interval=float(os.environ.get("PRICE_TABLE_CHECK_INTERVAL", "10")),
+        logger=app.logger,
+    )
+    # 起動時に1度読み込み、以降は監視スレッドが更新を拾う
+    price_table_watcher.check()
 
+
+def _probe_price_sheet():
+    """
+    価格表シートの更新を確認する値を返す。
+    スプレッドシート全体の版 (Drive の version) は注文の追記でも変わるので使わず、価格表シートだけを見る。
+    """
+    def probe(sh):
+        ws = sh.worksheet(PRICE_SHEET_TITLE)
+        if PRICE_SHEET_VERSION_CELL:
+            value = ws.acell(PRICE_SHEET_VERSION_CELL).value
+            if value:
+                return f"cell:{value}"
+        values = json.dumps(ws.get_all_values(), ensure_ascii=False)
+        return "sha256:" + hashlib.sha256(values.encode("utf-8")).hexdigest()[:16]
+    return with_spreadsheet(probe)
+
+
+def _fetch_price_sheet():
+    # 価格表のシートは作成しない (無ければ取得失敗としてスナップショットのまま動く)
+    return with_spreadsheet(lambda sh: sh.worksheet(PRICE_SHEET_TITLE).get_all_records())
+
+
+if PRICE_SHEET_TITLE:
+    # 取得はバックグラウンドのみ。起動時はディスクのスナップショットだけを読む
+    price_sheet_refresher = PriceSheetRefresher(
+        PRICE_TABLE_PATH,
+        probe=_probe_price_sheet,
+        fetch=_fetch_price_sheet,
+        interval=float(os.environ.get("PRICE_SHEET_CHECK_INTERVAL", "60")),
+        logger=app.logger,
+    )
+
+
+def price_table_stats():
+    if price_table_watcher is None:
+        return {"version": price_index.PRICE_INDEX.version}
+    data = price_table_watcher.stats()
+    if price_sheet_refresher is not None:
+        data["sheet"] = price_sheet_refresher.stats()
+    return data
+
+
+@app.before_request
+def start_background_workers():
+    # 前回の停止時に残った注文も、起動後最初のリクエストから処理を再開する
+    migrate_legacy_stores()
+    web_order_log.start()
+    order_journal.start()
+    if price_table_watcher is not None:
+        price_table_watcher.start()
+    if price_sheet_refresher is not None:
+        price_sheet_refresher.start()
+
+    
 def make_order_summary(order_no: str,
                        data: dict,
                        est: dict) -> str:
@@ -1653,5 +1791,19 @@ def health_check():
     return "LINE Bot is running.", 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """キュー長・処理遅延・キャッシュのヒット率などを JSON で返す"""
+    return jsonify({
+        "line_events": line_event_stats(),
+        "order_journal": order_journal.stats(),
+        "gspread_cache": gspread_cache_stats(),
+        "web_order_estimate_cache": estimate_cache_info(),
+        "web_order_log": web_order_log.stats(),
+        "line_api": line_api_stats(),
+        "price_table": price_table_stats(),
+    })
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
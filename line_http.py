@@ -0,0 +1,169 @@
+"""
+LINE Messaging API 用の HTTP クライアント
+
+line-bot-sdk 既定の RequestsHttpClient はリクエストごとに requests.post を呼ぶため、
+毎回 TLS 接続を張り直す。PooledHttpClient は requests.Session を使い回し、
+
+- キープアライブ接続をプールで保持 (pool_size はワーカー数に合わせる)
+- 接続・読み込みのタイムアウトを明示
+- 接続エラーと一時的な 5xx を指数バックオフで再試行
+  (POST は二重送信にならないもの: X-Line-Retry-Key 付き、または reply のみ)
+- エンドポイントごとのレイテンシのヒストグラムを記録
+
+    line_bot_api = LineBotApi(token, http_client=pooled_http_client_factory(pool_size=8))
+"""
+import functools
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+# レイテンシのバケット上限 (ミリ秒)。最後は上限なし
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+RETRY_STATUSES = frozenset((500, 502, 503, 504))
+
+# ユーザーID・リッチメニューID・メッセージIDなどはまとめて1つのエンドポイントとして数える
+_ID_SEGMENT = re.compile(r"/(?:[URC][0-9a-f]{32}|richmenu-[0-9a-f]+|\d+|[0-9a-f-]{36})(?=/|$)")
+
+
+def endpoint_name(method, url):
+    """'POST /v2/bot/message/push' のような集計用の名前にする"""
+    path = url.split("://", 1)[-1]
+    path = path[path.find("/"):] if "/" in path else "/"
+    path = path.split("?", 1)[0]
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+class LatencyHistogram:
+    """エンドポイントごとの件数・ステータス別件数・レイテンシのバケット"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def observe(self, endpoint, seconds, status):
+        ms = seconds * 1000
+        with self._lock:
+            entry = self._data.get(endpoint)
+            if entry is None:
+                entry = self._data[endpoint] = {
+                    "count": 0, "sum_ms": 0.0, "max_ms": 0.0,
+                    "buckets": [0] * (len(self.buckets) + 1), "status": {},
+                }
+            entry["count"] += 1
+            entry["sum_ms"] += ms
+            entry["max_ms"] = max(entry["max_ms"], ms)
+            i = 0
+            while i < len(self.buckets) and ms > self.buckets[i]:
+                i += 1
+            entry["buckets"][i] += 1
+            key = str(status)
+            entry["status"][key] = entry["status"].get(key, 0) + 1
+
+    def snapshot(self):
+        labels = [f"le_{b}ms" for b in self.buckets] + ["inf"]
+        with self._lock:
+            result = {}
+            for endpoint, entry in self._data.items():
+                result[endpoint] = {
+                    "count": entry["count"],
+                    "avg_ms": entry["sum_ms"] / entry["count"],
+                    "max_ms": entry["max_ms"],
+                    "buckets": dict(zip(labels, entry["buckets"])),
+                    "status": dict(entry["status"]),
+                }
+            return result
+
+
+LINE_API_LATENCY = LatencyHistogram()
+
+
+class PooledHttpClient(RequestsHttpClient):
+    def __init__(self, timeout=RequestsHttpClient.DEFAULT_TIMEOUT, pool_size=10, retries=2,
+                 backoff=0.5, histogram=LINE_API_LATENCY):
+        super().__init__(timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.histogram = histogram
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+        self.retry_count = 0
+
+    @property
+    def session(self):
+        # gunicorn の fork 後は子プロセスで接続を張り直す (親の接続は共有しない)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=2,  # api.line.me / api-data.line.me
+                        pool_maxsize=self.pool_size,
+                        # 接続できなかった場合だけ urllib3 が再試行する (送信済みの再試行は下で判断)
+                        max_retries=Retry(total=self.retries, connect=self.retries, read=0, status=0,
+                                          other=0, backoff_factor=self.backoff),
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _retryable(self, method, url, headers):
+        if method in ("GET", "DELETE", "PUT"):
+            return True
+        # reply は reply token が1回しか使えず、push 等は retry key で LINE 側が重複を弾く
+        return "X-Line-Retry-Key" in (headers or {}) or url.endswith("/message/reply")
+
+    def _request(self, method, url, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        endpoint = endpoint_name(method, url)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                self.histogram.observe(endpoint, time.perf_counter() - start, type(e).__name__)
+                raise
+            self.histogram.observe(endpoint, time.perf_counter() - start, response.status_code)
+
+            if (response.status_code in RETRY_STATUSES and attempt < self.retries
+                    and self._retryable(method, url, kwargs.get("headers"))):
+                attempt += 1
+                self.retry_count += 1
+                response.close()
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+                continue
+            return RequestsHttpResponse(response)
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request("GET", url, timeout, headers=headers, params=params, stream=stream)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request("POST", url, timeout, headers=headers, data=data)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request("DELETE", url, timeout, headers=headers, data=data)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request("PUT", url, timeout, headers=headers, data=data)
+
+
+def pooled_http_client_factory(**options):
+    """LineBotApi(http_client=...) に渡す、オプション付きのクライアントクラス相当"""
+    return functools.partial(PooledHttpClient, **options)
+
+
+def line_api_stats():
+    return LINE_API_LATENCY.snapshot()
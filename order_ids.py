@@ -0,0 +1,162 @@
+"""
+注文番号・見積番号の採番
+
+他のワーカーと通信せずに重複しない番号を作る。形式は
+
+    YYYYMMDDHHMMSSmmm-WWWSS   (例: 20261018155920123-04217)
+
+- 先頭 17 桁: 日本時間のミリ秒までの時刻 (文字列のまま並べれば時刻順)
+- WWW: ワーカー番号 (0〜999)
+- SS : 同じミリ秒内の連番 (0〜99。使い切ったら次のミリ秒に進める)
+
+ワーカー番号は環境変数 ID_WORKER_ID があればそれを使う (gunicorn の post_fork フックなどで
+プロセスごとに別の値を設定すること)。無ければ同じノードのプロセスで共有する SQLite ファイル
+(ID_WORKER_DB、既定は order_ids.sqlite3) から、使われていない番号をプロセスごとに1つ借りる。
+借りた番号は、持ち主のプロセスが終了するまで他のプロセスには渡さない。
+複数サーバーで動かす場合は、サーバー間で重複しないよう ID_WORKER_ID を振ること。
+時計が戻った場合も、最後に使った時刻から進めるので番号は戻らない。
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+JST = timezone(timedelta(hours=9))
+
+WORKER_ID_LIMIT = 1000
+SEQUENCE_LIMIT = 100
+
+ID_WORKER_DB = os.environ.get("ID_WORKER_DB", "order_ids.sqlite3")
+
+
+class DuplicateIdError(RuntimeError):
+    """同じ番号で内容の違う記録がすでにある (番号の重複)"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def lease_worker_id(path=ID_WORKER_DB):
+    """
+    path の SQLite から、使われていないワーカー番号を1つ借りる。
+    持ち主のプロセスが終了している番号は借り直せる。空きが無ければ RuntimeError。
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    pid = os.getpid()
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS worker_ids ("
+            " worker_id INTEGER PRIMARY KEY,"
+            " pid INTEGER NOT NULL,"
+            " leased_at REAL NOT NULL)"
+        )
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            held = dict(conn.execute("SELECT worker_id, pid FROM worker_ids"))
+            # 同じ pid の行は、この pid を以前使っていた (すでに終了した) プロセスのもの
+            stale = sorted(wid for wid, owner in held.items() if owner == pid or not _pid_alive(owner))
+            conn.executemany("DELETE FROM worker_ids WHERE worker_id = ?", [(wid,) for wid in stale])
+            in_use = set(held) - set(stale)
+            worker_id = next((wid for wid in range(WORKER_ID_LIMIT) if wid not in in_use), None)
+            if worker_id is None:
+                raise RuntimeError(f"空いているワーカー番号がありません (上限 {WORKER_ID_LIMIT})")
+            conn.execute("INSERT INTO worker_ids (worker_id, pid, leased_at) VALUES (?, ?, ?)",
+                         (worker_id, pid, time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    atexit.register(release_worker_id, worker_id, pid, path)
+    return worker_id
+
+
+def release_worker_id(worker_id, pid, path=ID_WORKER_DB):
+    """終了時に番号を返す (返せなくても、プロセスの終了後に借り直せる)"""
+    if os.getpid() != pid:
+        return  # fork した子プロセスの atexit では返さない
+    try:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("DELETE FROM worker_ids WHERE worker_id = ? AND pid = ?", (worker_id, pid))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def default_worker_id():
+    env = os.environ.get("ID_WORKER_ID")
+    if env:
+        worker_id = int(env)
+        if not 0 <= worker_id < WORKER_ID_LIMIT:
+            raise ValueError(f"ID_WORKER_ID は 0〜{WORKER_ID_LIMIT - 1} で指定してください: {env}")
+        return worker_id
+    return lease_worker_id()
+
+
+class IdGenerator:
+    def __init__(self, worker_id=None, clock=time.time):
+        self._fixed_worker_id = worker_id
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker_id = None
+        self._last_ms = 0
+        self._seq = 0
+
+    @property
+    def worker_id(self):
+        # gunicorn の fork 後は子プロセスごとにワーカー番号を決め直す
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._worker_id = (self._fixed_worker_id if self._fixed_worker_id is not None
+                                       else default_worker_id())
+                    self._pid = os.getpid()
+        return self._worker_id
+
+    def _next(self):
+        worker_id = self.worker_id
+        with self._lock:
+            now_ms = int(self._clock() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._seq = 0
+            else:
+                self._seq += 1
+                if self._seq >= SEQUENCE_LIMIT:
+                    # 連番を使い切ったら (時計が戻った場合も) 時刻の方を進める
+                    self._last_ms += 1
+                    self._seq = 0
+            return self._last_ms, worker_id, self._seq
+
+    def next_id(self):
+        ms, worker_id, seq = self._next()
+        stamp = datetime.fromtimestamp(ms // 1000, JST).strftime("%Y%m%d%H%M%S")
+        return f"{stamp}{ms % 1000:03d}-{worker_id:03d}{seq:02d}"
+
+
+ID_GENERATOR = IdGenerator()
+
+
+def new_order_no():
+    """Web オーダーの注文番号"""
+    return ID_GENERATOR.next_id()
+
+
+def new_quote_number():
+    """カンタン見積りの見積番号"""
+    return ID_GENERATOR.next_id()
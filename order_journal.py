@@ -0,0 +1,482 @@
+"""
+注文・見積り・カタログ申し込みのローカルジャーナル (正本)
+
+フォーム送信・見積りの記録はまずこの SQLite (WAL) に1行追記し、スプレッドシートは複製として扱う。
+バックグラウンドのレプリケーターが未複製の行をワークシートごとに append_rows でまとめて書き込む。
+
+- 行は追記のみ (内容は書き換えない)。複製の進み具合だけを replicated_at などの列で管理する
+- 注文番号・見積番号 (record_no)・LINE ユーザーID・日付 (日本時間) に索引があり、
+  検索はスプレッドシートの API を使わずにこのファイルだけで行える
+- 同じ title・record_no の行は1回しか記録しない (再送での二重登録防止)
+- 複製する行はリースで取得するので、複数の gunicorn ワーカーで共有しても二重送信しない。
+  append_rows の間はリースを延長し続けるので、書き込みが遅くても他のワーカーに取られない。
+  429/5xx は指数バックオフで再試行し、それ以外の失敗は failed にして requeue_failed で送り直せる
+- 未複製 (failed を含む) の行が max_backlog 行に達すると append は空きを待ち、
+  timeout までに空かなければ JournalFull を送出する (呼び出し側は 503 で断る)
+
+    python order_journal.py stats                        # 未複製・failed の件数
+    python order_journal.py failed --title 簡易見積      # failed の行とエラー
+    python order_journal.py requeue --title 簡易見積     # failed の行を送り直す (動いている Bot が複製する)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from order_ids import DuplicateIdError
+from retry_policy import is_retryable_error
+
+JST = timezone(timedelta(hours=9))
+
+
+class JournalFull(Exception):
+    """未複製の行が上限に達し、待っても空きができなかった"""
+
+
+def jst_date(ts):
+    """エポック秒を日本時間の日付 (YYYY-MM-DD) にする"""
+    return datetime.fromtimestamp(ts, JST).strftime("%Y-%m-%d")
+
+
+class OrderJournal:
+    """
+    append_rows(title, rows) を呼び出す関数を受け取り、記録した行をスプレッドシートに複製する。
+    書き込めたら on_replicated(title, record_nos)、失敗扱いにしたら on_failed(title, record_nos, error) で通知する。
+    """
+
+    def __init__(self, path, append_rows, batch_size=200, flush_interval=2.0, lease_seconds=120.0,
+                 backoff_base=1.0, backoff_max=60.0, max_backlog=5000, full_timeout=10.0,
+                 logger=None, on_replicated=None, on_failed=None):
+        self.path = path
+        self.append_rows = append_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_backlog = max_backlog
+        self.full_timeout = full_timeout
+        self.logger = logger
+        self.on_replicated = on_replicated
+        self.on_failed = on_failed
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._space = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._failures = 0
+        self._stats_lock = threading.Lock()
+        self._stats = {"appended": 0, "duplicates": 0, "rejected": 0, "replicated_rows": 0, "api_calls": 0,
+                       "retries": 0, "failed_rows": 0}
+        self._init_db()
+
+    # ---------- SQLite ----------
+    def _conn(self):
+        # スレッドごと・プロセスごとに接続を持つ (fork 前の接続は使わない)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " title TEXT NOT NULL,"
+            " record_no TEXT,"
+            " user_id TEXT,"
+            " created_at REAL NOT NULL,"
+            " created_date TEXT NOT NULL,"
+            " row TEXT NOT NULL,"
+            " data TEXT,"
+            " replicated_at REAL,"
+            " failed INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " claimed_by TEXT,"
+            " claimed_at REAL)"
+        )
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS records_no ON records (record_no, title)"
+                     " WHERE record_no IS NOT NULL")
+        conn.execute("CREATE INDEX IF NOT EXISTS records_user ON records (user_id, created_at)"
+                     " WHERE user_id IS NOT NULL")
+        conn.execute("CREATE INDEX IF NOT EXISTS records_date ON records (created_date, title)")
+        # 未複製の行だけを持つ部分インデックス (複製済みの行が増えても取得は速いまま)
+        conn.execute("CREATE INDEX IF NOT EXISTS records_unreplicated ON records (seq)"
+                     " WHERE replicated_at IS NULL AND failed = 0")
+        # 上限の判定用 (failed の行も数える)
+        conn.execute("CREATE INDEX IF NOT EXISTS records_backlog ON records (seq) WHERE replicated_at IS NULL")
+
+    # ---------- 記録 ----------
+    def backlog(self):
+        """スプレッドシートに未複製の行数 (failed を含む)"""
+        return self._conn().execute("SELECT COUNT(*) FROM records WHERE replicated_at IS NULL").fetchone()[0]
+
+    def is_full(self):
+        return self.backlog() >= self.max_backlog
+
+    def _wait_for_space(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._space:
+            while self.is_full():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._stats_lock:
+                        self._stats["rejected"] += 1
+                    raise JournalFull(f"スプレッドシートに未複製の行が上限 ({self.max_backlog}) に達しています。")
+                self._wakeup.set()
+                # 他のプロセスの複製で空くこともあるので、通知が無くても定期的に数え直す
+                self._space.wait(min(remaining, self.flush_interval))
+
+    def _existing(self, conn, title, record_no, row_json, data_json):
+        r = conn.execute(
+            "SELECT seq, row, data FROM records WHERE record_no = ? AND title = ?", (record_no, title)
+        ).fetchone()
+        if r is None:
+            return None
+        seq, existing_row, existing_data = r
+        if existing_row != row_json or (data_json is not None and existing_data != data_json):
+            raise DuplicateIdError(f"{title} の {record_no} は別の内容で記録済みです")
+        with self._stats_lock:
+            self._stats["duplicates"] += 1
+        return seq
+
+    def append(self, title, row, record_no=None, user_id=None, data=None, created_at=None, timeout=None):
+        """
+        1行を記録し、複製を予約する。記録した行の seq を返す。
+        同じ title・record_no で同じ内容の行が既にあれば記録せず、既存の行の seq を返す。
+        内容が違う場合は番号の重複なので DuplicateIdError (後から来た記録を黙って捨てない)。
+        未複製の行が上限に達していれば最大 timeout 秒 (省略時は full_timeout) 待ち、空かなければ JournalFull。
+        """
+        return self._append(title, row, record_no, user_id, data, created_at,
+                            self.full_timeout if timeout is None else timeout)
+
+    def _append(self, title, row, record_no, user_id, data, created_at, timeout):
+        # timeout=None なら上限を見ない (受付済みの行の移行用)
+        self._ensure_started()
+        created_at = time.time() if created_at is None else created_at
+        row_json = json.dumps(row, ensure_ascii=False)
+        data_json = None if data is None else json.dumps(data, ensure_ascii=False, default=str)
+        conn = self._conn()
+        # 記録済みの再送は上限に関係なく受け付ける
+        if record_no is not None:
+            seq = self._existing(conn, title, record_no, row_json, data_json)
+            if seq is not None:
+                return seq
+        if timeout is not None:
+            self._wait_for_space(timeout)
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO records (title, record_no, user_id, created_at, created_date, row, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (title, record_no, user_id or None, created_at, jst_date(created_at), row_json, data_json)
+        )
+        if cur.rowcount == 0:
+            return self._existing(conn, title, record_no, row_json, data_json)
+        with self._stats_lock:
+            self._stats["appended"] += 1
+        self._wakeup.set()
+        return cur.lastrowid
+
+    # ---------- 検索 ----------
+    _COLUMNS = "seq, title, record_no, user_id, created_at, created_date, row, data, replicated_at, failed"
+
+    @staticmethod
+    def _to_dict(r):
+        return {
+            "seq": r[0], "title": r[1], "record_no": r[2], "user_id": r[3],
+            "created_at": r[4], "created_date": r[5],
+            "row": json.loads(r[6]), "data": None if r[7] is None else json.loads(r[7]),
+            "replica": "failed" if r[9] else ("written" if r[8] is not None else "pending"),
+        }
+
+    def get(self, record_no, title=None):
+        """注文番号・見積番号で1件引く。無ければ None"""
+        sql = f"SELECT {self._COLUMNS} FROM records WHERE record_no = ?"
+        params = [record_no]
+        if title is not None:
+            sql += " AND title = ?"
+            params.append(title)
+        r = self._conn().execute(sql + " LIMIT 1", params).fetchone()
+        return None if r is None else self._to_dict(r)
+
+    def find_by_user(self, user_id, title=None, limit=50):
+        """LINE ユーザーIDの記録を新しい順に返す"""
+        sql = f"SELECT {self._COLUMNS} FROM records WHERE user_id = ?"
+        params = [user_id]
+        if title is not None:
+            sql += " AND title = ?"
+            params.append(title)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        return [self._to_dict(r) for r in self._conn().execute(sql, params)]
+
+    def iter_by_date(self, date_from, date_to=None, title=None):
+        """日本時間の日付 (YYYY-MM-DD) の範囲の記録を古い順に返す (1件ずつ読むので件数が多くてもよい)"""
+        sql = f"SELECT {self._COLUMNS} FROM records WHERE created_date BETWEEN ? AND ?"
+        params = [date_from, date_to or date_from]
+        if title is not None:
+            sql += " AND title = ?"
+            params.append(title)
+        for r in self._conn().execute(sql + " ORDER BY created_date, seq", params):
+            yield self._to_dict(r)
+
+    def user_ids(self, title=None):
+        """記録のある LINE ユーザーID (最初に記録された順)"""
+        sql = "SELECT user_id FROM records WHERE user_id IS NOT NULL"
+        params = []
+        if title is not None:
+            sql += " AND title = ?"
+            params.append(title)
+        sql += " GROUP BY user_id ORDER BY MIN(seq)"
+        return [r[0] for r in self._conn().execute(sql, params)]
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+        conn = self._conn()
+        data["unreplicated"] = conn.execute(
+            "SELECT COUNT(*) FROM records WHERE replicated_at IS NULL AND failed = 0").fetchone()[0]
+        data["failed"] = conn.execute("SELECT COUNT(*) FROM records WHERE failed = 1").fetchone()[0]
+        data["max_backlog"] = self.max_backlog
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM records WHERE replicated_at IS NULL AND failed = 0").fetchone()[0]
+        data["replication_lag_seconds"] = 0.0 if oldest is None else max(0.0, time.time() - oldest)
+        return data
+
+    # ---------- 複製 ----------
+    def _claim(self, owner):
+        """未複製 (またはリース切れ) の行を1ワークシート分だけ取得する"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            first = conn.execute(
+                "SELECT title FROM records WHERE replicated_at IS NULL AND failed = 0"
+                " AND (claimed_by IS NULL OR claimed_at < ?) ORDER BY seq LIMIT 1",
+                (now - self.lease_seconds,)
+            ).fetchone()
+            if first is None:
+                conn.execute("COMMIT")
+                return None, []
+            title = first[0]
+            rows = conn.execute(
+                "SELECT seq, row, record_no FROM records WHERE replicated_at IS NULL AND failed = 0"
+                " AND title = ? AND (claimed_by IS NULL OR claimed_at < ?) ORDER BY seq LIMIT ?",
+                (title, now - self.lease_seconds, self.batch_size)
+            ).fetchall()
+            conn.executemany("UPDATE records SET claimed_by = ?, claimed_at = ? WHERE seq = ?",
+                             [(owner, now, seq) for seq, _, _ in rows])
+            conn.execute("COMMIT")
+            return title, rows
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def replicate(self):
+        """
+        未複製の行をワークシートごとに append_rows で書き込み、書き込めた行数を返す。
+        再試行対象のエラーはそのまま送出する。
+        """
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        conn = self._conn()
+        sent = 0
+        while True:
+            title, claimed = self._claim(owner)
+            if not claimed:
+                return sent
+            seqs = [(seq,) for seq, _, _ in claimed]
+            record_nos = [no for _, _, no in claimed if no is not None]
+            lease = self._keep_lease(owner, seqs)
+            try:
+                self.append_rows(title, [json.loads(row) for _, row, _ in claimed])
+            except Exception as e:
+                if is_retryable_error(e):
+                    conn.executemany("UPDATE records SET claimed_by = NULL, claimed_at = NULL WHERE seq = ?", seqs)
+                    raise
+                conn.executemany(
+                    "UPDATE records SET failed = 1, last_error = ?, claimed_by = NULL, claimed_at = NULL"
+                    " WHERE seq = ?", [(repr(e), seq) for (seq,) in seqs]
+                )
+                with self._stats_lock:
+                    self._stats["failed_rows"] += len(seqs)
+                if self.logger:
+                    self.logger.error("スプレッドシートへの複製に失敗しました (%s, %d 行): %r", title, len(seqs), e)
+                self._notify(self.on_failed, title, record_nos, e)
+                continue
+            finally:
+                lease.set()
+                with self._stats_lock:
+                    self._stats["api_calls"] += 1
+
+            now = time.time()
+            conn.executemany("UPDATE records SET replicated_at = ?, claimed_by = NULL, claimed_at = NULL"
+                             " WHERE seq = ?", [(now, seq) for (seq,) in seqs])
+            sent += len(seqs)
+            with self._stats_lock:
+                self._stats["replicated_rows"] += len(seqs)
+            with self._space:
+                self._space.notify_all()
+            self._notify(self.on_replicated, title, record_nos)
+
+    def _keep_lease(self, owner, seqs):
+        """
+        取得した行のリースを lease_seconds / 3 ごとに延長するスレッドを立てる。返した Event を set すると止まる。
+        (append_rows が遅くてもリースが切れず、他のワーカーが同じ行を二重に書き込まない)
+        """
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    self._conn().executemany(
+                        "UPDATE records SET claimed_at = ? WHERE seq = ? AND claimed_by = ?",
+                        [(time.time(), seq, owner) for (seq,) in seqs]
+                    )
+                except sqlite3.Error as e:
+                    if self.logger:
+                        self.logger.warning("複製中の行のリースを延長できませんでした: %r", e)
+
+        threading.Thread(target=renew, name="order-journal-lease", daemon=True).start()
+        return done
+
+    def failed_records(self, title=None, limit=100):
+        """failed の行 (seq, title, record_no, created_at, last_error) を古い順に返す"""
+        sql = "SELECT seq, title, record_no, created_at, last_error FROM records WHERE failed = 1"
+        params = []
+        if title is not None:
+            sql += " AND title = ?"
+            params.append(title)
+        sql += " ORDER BY seq LIMIT ?"
+        params.append(limit)
+        keys = ("seq", "title", "record_no", "created_at", "last_error")
+        return [dict(zip(keys, r)) for r in self._conn().execute(sql, params)]
+
+    def requeue_failed(self, title=None):
+        """failed の行を複製し直す。対象の行数を返す"""
+        sql = "UPDATE records SET failed = 0, last_error = NULL WHERE failed = 1"
+        params = []
+        if title is not None:
+            sql += " AND title = ?"
+            params.append(title)
+        count = self._conn().execute(sql, params).rowcount
+        self._wakeup.set()
+        return count
+
+    def _notify(self, callback, title, record_nos, *args):
+        if callback is None or not record_nos:
+            return
+        try:
+            callback(title, record_nos, *args)
+        except Exception:
+            if self.logger:
+                self.logger.exception("複製結果の通知に失敗しました (%s)", title)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.replicate()
+                self._failures = 0
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats["retries"] += 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** min(self._failures, 16)))
+                self._failures += 1
+                if self.logger:
+                    self.logger.warning("スプレッドシートへの複製を %.1f 秒後に再試行します: %r", delay, e)
+                self._stop.wait(delay)
+
+    # ---------- 旧書き込みキューからの移行 ----------
+    def import_sheet_queue(self, queue_path):
+        """
+        以前の書き込みキュー (sheet_write_queue.sqlite3) に残っている未送信の行をジャーナルに移す。移した行数を返す。
+        複数プロセスで同時に呼んでも、キュー側のトランザクションで1回しか移さない。
+        """
+        if not os.path.exists(queue_path):
+            return 0
+        queue = sqlite3.connect(queue_path, timeout=30, isolation_level=None)
+        try:
+            if not queue.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pending'").fetchone():
+                return 0
+            queue.execute("BEGIN IMMEDIATE")
+            try:
+                rows = queue.execute("SELECT id, title, row, created_at, ref FROM pending ORDER BY id").fetchall()
+                for _, title, row, created_at, ref in rows:
+                    # 以前のキューで受付済みの行なので、上限を超えていても移す
+                    self._append(title, json.loads(row), ref, None, None, created_at, timeout=None)
+                queue.executemany("DELETE FROM pending WHERE id = ?", [(r[0],) for r in rows])
+                queue.execute("COMMIT")
+            except Exception:
+                queue.execute("ROLLBACK")
+                raise
+            return len(rows)
+        finally:
+            queue.close()
+
+    # ---------- スレッド管理 ----------
+    def _ensure_started(self):
+        # gunicorn の fork 後は子プロセスでスレッドを立て直す
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="order-journal", daemon=True)
+            self._thread.start()
+
+    def start(self):
+        """記録が無くても、起動直後から未複製の行を書き込む"""
+        self._ensure_started()
+
+    def stop(self, replicate=True):
+        """レプリケーターを止める。replicate=True なら残りを1回書き込んでみる"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        if replicate:
+            try:
+                self.replicate()
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning("終了時の複製に失敗しました (次回起動時に書き込み): %r", e)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="注文ジャーナルの複製状況を確認し、failed の行を送り直す")
+    parser.add_argument("command", choices=("stats", "failed", "requeue"))
+    parser.add_argument("--path", default=os.environ.get("ORDER_JOURNAL_PATH", "order_journal.sqlite3"),
+                        help="ジャーナルの SQLite ファイル")
+    parser.add_argument("--title", help="対象のワークシート (省略時はすべて)")
+    parser.add_argument("--limit", type=int, default=100, help="failed で表示する行数")
+    args = parser.parse_args()
+
+    # 複製は動いている Bot のレプリケーターが行う (ここでは状態を変えるだけ)
+    journal = OrderJournal(args.path, append_rows=None)
+    if args.command == "stats":
+        stats = journal.stats()
+        print(f"未複製 {stats['unreplicated']} 行 / failed {stats['failed']} 行"
+              f" / 複製の遅れ {stats['replication_lag_seconds']:.0f} 秒")
+    elif args.command == "failed":
+        for r in journal.failed_records(args.title, args.limit):
+            created = datetime.fromtimestamp(r["created_at"], JST).strftime("%Y/%m/%d %H:%M:%S")
+            print(f"{r['seq']}\t{r['title']}\t{r['record_no'] or ''}\t{created}\t{r['last_error']}")
+    else:
+        count = journal.requeue_failed(args.title)
+        print(f"{count} 行を送り直し待ちに戻しました")
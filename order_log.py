@@ -0,0 +1,292 @@
+"""
+Web オーダーの受付ログ
+
+フォーム送信時は注文を SQLite (WAL) に1行書くだけで応答し、
+スプレッドシート登録・LINE 通知などの後処理はバックグラウンドのワーカーが行う。
+後処理は steps に名前と関数を渡して登録する。関数は注文 (dict) を受け取り、
+成功したら次の状態 (文字列) を返す。例外は 429/5xx/ネットワークなら指数バックオフで再試行し、
+それ以外と max_attempts 回の失敗は "failed" として残す。
+
+各ステップの状態は
+  pending → (関数の戻り値: "queued" / "done" / "skipped" など) → 外部からの mark() で "written" など
+と進み、status() でまとめて確認できる。ワーカーはリースで注文を取得するので、
+同じファイルを複数の gunicorn ワーカーで共有しても二重に処理しない。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from order_ids import DuplicateIdError
+from retry_policy import is_retryable_error
+
+PENDING = "pending"
+FAILED = "failed"
+
+
+class OrderLog:
+    def __init__(self, path, steps, poll_interval=1.0, lease_seconds=120.0,
+                 max_attempts=8, backoff_base=2.0, backoff_max=300.0, done_states=None, logger=None):
+        """
+        steps       : {ステップ名: 関数(order) -> 次の状態} (この順に実行する)
+        done_states : {ステップ名: 完了とみなす状態の集合}。省略時は pending / failed 以外すべて
+        """
+        self.path = path
+        self.steps = steps
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.done_states = done_states or {}
+        self.logger = logger
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"accepted": 0, "step_runs": 0, "retries": 0, "failed_steps": 0}
+        self._init_db()
+
+    # ---------- SQLite ----------
+    def _conn(self):
+        # スレッドごと・プロセスごとに接続を持つ (fork 前の接続は使わない)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            " order_no TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " steps TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " next_attempt_at REAL NOT NULL,"
+            " claimed_by TEXT,"
+            " claimed_at REAL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " open INTEGER NOT NULL DEFAULT 1)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS orders_due ON orders (open, next_attempt_at)")
+
+    # ---------- 受付 ----------
+    def accept(self, order_no, data, skip=()):
+        """
+        注文を記録し、後処理を予約する。skip に入れたステップは "skipped" で記録する。
+        同じ注文番号・同じ内容の注文が既にあれば何もしない。内容が違う場合は DuplicateIdError。
+        """
+        self._ensure_started()
+        now = time.time()
+        steps = {name: ("skipped" if name in skip else PENDING) for name in self.steps}
+        data_json = json.dumps(data, ensure_ascii=False)
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO orders (order_no, data, steps, next_attempt_at, created_at, updated_at, open)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (order_no, data_json, json.dumps(steps), now, now, now, int(PENDING in steps.values()))
+        )
+        if cur.rowcount == 0:
+            existing = conn.execute("SELECT data FROM orders WHERE order_no = ?", (order_no,)).fetchone()
+            if existing is not None and existing[0] != data_json:
+                raise DuplicateIdError(f"注文番号 {order_no} は別の注文で使われています")
+            return
+        with self._stats_lock:
+            self._stats["accepted"] += 1
+        self._wakeup.set()
+
+    def mark(self, order_nos, step, state):
+        """ステップの状態を外部から進める (スプレッドシートへの書き込み完了通知など)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for order_no in order_nos:
+                row = conn.execute("SELECT steps FROM orders WHERE order_no = ?", (order_no,)).fetchone()
+                if row is None:
+                    continue
+                steps = json.loads(row[0])
+                steps[step] = state
+                conn.execute(
+                    "UPDATE orders SET steps = ?, updated_at = ? WHERE order_no = ?",
+                    (json.dumps(steps), time.time(), order_no)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---------- 確認 ----------
+    def _overall(self, steps):
+        if FAILED in steps.values():
+            return "failed"
+        for name, state in steps.items():
+            done = self.done_states.get(name)
+            if state == PENDING or (done is not None and state not in done):
+                return "processing"
+        return "completed"
+
+    def status(self, order_no):
+        """注文の進み具合を返す。無ければ None"""
+        row = self._conn().execute(
+            "SELECT steps, attempts, last_error, created_at, updated_at FROM orders WHERE order_no = ?",
+            (order_no,)
+        ).fetchone()
+        if row is None:
+            return None
+        steps = json.loads(row[0])
+        return {
+            "order_no": order_no,
+            "status": self._overall(steps),
+            "steps": steps,
+            "attempts": row[1],
+            "last_error": row[2],
+            "created_at": row[3],
+            "updated_at": row[4],
+        }
+
+    def orders_in_state(self, step, states):
+        """step の状態が states のいずれかの注文を (注文番号, 内容) で返す (移行作業用)"""
+        result = []
+        for order_no, data, steps in self._conn().execute("SELECT order_no, data, steps FROM orders"):
+            if json.loads(steps).get(step) in states:
+                result.append((order_no, json.loads(data)))
+        return result
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+        data["open"] = self._conn().execute("SELECT COUNT(*) FROM orders WHERE open = 1").fetchone()[0]
+        return data
+
+    # ---------- 後処理 ----------
+    def _claim(self, owner):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT order_no, data, steps, attempts FROM orders"
+                " WHERE open = 1 AND next_attempt_at <= ?"
+                " AND (claimed_by IS NULL OR claimed_at < ?)"
+                " ORDER BY next_attempt_at LIMIT 1",
+                (now, now - self.lease_seconds)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE orders SET claimed_by = ?, claimed_at = ? WHERE order_no = ?",
+                    (owner, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _save(self, order_no, steps, attempts, error=None, retry_at=None):
+        # mark() で先に進んだステップは上書きしない
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = json.loads(conn.execute(
+                "SELECT steps FROM orders WHERE order_no = ?", (order_no,)
+            ).fetchone()[0])
+            for name, state in steps.items():
+                if current.get(name) == PENDING:
+                    current[name] = state
+            # 登録を外したステップ (以前の版のもの) が pending のままでも注文は閉じる
+            is_open = any(current.get(name) == PENDING for name in self.steps)
+            conn.execute(
+                "UPDATE orders SET steps = ?, attempts = ?, last_error = ?, next_attempt_at = ?,"
+                " claimed_by = NULL, claimed_at = NULL, updated_at = ?, open = ? WHERE order_no = ?",
+                (json.dumps(current), attempts, error, retry_at or time.time(), time.time(),
+                 int(is_open), order_no)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def process_one(self):
+        """予定の来た注文を1件処理する。処理した場合 True"""
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        row = self._claim(owner)
+        if row is None:
+            return False
+        order_no, data, steps, attempts = row
+        order = json.loads(data)
+        steps = json.loads(steps)
+
+        for name, func in self.steps.items():
+            if steps.get(name) != PENDING:
+                continue
+            with self._stats_lock:
+                self._stats["step_runs"] += 1
+            try:
+                steps[name] = func(order) or "done"
+            except Exception as e:
+                attempts += 1
+                if is_retryable_error(e) and attempts < self.max_attempts:
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+                    with self._stats_lock:
+                        self._stats["retries"] += 1
+                    if self.logger:
+                        self.logger.warning("注文 %s の %s を %.0f 秒後に再試行します: %r", order_no, name, delay, e)
+                    self._save(order_no, steps, attempts, repr(e), time.time() + delay)
+                    return True
+                steps[name] = FAILED
+                with self._stats_lock:
+                    self._stats["failed_steps"] += 1
+                if self.logger:
+                    self.logger.error("注文 %s の %s に失敗しました: %r", order_no, name, e)
+                self._save(order_no, steps, attempts, repr(e))
+                return True
+        self._save(order_no, steps, attempts)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.process_one():
+                    pass
+            except Exception:
+                if self.logger:
+                    self.logger.exception("注文の後処理でエラーが発生しました")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    # ---------- スレッド管理 ----------
+    def _ensure_started(self):
+        # gunicorn の fork 後は子プロセスでスレッドを立て直す
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="order-log", daemon=True)
+            self._thread.start()
+
+    def start(self):
+        """受付が無くても、起動直後から残っている注文を処理する"""
+        self._ensure_started()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.poll_interval + 5)
@@ -0,0 +1,92 @@
+"""
+キーごとの順序を保つワーカープール
+
+同じキー (LINE ユーザーIDなど) のジョブは必ず同じワーカースレッドに入るので、
+投入順に1つずつ処理される。キューは有限で、満杯なら submit は (timeout 秒まで待っても
+空かなければ) False を返す。順序が崩れるので、断られたジョブを呼び出し側で先に処理しないこと。
+"""
+import os
+import queue
+import threading
+import time
+import zlib
+
+
+class OrderedWorkerPool:
+    def __init__(self, func, workers=4, max_queue=1000, name="worker", logger=None):
+        self.func = func
+        self.workers = workers
+        self.max_queue = max_queue
+        self.name = name
+        self.logger = logger
+
+        self._queues = []
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "processed": 0, "errors": 0, "rejected": 0,
+                       "wait_total": 0.0, "wait_max": 0.0}
+
+    def _ensure_started(self):
+        # gunicorn の fork 後は子プロセスでスレッドを立て直す
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            per_worker = max(1, self.max_queue // self.workers)
+            self._queues = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+            self._threads = []
+            for i, q in enumerate(self._queues):
+                t = threading.Thread(target=self._run, args=(q,), name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._pid = os.getpid()
+
+    def submit(self, key, *args, timeout=0):
+        """key のワーカーに func(*args) を積む。満杯なら最大 timeout 秒待ち、それでも空かなければ False"""
+        self._ensure_started()
+        slot = zlib.crc32(str(key).encode("utf-8")) % self.workers
+        try:
+            if timeout > 0:
+                self._queues[slot].put((time.monotonic(), args), timeout=timeout)
+            else:
+                self._queues[slot].put_nowait((time.monotonic(), args))
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            return False
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        return True
+
+    def _run(self, q):
+        while True:
+            enqueued_at, args = q.get()
+            wait = time.monotonic() - enqueued_at
+            try:
+                self.func(*args)
+            except Exception:
+                with self._stats_lock:
+                    self._stats["errors"] += 1
+                if self.logger:
+                    self.logger.exception("%s: ジョブの処理に失敗しました", self.name)
+            finally:
+                with self._stats_lock:
+                    self._stats["processed"] += 1
+                    self._stats["wait_total"] += wait
+                    self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+                q.task_done()
+
+    def depth(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+        wait_total = data.pop("wait_total")
+        data["wait_avg"] = wait_total / data["processed"] if data["processed"] else 0.0
+        data["depth"] = self.depth()
+        data["workers"] = self.workers
+        return data
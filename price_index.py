@@ -0,0 +1,202 @@
+"""
+PRICE_TABLE の検索用インデックス
+
+価格表は商品名・割引区分をコード化し、料金列を array で持つコンパクト形式に変換する。
+各行は row["unit_price"] のように参照できる読み取り専用ビュー (PriceRow) として返す。
+(商品名, 割引区分) ごとに枚数帯の下限を昇順に並べておき、bisect で該当行を引く。
+読み込み時に枚数帯の重複・抜けを検出したら PriceTableError を送出する。
+
+インデックスは version (価格表の版) を持つ。見積りは1件ごとに1つのインデックスだけを使い、
+そのインデックスの version を記録する。差し替え中に始まった見積りは古い版のまま計算を終える。
+"""
+import hashlib
+import json
+import sys
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping
+
+from PRICE_TABLE_2025 import PRICE_TABLE
+
+# 数値列 (すべて整数円 / 枚数)
+PRICE_FIELDS = (
+    "min_qty", "max_qty", "unit_price", "color_add", "pos_add", "fullcolor_add",
+    "set_name_num", "big_name", "small_name", "big_num", "small_num",
+)
+ROW_KEYS = ("item", "discount_type") + PRICE_FIELDS
+
+
+class PriceTableError(ValueError):
+    """価格表の形式が不正、または枚数帯が重複している/抜けている"""
+
+
+class CompactPriceTable:
+    """
+    PRICE_TABLE (dict のリスト) を列指向で持つ価格表。
+    商品名・割引区分は intern した文字列のコード、料金は array('i') の列になる。
+    """
+
+    def __init__(self, rows):
+        self.item_names = []
+        self.discount_types = []
+        item_codes = {}
+        discount_codes = {}
+        self.item_col = array("H")
+        self.discount_col = array("B")
+        self.columns = {field: array("i") for field in PRICE_FIELDS}
+
+        for n, row in enumerate(rows):
+            missing = [k for k in ROW_KEYS if k not in row]
+            if missing:
+                raise PriceTableError(f"{n}行目: 列が不足しています {missing}")
+
+            item = row["item"]
+            if item not in item_codes:
+                item_codes[item] = len(self.item_names)
+                self.item_names.append(sys.intern(item))
+            discount = row["discount_type"]
+            if discount not in discount_codes:
+                discount_codes[discount] = len(self.discount_types)
+                self.discount_types.append(sys.intern(discount))
+
+            self.item_col.append(item_codes[item])
+            self.discount_col.append(discount_codes[discount])
+            for field in PRICE_FIELDS:
+                self.columns[field].append(int(row[field]))
+
+        self.item_names = tuple(self.item_names)
+        self.discount_types = tuple(self.discount_types)
+        self.rows = tuple(PriceRow(self, i) for i in range(len(self.item_col)))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __getitem__(self, i):
+        return self.rows[i]
+
+
+class PriceRow(Mapping):
+    """CompactPriceTable の1行を dict と同じ書き方で読むためのビュー"""
+
+    __slots__ = ("_table", "_i")
+
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+
+    def __getitem__(self, key):
+        table = self._table
+        if key == "item":
+            return table.item_names[table.item_col[self._i]]
+        if key == "discount_type":
+            return table.discount_types[table.discount_col[self._i]]
+        try:
+            return table.columns[key][self._i]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(ROW_KEYS)
+
+    def __len__(self):
+        return len(ROW_KEYS)
+
+    def __repr__(self):
+        return f"PriceRow({dict(self)!r})"
+
+
+def rows_digest(rows):
+    """価格表の内容から決まる短いハッシュ"""
+    payload = json.dumps([[row[k] for k in ROW_KEYS] for row in rows], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+class PriceIndex:
+    def __init__(self, rows, version=None):
+        self.table = CompactPriceTable(rows)
+        # 版の指定が無ければ内容のハッシュを版とする
+        self.version = version or f"sha256:{rows_digest(self.table)}"
+        groups = {}
+        for row in self.table:
+            groups.setdefault((row["item"], row["discount_type"]), []).append(row)
+
+        # { (item, discount_type): (array([min_qty, ...]), (PriceRow, ...)) }
+        self._tiers = {}
+        for key, tier_rows in groups.items():
+            tier_rows.sort(key=lambda r: r["min_qty"])
+            self._validate(key, tier_rows)
+            self._tiers[key] = (array("i", (r["min_qty"] for r in tier_rows)), tuple(tier_rows))
+
+    @staticmethod
+    def _validate(key, tier_rows):
+        prev = None
+        for row in tier_rows:
+            if row["min_qty"] > row["max_qty"]:
+                raise PriceTableError(f"{key}: min_qty > max_qty ({row['min_qty']} > {row['max_qty']})")
+            if prev is not None:
+                if row["min_qty"] <= prev["max_qty"]:
+                    raise PriceTableError(
+                        f"{key}: 枚数帯が重複しています ({prev['min_qty']}-{prev['max_qty']} / "
+                        f"{row['min_qty']}-{row['max_qty']})"
+                    )
+                if row["min_qty"] != prev["max_qty"] + 1:
+                    raise PriceTableError(
+                        f"{key}: 枚数帯が抜けています ({prev['max_qty'] + 1}-{row['min_qty'] - 1})"
+                    )
+            prev = row
+
+    def find(self, item_name, discount_type, quantity):
+        """該当する行を返す。該当しない場合は None"""
+        tiers = self._tiers.get((item_name, discount_type))
+        if tiers is None:
+            return None
+        mins, tier_rows = tiers
+        i = bisect_right(mins, quantity) - 1
+        if i < 0:
+            return None
+        row = tier_rows[i]
+        if quantity > row["max_qty"]:
+            return None
+        return row
+
+    def keys(self):
+        return self._tiers.keys()
+
+
+PRICE_INDEX = PriceIndex(PRICE_TABLE, version="PRICE_TABLE_2025")
+
+# 価格表の差し替え時に呼ぶコールバック (見積りマトリクスの再計算など)
+_reload_listeners = []
+
+
+def on_price_reload(callback):
+    """価格表の差し替え後に callback(index) を呼ぶよう登録する"""
+    _reload_listeners.append(callback)
+    return callback
+
+
+def reload_price_index(rows, version=None, validate=None):
+    """
+    rows から新しいインデックスを作って差し替える。
+    validate(index) を渡すと差し替え前に呼ぶ (カタログとの突き合わせなど)。
+    検証に失敗した場合は例外を送出し、現在のインデックスはそのまま。
+    """
+    global PRICE_INDEX
+    index = PriceIndex(rows, version=version)
+    if validate is not None:
+        validate(index)
+    PRICE_INDEX = index
+    for callback in list(_reload_listeners):
+        callback(index)
+    return index
+
+
+def find_price_row(item_name, discount_type, quantity, index=None):
+    """
+    PRICE_TABLE から該当する行を探し返す。該当しない場合は None
+    index を省略すると現在のインデックスを使う。
+    """
+    return (index or PRICE_INDEX).find(item_name, discount_type, quantity)
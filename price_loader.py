@@ -0,0 +1,333 @@
+"""
+価格表ファイルの読み込みと差し替え (再起動なし)
+
+PRICE_TABLE_PATH に置いた価格表ファイルを監視し、更新されたら読み込んで検証し、
+price_index.reload_price_index で新しいインデックスに差し替える。
+インデックス・見積りマトリクスの作成はすべて監視スレッドで行い、リクエスト処理では行わない。
+検証に失敗したファイルは使わず、それまでの版で動き続ける。
+
+差し替えられるのは既存の商品・割引区分の価格表の行 (枚数帯と各料金列) だけ。
+商品の追加・削除、割引区分の変更は拒否する (カタログ・フォームは起動時に作るため)。
+プリントカラーの料金 (COLOR_ATTR_MAP / BACK_NAME_FEE / FULLCOLOR_SIZE_FEE など) は
+PRICE_TABLE_2025.py の定数のままで差し替えの対象外なので、変更する場合は再デプロイする。
+
+ファイル形式:
+- JSON: {"version": "2026-04", "rows": [{...}, ...]} または行のリスト
+- CSV : 1行目が列名 (item, discount_type, min_qty, ..., small_num)。スプレッドシートの書き出しをそのまま使える
+JSON に version が無い場合と CSV は、ファイル名と内容のハッシュを版とする。
+
+スプレッドシートで価格を管理する場合は PriceSheetRefresher がワークシートを取得し、
+検証に通った内容だけをスナップショット (上記 JSON 形式) に書き出す。
+各プロセスはそのスナップショットを PriceTableWatcher で読むので、起動時にネットワークを待たず、
+Google に繋がらない間も最後に取得できた版で動き続ける。
+
+    python price_loader.py price_table_2026.json   # 差し替えずに検証だけ行う
+"""
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import price_index
+from price_index import PRICE_FIELDS, ROW_KEYS, PriceTableError, rows_digest
+from product_catalog import CatalogError, validate_catalog
+
+
+def load_price_file(path):
+    """価格表ファイルを読み、(行のリスト, 版) を返す"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()[:12]
+    default_version = f"{os.path.splitext(os.path.basename(path))[0]}@{digest}"
+    text = raw.decode("utf-8-sig")
+
+    if path.lower().endswith(".csv"):
+        rows = list(csv.DictReader(text.splitlines()))
+        return rows, default_version
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise PriceTableError(f"{path}: JSON として読めません ({e})") from None
+    if isinstance(data, dict):
+        rows, version = data.get("rows"), data.get("version") or default_version
+    else:
+        rows, version = data, default_version
+    if not isinstance(rows, list):
+        raise PriceTableError(f"{path}: 行のリストがありません")
+    return rows, str(version)
+
+
+def validate_price_index(index):
+    """
+    差し替え前の検証。枚数帯の検証は PriceIndex の作成時に済んでいるので、
+    差し替えられる範囲 (既存の商品・割引区分の価格) に収まっているかを確かめる。
+    """
+    if not len(index.table):
+        raise PriceTableError("価格表が空です")
+    current = {discount_type for _, discount_type in price_index.PRICE_INDEX.keys()}
+    discount_types = {discount_type for _, discount_type in index.keys()}
+    if discount_types != current:
+        raise PriceTableError(
+            f"割引区分は差し替えで変更できません (現在 {sorted(current)} / 新しい価格表 {sorted(discount_types)})。"
+            "再デプロイが必要です"
+        )
+    try:
+        validate_catalog(index)
+    except CatalogError as e:
+        raise PriceTableError(
+            f"{e} 差し替えで変えられるのは既存商品の価格だけです。商品の追加・削除は再デプロイが必要です"
+        ) from None
+
+
+def reload_from_file(path):
+    """価格表ファイルを読み込み、検証してから差し替える。新しいインデックスを返す"""
+    rows, version = load_price_file(path)
+    return price_index.reload_price_index(rows, version=version, validate=validate_price_index)
+
+
+class PriceTableWatcher:
+    """
+    path の更新 (更新時刻・サイズ) を interval 秒ごとに確認し、変わっていれば読み込み直す。
+    gunicorn の fork 後は子プロセスで監視スレッドを立て直す。
+    """
+
+    def __init__(self, path, interval=10.0, logger=None):
+        self.path = path
+        self.interval = interval
+        self.logger = logger
+        self._signature = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._stats = {"reloads": 0, "failures": 0, "loaded_at": None, "last_error": None}
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def check(self):
+        """ファイルが変わっていれば読み込んで差し替える。差し替えた場合 True"""
+        with self._lock:
+            signature = self._file_signature()
+            if signature is None or signature == self._signature:
+                return False
+            # 失敗しても同じ内容を何度も読み直さないよう、先に記録する
+            self._signature = signature
+            try:
+                index = reload_from_file(self.path)
+            except Exception as e:
+                self._stats["failures"] += 1
+                self._stats["last_error"] = repr(e)
+                if self.logger:
+                    self.logger.error("価格表 %s を読み込めませんでした (現在の版 %s のまま): %r",
+                                      self.path, price_index.PRICE_INDEX.version, e)
+                return False
+            self._stats["reloads"] += 1
+            self._stats["loaded_at"] = time.time()
+            self._stats["last_error"] = None
+            if self.logger:
+                self.logger.info("価格表を版 %s に差し替えました (%d 行)", index.version, len(index.table))
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="price-table-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        data = dict(self._stats)
+        data["path"] = self.path
+        data["version"] = price_index.PRICE_INDEX.version
+        return data
+
+
+# -----------------------
+# スプレッドシートの価格表 → スナップショット
+# -----------------------
+def rows_from_records(records):
+    """
+    ワークシートの行 (1行目が列名の dict) を価格表の行にする。
+    金額は "1,480" や "¥1,480" のような表示形式でも読む。
+    """
+    rows = []
+    for n, record in enumerate(records, start=2):
+        missing = [k for k in ROW_KEYS if k not in record]
+        if missing:
+            raise PriceTableError(f"{n}行目: 列が不足しています {missing}")
+        if not str(record["item"]).strip():
+            continue  # 空行
+        row = {"item": str(record["item"]).strip(), "discount_type": str(record["discount_type"]).strip()}
+        for field in PRICE_FIELDS:
+            value = str(record[field]).replace(",", "").replace("¥", "").strip()
+            try:
+                row[field] = int(value or 0)
+            except ValueError:
+                raise PriceTableError(f"{n}行目: {field} が数値ではありません ({record[field]!r})") from None
+        rows.append(row)
+    return rows
+
+
+def write_snapshot(path, rows, version, revision=None):
+    """スナップショットを書き出す (一時ファイルに書いてから置き換えるので、読み手が途中の内容を見ることはない)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    payload = {"version": version, "revision": revision, "fetched_at": time.time(), "rows": rows}
+    fd, tmp = tempfile.mkstemp(prefix=".price_snapshot.", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def read_snapshot_meta(path):
+    """スナップショットの (版, リビジョン)。無い・壊れている場合は (None, None)"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("version"), data.get("revision")
+    except (OSError, ValueError, AttributeError):
+        return None, None
+
+
+class PriceSheetRefresher:
+    """
+    スプレッドシートの価格表を interval 秒ごとに確認し、変わっていればスナップショットを書き直す。
+
+    probe()  : 更新の有無を判定する値 (価格表シートの版セル・内容のハッシュなど) を返す
+    fetch()  : ワークシートの行 (dict のリスト) を返す
+    probe の値が前回と同じなら取得しない。probe の値だけが変わった場合 (書式の変更など) も、
+    取得した内容が同じならスナップショットを書き直さない。
+    版は "sheet@<内容のハッシュ>" とする。
+    同じスナップショットを複数プロセスで使う場合も、取得するのはロックを取れた1プロセスだけ。
+    """
+
+    def __init__(self, snapshot_path, probe, fetch, interval=60.0, backoff_max=600.0, logger=None):
+        self.snapshot_path = snapshot_path
+        self.probe = probe
+        self.fetch = fetch
+        self.interval = interval
+        self.backoff_max = backoff_max
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._failures = 0
+        self._revision = None
+        self._stats = {"checks": 0, "fetches": 0, "unchanged": 0, "failures": 0,
+                       "last_success": None, "last_error": None}
+
+    def refresh(self):
+        """
+        1回分の確認。スナップショットを書き直した場合 True。
+        他のプロセスが取得中の場合や、内容が変わっていない場合は False。
+        取得・検証に失敗した場合は例外を送出する (スナップショットはそのまま)。
+        """
+        with open(self.snapshot_path + ".lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self._stats["checks"] += 1
+            revision = self.probe()
+            snapshot_version, snapshot_revision = read_snapshot_meta(self.snapshot_path)
+            if revision is not None and revision in (self._revision, snapshot_revision):
+                self._stats["unchanged"] += 1
+                return False
+
+            rows = rows_from_records(self.fetch())
+            # 書き出す前に、差し替え時と同じ検証を行う
+            index = price_index.PriceIndex(rows, version=f"sheet@{rows_digest(rows)}")
+            validate_price_index(index)
+            self._revision = revision
+            if index.version == snapshot_version:
+                self._stats["unchanged"] += 1
+                return False
+            write_snapshot(self.snapshot_path, rows, index.version, revision)
+            self._stats["fetches"] += 1
+            if self.logger:
+                self.logger.info("スプレッドシートの価格表を取得しました (版 %s, %d 行)", index.version, len(rows))
+            return True
+
+    def _run(self):
+        delay = 0.0  # 起動直後に1回確認する (リクエスト処理とは別スレッド)
+        while not self._stop.wait(delay):
+            try:
+                self.refresh()
+                self._failures = 0
+                self._stats["last_success"] = time.time()
+                delay = self.interval
+            except Exception as e:
+                # Google に繋がらない間もスナップショットの版で動き続ける
+                self._failures += 1
+                self._stats["failures"] += 1
+                self._stats["last_error"] = repr(e)
+                delay = min(self.backoff_max, self.interval * (2 ** min(self._failures - 1, 8)))
+                if self.logger:
+                    self.logger.warning("価格表の取得に失敗しました (%.0f 秒後に再試行、現在の版 %s のまま): %r",
+                                        delay, price_index.PRICE_INDEX.version, e)
+
+    def start(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="price-sheet-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        data = dict(self._stats)
+        data["snapshot_path"] = self.snapshot_path
+        data["revision"] = self._revision
+        return data
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="価格表ファイルを検証する (差し替えはしない)")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    try:
+        rows, version = load_price_file(args.path)
+        index = price_index.PriceIndex(rows, version=version)
+        validate_price_index(index)
+    except Exception as e:
+        print(f"NG: {e}")
+        sys.exit(1)
+    print(f"OK: 版 {index.version} / {len(index.table)} 行 / 商品 {len(index.table.item_names)} 件")
@@ -0,0 +1,429 @@
+"""
+商品カタログ (商品名・品番・商品カラー・カラーNo)
+
+LINE のカンタン見積り (PRODUCT_NAMES) と Web オーダーフォーム (/web_order_catalog.json) の
+商品一覧はすべてここから作る。
+- PRODUCT_INDEX: 商品名 → 品番 → 商品カラー → [カラーNo] の入れ子インデックス
+- プリントカラーの選択肢は PRICE_TABLE_2025 の BACK_NAME_FEE / COLOR_ATTR_MAP から作る
+起動時に価格表と突き合わせ、料金の無い商品があれば CatalogError を送出する。
+"""
+import gzip
+import hashlib
+import json
+import warnings
+
+import price_index
+from PRICE_TABLE_2025 import BACK_NAME_FEE, COLOR_ATTR_MAP
+
+try:
+    import brotli
+except ImportError:  # brotli は任意 (無ければ gzip のみ)
+    brotli = None
+
+class CatalogError(ValueError):
+    """カタログと価格表が一致しない"""
+
+
+# 取扱商品 (LINE の商品選択ボタンの並び順)
+PRODUCT_NAMES = [
+    "ゲームシャツ",
+    "ストライプドライベースボールシャツ",
+    "ドライベースボールシャツ",
+    "ストライプユニフォーム",
+    "バスケシャツ",
+    "ドライTシャツ",
+    "ハイクオリティTシャツ",
+    "ドライポロシャツ",
+    "ドライロングスリーブTシャツ",
+    "クルーネックライトトレーナー",
+    "ジップアップライトパーカー",
+    "フーデッドライトパーカー",
+]
+
+# カラー展開を登録していない (Web フォームには出さず、LINE の簡易見積りだけで扱う) ことが分かっている商品
+PRODUCTS_WITHOUT_COLORS = frozenset({
+    "フーデッドライトパーカー",
+})
+
+# 商品名・品番ごとのカラー展開
+PRODUCT_TABLE = [
+    # 5927-01 ゲームシャツ
+    {"product_no": "5927-01", "product_name": "ゲームシャツ", "color_no": "9816", "color_name": "ホワイト/ホワイト/ブラック"},
+    {"product_no": "5927-01", "product_name": "ゲームシャツ", "color_no": "9887", "color_name": "レッド/ホワイト/ブラック"},
+    {"product_no": "5927-01", "product_name": "ゲームシャツ", "color_no": "9889", "color_name": "アイビーグリーン/ホワイト/ブラック"},
+    {"product_no": "5927-01", "product_name": "ゲームシャツ", "color_no": "9888", "color_name": "コバルトブルー/ホワイト/ブラック"},
+    {"product_no": "5927-01", "product_name": "ゲームシャツ", "color_no": "9856", "color_name": "ブラック/ホワイト/ブラック"},
+
+    # 5982-01 ストライプドライベースボールシャツ / ドライベースボールシャツ
+    {"product_no": "5982-01", "product_name": "ストライプドライベースボールシャツ", "color_no": "1098", "color_name": "ホワイト/ブラックストライプ"},
+    {"product_no": "5982-01", "product_name": "ストライプドライベースボールシャツ", "color_no": "2097", "color_name": "ブラック/ホワイトストライプ"},
+
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "1002", "color_name": "ホワイト/ブラック"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "1095", "color_name": "ホワイト/マリンブルー"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "2001", "color_name": "ブラック/ホワイト"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "2002", "color_name": "ブラック/ブラック"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "6901", "color_name": "ラベンダー/ホワイト"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "6001", "color_name": "ターコイズブルー/ホワイト"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "4801", "color_name": "マリンブルー/ホワイト"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "4001", "color_name": "ネイビー/ホワイト"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "2602", "color_name": "カナリアイエロー/ブラック"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "6402", "color_name": "オレンジ/ブラック"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "6601", "color_name": "トロピカルピンク/ホワイト"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "5602", "color_name": "レッド/ブラック"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "5801", "color_name": "バーガンディ/ホワイト"},
+    {"product_no": "5982-01", "product_name": "ドライベースボールシャツ", "color_no": "5001", "color_name": "アイビーグリーン/ホワイト"},
+
+    # ZD16 ストライプユニフォーム
+    {"product_no": "ZD16", "product_name": "ストライプユニフォーム", "color_no": "zd16223", "color_name": "ホワイトxライトブルー"},
+    {"product_no": "ZD16", "product_name": "ストライプユニフォーム", "color_no": "zd16229", "color_name": "ホワイトxライトパープル"},
+    {"product_no": "ZD16", "product_name": "ストライプユニフォーム", "color_no": "zd16230", "color_name": "ホワイトxホットピンク"},
+    {"product_no": "ZD16", "product_name": "ストライプユニフォーム", "color_no": "zd16227", "color_name": "ホワイトxパープル"},
+    {"product_no": "ZD16", "product_name": "ストライプユニフォーム", "color_no": "zd16226", "color_name": "ホワイトxブラック"},
+    {"product_no": "ZD16", "product_name": "ストライプユニフォーム", "color_no": "zd16221", "color_name": "レッドxブラック"},
+    {"product_no": "ZD16", "product_name": "ストライプユニフォーム", "color_no": "zd16224", "color_name": "ブルーxブラック"},
+
+    # 5992-01 バスケシャツ
+    {"product_no": "5992-01", "product_name": "バスケシャツ", "color_no": "9891", "color_name": "ホワイト/ホワイト/レッド"},
+    {"product_no": "5992-01", "product_name": "バスケシャツ", "color_no": "9893", "color_name": "レッド/ホワイト/レッド"},
+    {"product_no": "5992-01", "product_name": "バスケシャツ", "color_no": "9892", "color_name": "カナリアイエロー/ホワイト/パープル"},
+    {"product_no": "5992-01", "product_name": "バスケシャツ", "color_no": "9890", "color_name": "ブラック/ホワイト/ラベンダー"},
+    {"product_no": "5992-01", "product_name": "バスケシャツ", "color_no": "9856", "color_name": "ブラック/ホワイト/ブラック"},
+
+    # 300-ACT ドライTシャツ
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "001", "color_name": "ホワイト"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "153", "color_name": "シルバーグレー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "002", "color_name": "グレー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "187", "color_name": "ダークグレー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "005", "color_name": "ブラック"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "133", "color_name": "ライトブルー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "033", "color_name": "サックス"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "034", "color_name": "ターコイズブルー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "198", "color_name": "ミディアムブルー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "032", "color_name": "ロイヤルブルー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "171", "color_name": "ジャパンブルー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "097", "color_name": "インディゴ"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "027", "color_name": "メロン"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "026", "color_name": "ミントグリーン"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "096", "color_name": "ミントブルー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "024", "color_name": "ライトグリーン"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "155", "color_name": "ライム"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "194", "color_name": "ブライトグリーン"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "025", "color_name": "グリーン"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "138", "color_name": "アイビーグリーン"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "128", "color_name": "オリーブ"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "037", "color_name": "アーミーグリーン"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "167", "color_name": "メトロブルー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "031", "color_name": "ネイビー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "455", "color_name": "ライトベージュ"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "134", "color_name": "ライトイエロー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "020", "color_name": "イエロー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "165", "color_name": "デイジー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "015", "color_name": "オレンジ"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "038", "color_name": "サンセットオレンジ"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "132", "color_name": "ライトピンク"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "011", "color_name": "ピンク"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "146", "color_name": "ホットピンク"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "010", "color_name": "レッド"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "035", "color_name": "ガーネットレッド"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "112", "color_name": "バーガンディ"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "188", "color_name": "ライトパープル"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "019", "color_name": "ラベンダー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "014", "color_name": "パープル"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "236", "color_name": "コヨーテ"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "047", "color_name": "蛍光イエロー"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "048", "color_name": "蛍光オレンジ"},
+    {"product_no": "300-ACT", "product_name": "ドライTシャツ", "color_no": "049", "color_name": "蛍光ピンク"},
+
+    # 5001-01 ハイクオリティTシャツ
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "001", "color_name": "ホワイト"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "191", "color_name": "バニラホワイト"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "009", "color_name": "オートミール"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "005", "color_name": "アッシュ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "010", "color_name": "ライトグレー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "006", "color_name": "ミックスグレー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "019", "color_name": "ナチュラル"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "545", "color_name": "サンドベージュ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "053", "color_name": "ライトベージュ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "537", "color_name": "サンドカーキ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "052", "color_name": "ダークブラウン"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "072", "color_name": "バーガンディ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "069", "color_name": "レッド"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "232", "color_name": "ハイレッド"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "511", "color_name": "トロピカルピンク"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "066", "color_name": "ピンク"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "574", "color_name": "アプリコット"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "576", "color_name": "ベビーピンク"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "495", "color_name": "ライトピンク"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "064", "color_name": "オレンジ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "022", "color_name": "ゴールド"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "369", "color_name": "バナナ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "190", "color_name": "カナリアイエロー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "021", "color_name": "イエロー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "487", "color_name": "ライトイエロー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "037", "color_name": "メロン"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "024", "color_name": "ミントグリーン"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "575", "color_name": "アップルグリーン"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "029", "color_name": "グリーン"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "497", "color_name": "アイビーグリーン"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "739", "color_name": "ライトオリーブ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "035", "color_name": "シティグリーン"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "488", "color_name": "ライトブルー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "083", "color_name": "アクアブルー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "538", "color_name": "ターコイズブルー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "247", "color_name": "アシッドブルー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "082", "color_name": "サックス"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "085", "color_name": "ロイヤルブルー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "087", "color_name": "インディゴ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "088", "color_name": "スレート"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "086", "color_name": "ネイビー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "584", "color_name": "ダークヘザーネイビー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "717", "color_name": "ダークネイビー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "494", "color_name": "ライトパープル"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "076", "color_name": "ラベンダー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "539", "color_name": "バイオレットパープル"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "062", "color_name": "パープル"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "007", "color_name": "チャコール"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "165", "color_name": "スミ"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "725", "color_name": "ヘザーブラック"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "002", "color_name": "ブラック"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "936", "color_name": "ヘイジーレッド"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "937", "color_name": "ヘイジーイエロー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "935", "color_name": "ヘイジーグリーン"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "934", "color_name": "ヘイジーネイビー"},
+    {"product_no": "5001-01", "product_name": "ハイクオリティTシャツ", "color_no": "933", "color_name": "ヘイジーブラック"},
+
+    # 302-ADP ドライポロシャツ
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "001", "color_name": "ホワイト"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "002", "color_name": "グレー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "187", "color_name": "ダークグレー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "005", "color_name": "ブラック"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "133", "color_name": "ライトブルー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "033", "color_name": "サックス"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "034", "color_name": "ターコイズ"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "032", "color_name": "ロイヤルブルー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "171", "color_name": "ジャパンブルー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "167", "color_name": "メトロブルー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "031", "color_name": "ネイビー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "134", "color_name": "ライトイエロー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "020", "color_name": "イエロー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "165", "color_name": "デイジー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "015", "color_name": "オレンジ"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "038", "color_name": "サンセットオレンジ"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "132", "color_name": "ライトピンク"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "011", "color_name": "ピンク"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "146", "color_name": "ホットピンク"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "010", "color_name": "レッド"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "035", "color_name": "ガーネットレッド"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "112", "color_name": "バーガンディ"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "024", "color_name": "ライトグリーン"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "155", "color_name": "ライム"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "025", "color_name": "グリーン"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "037", "color_name": "アーミーグリーン"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "026", "color_name": "ミントグリーン"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "096", "color_name": "ミントブルー"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "188", "color_name": "ライトパープル"},
+    {"product_no": "302-ADP", "product_name": "ドライポロシャツ", "color_no": "014", "color_name": "パープル"},
+
+    # 304-ALT ドライロングスリーブTシャツ
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "001", "color_name": "ホワイト"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "002", "color_name": "グレー"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "187", "color_name": "ダークグレー"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "005", "color_name": "ブラック"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "026", "color_name": "ミントグリーン"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "133", "color_name": "ライトブルー"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "034", "color_name": "ターコイズ"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "032", "color_name": "ロイヤルブルー"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "031", "color_name": "ネイビー"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "014", "color_name": "パープル"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "134", "color_name": "ライトイエロー"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "165", "color_name": "デイジー"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "015", "color_name": "オレンジ"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "011", "color_name": "ピンク"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "146", "color_name": "ホットピンク"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "010", "color_name": "レッド"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "112", "color_name": "バーガンディ"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "024", "color_name": "ライトグリーン"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "025", "color_name": "グリーン"},
+    {"product_no": "304-ALT", "product_name": "ドライロングスリーブTシャツ", "color_no": "037", "color_name": "アーミーグリーン"},
+
+    # 219-MLC クルーネックライトトレーナー
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "001", "color_name": "ホワイト"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "455", "color_name": "ライトベージュ"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "039", "color_name": "オートミール"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "003", "color_name": "杢グレー"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "005", "color_name": "ブラック"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "175", "color_name": "オーシャンブルー"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "030", "color_name": "ブルー"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "174", "color_name": "ディープネイビー"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "481", "color_name": "バイオレット"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "182", "color_name": "カナリアイエロー"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "178", "color_name": "フラミンゴピンク"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "172", "color_name": "ブライトレッド"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "112", "color_name": "バーガンディ"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "029", "color_name": "ケリーグリーン"},
+    {"product_no": "219-MLC", "product_name": "クルーネックライトトレーナー", "color_no": "037", "color_name": "アーミーグリーン"},
+
+    # 217-MLZ ジップアップライトパーカー
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "001", "color_name": "ホワイト"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "455", "color_name": "ライトベージュ"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "039", "color_name": "オートミール"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "003", "color_name": "杢グレー"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "005", "color_name": "ブラック"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "175", "color_name": "オーシャンブルー"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "030", "color_name": "ブルー"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "174", "color_name": "ディープネイビー"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "481", "color_name": "バイオレット"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "182", "color_name": "カナリアイエロー"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "178", "color_name": "フラミンゴピンク"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "172", "color_name": "ブライトレッド"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "112", "color_name": "バーガンディ"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "029", "color_name": "ケリーグリーン"},
+    {"product_no": "217-MLZ", "product_name": "ジップアップライトパーカー", "color_no": "037", "color_name": "アーミーグリーン"},
+]
+
+# ネーム・番号用の「単色」と「フチ付き」カスタムで使う色一覧
+NAME_NUMBER_SINGLE_COLORS = [
+    "ホワイト", "グレー", "ネイビー", "ブラック", "ライトブルー", "ブルー", "イエロー", "オレンジ",
+    "ピンク", "ホットピンク", "レッド", "パープル", "ライトグリーン", "グリーン", "シルバー", "ゴールド",
+    "グリッターシルバー", "グリッターゴールド", "グリッターピンク",
+]
+NAME_NUMBER_EDGE_COLORS = [
+    "ホワイト", "グレー", "ネイビー", "ブラック", "ライトブルー", "ブルー", "イエロー", "オレンジ",
+    "ピンク", "ホットピンク", "レッド", "パープル", "ライトグリーン", "グリーン",
+]
+
+
+def build_product_index(rows):
+    """商品名 → 品番 → 商品カラー → [カラーNo] (いずれも PRODUCT_TABLE の出現順)"""
+    index = {}
+    for p in rows:
+        color_nos = (index.setdefault(p["product_name"], {})
+                          .setdefault(p["product_no"], {})
+                          .setdefault(p["color_name"], []))
+        if p["color_no"] not in color_nos:
+            color_nos.append(p["color_no"])
+    return index
+
+
+PRODUCT_INDEX = build_product_index(PRODUCT_TABLE)
+
+
+def validate_catalog(index=None):
+    """
+    カタログと価格表を突き合わせる。
+    - カタログの商品が価格表に無い (早割/通常 のどちらか) → CatalogError
+    - 価格表の商品が PRODUCT_NAMES に無い → CatalogError
+    - PRODUCT_NAMES / ネーム・番号の色一覧に重複がある → CatalogError
+    - PRODUCT_NAMES の商品にカラー展開が無い (フォームで選べない) → 警告のみ
+      (PRODUCTS_WITHOUT_COLORS に載せた商品は承知の上なので警告しない)
+    """
+    for label, values in (("PRODUCT_NAMES", PRODUCT_NAMES),
+                          ("NAME_NUMBER_SINGLE_COLORS", NAME_NUMBER_SINGLE_COLORS),
+                          ("NAME_NUMBER_EDGE_COLORS", NAME_NUMBER_EDGE_COLORS)):
+        duplicated = sorted({v for v in values if values.count(v) > 1})
+        if duplicated:
+            raise CatalogError(f"{label} に重複があります: {duplicated}")
+
+    index = index or price_index.PRICE_INDEX
+    priced = {}
+    for item, discount_type in index.keys():
+        priced.setdefault(item, set()).add(discount_type)
+    discount_types = set().union(*priced.values()) if priced else set()
+
+    for name in list(PRODUCT_NAMES) + [n for n in PRODUCT_INDEX if n not in PRODUCT_NAMES]:
+        if priced.get(name) != discount_types:
+            raise CatalogError(f"商品「{name}」の価格が価格表にありません。")
+    unlisted = [item for item in priced if item not in PRODUCT_NAMES]
+    if unlisted:
+        raise CatalogError(f"価格表の商品が PRODUCT_NAMES にありません: {unlisted}")
+    missing_colors = [name for name in PRODUCT_NAMES
+                      if name not in PRODUCT_INDEX and name not in PRODUCTS_WITHOUT_COLORS]
+    if missing_colors:
+        warnings.warn(f"カラー展開が未登録のため Web フォームに表示されない商品があります: {missing_colors}")
+
+
+def catalog_payload():
+    """
+    フォームの JavaScript に渡すカタログ。
+    連動セレクトはそれぞれ1回の参照で候補が引けるよう、親の選択値を連結したキーで持つ
+    (キーの順序が変わらないよう値はすべて配列)。
+    """
+    sep = "\t"
+    numbers, color_names, color_nos = {}, {}, {}
+    for name, by_no in PRODUCT_INDEX.items():
+        numbers[name] = list(by_no)
+        for no, by_color in by_no.items():
+            color_names[name + sep + no] = list(by_color)
+            for color_name, nos in by_color.items():
+                color_nos[name + sep + no + sep + color_name] = nos
+
+    return {
+        "productIndex": {
+            "sep": sep,
+            "names": list(PRODUCT_INDEX),
+            "numbers": numbers,          # 商品名 → [品番]
+            "colorNames": color_names,   # 商品名\t品番 → [商品カラー]
+            "colorNos": color_nos,       # 商品名\t品番\t商品カラー → [カラーNo]
+        },
+        # ネーム＆番号系 (属性 = 自身の名前) → 通常のプリントカラー の順
+        "printColorOptions": (
+            [{"name": name, "attribute": name} for name in BACK_NAME_FEE]
+            + [{"name": name, "attribute": attr} for name, attr in COLOR_ATTR_MAP.items()]
+        ),
+        "nameNumGroup": list(BACK_NAME_FEE),
+        "nameNumberSingleColors": NAME_NUMBER_SINGLE_COLORS,
+        "nameNumberEdgeColors": NAME_NUMBER_EDGE_COLORS,
+    }
+
+
+class CatalogAsset:
+    """
+    カタログ JSON を1度だけシリアライズ・圧縮して保持する。
+    version は内容のハッシュで、URL (?v=) と ETag に使う。
+    """
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.version = hashlib.sha256(self.body).hexdigest()[:16]
+        self.encoded = {"gzip": gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body)
+
+    def negotiate(self, accept_encoding):
+        """
+        Accept-Encoding から (Content-Encoding, 本文) を選ぶ。
+        q 値の高いものを優先し (同じなら br → gzip)、q=0 の方式は使わない。
+        """
+        qvalues = parse_accept_encoding(accept_encoding)
+        wildcard = qvalues.get("*", 0.0)
+        best, best_q = None, 0.0
+        for encoding in ("br", "gzip"):
+            q = qvalues.get(encoding, wildcard)
+            if encoding in self.encoded and q > best_q:
+                best, best_q = encoding, q
+        if best is None:
+            return None, self.body
+        return best, self.encoded[best]
+
+
+def parse_accept_encoding(header):
+    """Accept-Encoding ヘッダーを {方式: q 値} にする (q 省略は 1、不正な q は 0 扱い)"""
+    qvalues = {}
+    for part in (header or "").split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[name.lower()] = q
+    return qvalues
+
+
+validate_catalog()
+CATALOG_ASSET = CatalogAsset(catalog_payload())
@@ -0,0 +1,231 @@
+"""
+LINE「カンタン見積り」の料金計算
+
+選択肢 (商品・割引区分・枚数・プリント位置・色数・背ネーム) は有限なので、
+起動時と価格表の差し替え時に全組み合わせの (合計金額, 単価) を QuoteMatrix に計算しておき、
+calculate_estimate は配列を1回読むだけにする。
+マトリクスは作成元の価格表インデックスと版 (version) を持ち、見積りはその版で計算・記録される。
+
+    python quick_estimate.py --export quotes.csv   # 営業確認用に全組み合わせを書き出す
+"""
+import csv
+import sys
+from array import array
+
+import price_index
+from product_catalog import PRODUCT_NAMES
+
+# 商品名 (flex_item_select の並び順)
+ESTIMATE_ITEMS = PRODUCT_NAMES
+
+DISCOUNT_TYPES = ["早割", "通常"]
+
+# 枚数選択肢を実数化
+QUANTITY_MAP = {
+    "20～29枚": 20,
+    "30～39枚": 30,
+    "40～49枚": 40,
+    "50～99枚": 50,
+    "100枚以上": 100
+}
+
+PRINT_POSITIONS = ["前のみ", "背中のみ", "前と背中"]
+SINGLE_POSITIONS = ("前のみ", "背中のみ")
+
+# ▼▼▼ 新規: プリント位置が「前のみ/背中のみ」のときの色数選択肢および対応コスト
+COLOR_COST_MAP_SINGLE = {
+    "前 or 背中 1色": (0, 0),
+    "前 or 背中 2色": (1, 0),
+    "前 or 背中 フルカラー": (0, 1),
+}
+
+# ▼▼▼ 新規: プリント位置が「前と背中」のときの色数選択肢および対応コスト
+COLOR_COST_MAP_BOTH = {
+    "前と背中 前1色 背中1色": (0, 0),
+    "前と背中 前2色 背中1色": (1, 0),
+    "前と背中 前1色 背中2色": (1, 0),
+    "前と背中 前2色 背中2色": (2, 0),
+    "前と背中 フルカラー": (0, 2),
+}
+
+BACK_NAMES = ["ネーム&背番号セット", "ネーム(大)", "番号(大)", "背ネーム・番号を使わない"]
+# 背ネーム無し扱い (前のみ/背中のみ の場合もこれで記録される)
+NO_BACK_NAME = "なし"
+
+
+def compute_estimate(estimate_data, index=None):
+    """
+    入力された見積データから合計金額と単価を計算して返す (マトリクスを使わない直接計算)
+    index を省略すると現在の価格表を使う。
+    """
+    item_name = estimate_data['item']
+    discount_type = estimate_data['discount_type']
+    quantity = QUANTITY_MAP.get(estimate_data['quantity'], 1)
+
+    print_position = estimate_data['print_position']
+    color_choice = estimate_data['color_count']
+    back_name = estimate_data.get('back_name', "")
+
+    row = price_index.find_price_row(item_name, discount_type, quantity, index)
+    if row is None:
+        return 0, 0  # 該当無し
+
+    base_price = row["unit_price"]
+
+    # プリント位置追加
+    if print_position in SINGLE_POSITIONS:
+        pos_add = 0
+    else:
+        pos_add = row["pos_add"]
+
+    if print_position in SINGLE_POSITIONS:
+        color_add_count, fullcolor_add_count = COLOR_COST_MAP_SINGLE[color_choice]
+        # 背ネームはスキップ扱い => 0円
+        back_name_fee = 0
+    else:
+        color_add_count, fullcolor_add_count = COLOR_COST_MAP_BOTH[color_choice]
+        # 背ネームありの場合
+        if back_name == "ネーム&背番号セット":
+            back_name_fee = row["set_name_num"]
+        elif back_name == "ネーム(大)":
+            back_name_fee = row["big_name"]
+        elif back_name == "番号(大)":
+            back_name_fee = row["big_num"]
+        else:
+            back_name_fee = 0
+
+    color_fee = color_add_count * row["color_add"] + fullcolor_add_count * row["fullcolor_add"]
+
+    unit_price = base_price + pos_add + color_fee + back_name_fee
+    total_price = unit_price * quantity
+
+    return total_price, unit_price
+
+
+class QuoteMatrix:
+    """
+    全選択肢の (合計金額, 単価) を1次元の array に並べた表。
+    該当しない組み合わせ (前のみ + 前と背中用の色数 など) は -1。
+    """
+
+    def __init__(self, index=None):
+        self.index = index or price_index.PRICE_INDEX
+        self.version = self.index.version
+        self.axes = (
+            ESTIMATE_ITEMS,
+            DISCOUNT_TYPES,
+            list(QUANTITY_MAP),
+            PRINT_POSITIONS,
+            list(COLOR_COST_MAP_SINGLE) + list(COLOR_COST_MAP_BOTH),
+            BACK_NAMES + [NO_BACK_NAME],
+        )
+        self.codes = [{value: i for i, value in enumerate(axis)} for axis in self.axes]
+        size = 1
+        for axis in self.axes:
+            size *= len(axis)
+        self.total = array("i", [-1]) * size
+        self.unit = array("i", [-1]) * size
+
+        for offset, values in enumerate(self._combinations()):
+            item, discount_type, quantity, position, color, back_name = values
+            color_map = COLOR_COST_MAP_SINGLE if position in SINGLE_POSITIONS else COLOR_COST_MAP_BOTH
+            if color not in color_map:
+                continue
+            self.total[offset], self.unit[offset] = compute_estimate({
+                "item": item,
+                "discount_type": discount_type,
+                "quantity": quantity,
+                "print_position": position,
+                "color_count": color,
+                "back_name": back_name,
+            }, self.index)
+
+    def _combinations(self):
+        def walk(depth):
+            if depth == len(self.axes):
+                yield ()
+                return
+            for value in self.axes[depth]:
+                for rest in walk(depth + 1):
+                    yield (value,) + rest
+        return walk(0)
+
+    def offset(self, estimate_data):
+        """見積データの位置を返す。選択肢外の値があれば None"""
+        codes = self.codes
+        try:
+            offset = codes[0][estimate_data['item']]
+            offset = offset * len(codes[1]) + codes[1][estimate_data['discount_type']]
+            offset = offset * len(codes[2]) + codes[2][estimate_data['quantity']]
+            offset = offset * len(codes[3]) + codes[3][estimate_data['print_position']]
+            offset = offset * len(codes[4]) + codes[4][estimate_data['color_count']]
+        except KeyError:
+            return None
+        # 選択肢以外の背ネームは「なし」と同じ料金
+        back = codes[5].get(estimate_data.get('back_name', ""), codes[5][NO_BACK_NAME])
+        return offset * len(codes[5]) + back
+
+    def lookup(self, estimate_data):
+        offset = self.offset(estimate_data)
+        if offset is None or self.total[offset] < 0:
+            return None
+        return self.total[offset], self.unit[offset]
+
+    def rows(self):
+        """
+        (選択肢..., 合計金額, 単価) を順に返す。
+        該当しない組み合わせと、背ネームを選ばない 前のみ/背中のみ の重複分は除く。
+        """
+        for offset, values in enumerate(self._combinations()):
+            if values[3] in SINGLE_POSITIONS and values[5] != NO_BACK_NAME:
+                continue
+            if self.total[offset] >= 0:
+                yield values + (self.total[offset], self.unit[offset])
+
+    def export_csv(self, f):
+        writer = csv.writer(f)
+        writer.writerow(["商品名", "割引区分", "枚数", "プリント位置", "色数", "背ネーム", "合計金額", "単価"])
+        writer.writerows(self.rows())
+
+
+QUOTE_MATRIX = QuoteMatrix()
+
+
+@price_index.on_price_reload
+def rebuild_quote_matrix(index=None):
+    """価格表の差し替え後にマトリクスを作り直して入れ替える"""
+    global QUOTE_MATRIX
+    QUOTE_MATRIX = QuoteMatrix(index)
+    return QUOTE_MATRIX
+
+
+def quote_estimate(estimate_data):
+    """
+    入力された見積データから (合計金額, 単価, 価格表の版) を返す。
+    選択肢内の入力はマトリクスを1回読むだけ、それ以外はマトリクスと同じ版で直接計算する。
+    """
+    matrix = QUOTE_MATRIX
+    quote = matrix.lookup(estimate_data)
+    if quote is None:
+        quote = compute_estimate(estimate_data, matrix.index)
+    return quote[0], quote[1], matrix.version
+
+
+def calculate_estimate(estimate_data):
+    """入力された見積データから (合計金額, 単価) を返す"""
+    total_price, unit_price, _ = quote_estimate(estimate_data)
+    return total_price, unit_price
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="カンタン見積りの全組み合わせを CSV で書き出す")
+    parser.add_argument("--export", default="-", help="出力先 (省略時は標準出力)")
+    args = parser.parse_args()
+
+    if args.export == "-":
+        QUOTE_MATRIX.export_csv(sys.stdout)
+    else:
+        with open(args.export, "w", newline="", encoding="utf-8-sig") as f:
+            QUOTE_MATRIX.export_csv(f)
@@ -0,0 +1,22 @@
+"""
+外部 API (スプレッドシート・LINE) のエラーを再試行するかどうかの判定
+
+注文ジャーナルの複製・受付ログの後処理・キャンペーン送信・シートのエクスポートで共通に使う。
+"""
+
+
+def _error_status(exc):
+    # gspread の APIError は response.status_code、LINE の LineBotApiError は status_code
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(exc, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable_error(exc):
+    """429 / 5xx / ネットワークエラーは再試行対象"""
+    status = _error_status(exc)
+    if status is None:
+        return isinstance(exc, (OSError, ConnectionError, TimeoutError)) or "Connection" in type(exc).__name__
+    return status == 429 or status >= 500
@@ -0,0 +1,252 @@
+"""
+カンタン見積りのセッション保存先
+
+user_estimate_sessions と同じく dict のように読み書きできるストア。
+- MemorySessionStore: プロセス内の dict (ワーカー1つ向け)
+- SQLiteSessionStore: 同じノードの全 gunicorn ワーカーで共有する SQLite ファイル
+  (ESTIMATE_SESSION_PATH を /dev/shm 以下にすれば共有メモリ上に置ける)
+
+どちらもエントリごとに TTL を持ち、バックグラウンドのスイーパーが期限切れを削除する。
+値はコピーして保存されるため、書き換えた後は store[user_id] = data で保存し直すこと。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(raw):
+    return json.loads(raw)
+
+
+class _SweeperMixin:
+    """sweep() を sweep_interval 秒ごとに呼ぶデーモンスレッド (fork 後は子プロセスで立て直す)"""
+
+    def _start_sweeper(self):
+        pid = os.getpid()
+        thread = getattr(self, "_sweeper", None)
+        if thread is not None and self._sweeper_pid == pid and thread.is_alive():
+            return
+        with self._sweeper_lock:
+            thread = getattr(self, "_sweeper", None)
+            if thread is not None and self._sweeper_pid == pid and thread.is_alive():
+                return
+            self._sweeper_pid = pid
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="estimate-session-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                # DB のロック・破損などで削除できない状態を見逃さないよう記録して続ける
+                (self.logger or logging.getLogger(__name__)).exception(
+                    "期限切れセッションの削除に失敗しました (%s)", type(self).__name__)
+
+
+class MemorySessionStore(_SweeperMixin):
+    def __init__(self, ttl=1800, sweep_interval=60, logger=None):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.logger = logger
+        self._data = {}  # { user_id: (expires_at, serialized) }
+        self._lock = threading.Lock()
+        self._sweeper_lock = threading.Lock()
+
+    def get(self, user_id, default=None):
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                return default
+            if entry[0] < time.time():
+                del self._data[user_id]
+                return default
+            return _loads(entry[1])
+
+    def __getitem__(self, user_id):
+        data = self.get(user_id)
+        if data is None:
+            raise KeyError(user_id)
+        return data
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __setitem__(self, user_id, data):
+        self._start_sweeper()
+        with self._lock:
+            self._data[user_id] = (time.time() + self.ttl, _dumps(data))
+
+    def __delitem__(self, user_id):
+        if self.pop(user_id, None) is None:
+            raise KeyError(user_id)
+
+    def setdefault(self, user_id, data):
+        """
+        有効なエントリが無ければ data を保存して返し、あればそちらを返す (確認と保存は不可分)
+        """
+        self._start_sweeper()
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[0] >= now:
+                return _loads(entry[1])
+            self._data[user_id] = (now + self.ttl, _dumps(data))
+        return data
+
+    def pop(self, user_id, default=None):
+        with self._lock:
+            entry = self._data.pop(user_id, None)
+        if entry is None:
+            return default
+        return _loads(entry[1])
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def sweep(self):
+        """期限切れのセッションを削除し、削除した件数を返す"""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (expires_at, _) in self._data.items() if expires_at < now]
+            for k in expired:
+                del self._data[k]
+        return len(expired)
+
+
+class SQLiteSessionStore(_SweeperMixin):
+    def __init__(self, path, ttl=1800, sweep_interval=60, table="estimate_sessions", logger=None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.logger = logger
+        self._local = threading.local()
+        self._sweeper_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " user_id TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires ON {table} (expires_at)")
+
+    def _conn(self):
+        # スレッドごと・プロセスごとに接続を持つ (fork 前の接続は使わない)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, user_id, default=None):
+        row = self._conn().execute(
+            f"SELECT data FROM {self.table} WHERE user_id = ? AND expires_at >= ?",
+            (user_id, time.time())
+        ).fetchone()
+        if row is None:
+            return default
+        return _loads(row[0])
+
+    def __getitem__(self, user_id):
+        data = self.get(user_id)
+        if data is None:
+            raise KeyError(user_id)
+        return data
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __setitem__(self, user_id, data):
+        self._start_sweeper()
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {self.table} (user_id, data, expires_at) VALUES (?, ?, ?)",
+            (user_id, _dumps(data), time.time() + self.ttl)
+        )
+
+    def __delitem__(self, user_id):
+        if self.pop(user_id, None) is None:
+            raise KeyError(user_id)
+
+    def setdefault(self, user_id, data):
+        """
+        有効なエントリが無ければ data を保存して返し、あればそちらを返す (確認と保存は不可分)
+        """
+        self._start_sweeper()
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT data FROM {self.table} WHERE user_id = ? AND expires_at >= ?", (user_id, now)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (user_id, data, expires_at) VALUES (?, ?, ?)",
+                    (user_id, _dumps(data), now + self.ttl)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return data
+        return _loads(row[0])
+
+    def pop(self, user_id, default=None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT data FROM {self.table} WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            conn.execute(f"DELETE FROM {self.table} WHERE user_id = ?", (user_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return default
+        return _loads(row[0])
+
+    def __len__(self):
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM {self.table} WHERE expires_at >= ?", (time.time(),)
+        ).fetchone()[0]
+
+    def sweep(self):
+        """期限切れのセッションを削除し、削除した件数を返す"""
+        cur = self._conn().execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+        return cur.rowcount
+
+
+def create_session_store(prefix="ESTIMATE_SESSION", table="estimate_sessions", ttl=1800, backend="memory",
+                         logger=None):
+    """
+    環境変数からセッションストアを作る (prefix が ESTIMATE_SESSION の場合)
+      ESTIMATE_SESSION_BACKEND : memory / sqlite (既定は引数 backend)
+      ESTIMATE_SESSION_PATH    : sqlite のファイルパス (既定は <table>.sqlite3)
+      ESTIMATE_SESSION_TTL     : 最後の書き込みからの有効秒数 (既定は ttl)
+    """
+    backend = os.environ.get(f"{prefix}_BACKEND", backend)
+    ttl = int(os.environ.get(f"{prefix}_TTL", str(ttl)))
+    if backend == "sqlite":
+        path = os.environ.get(f"{prefix}_PATH", f"{table}.sqlite3")
+        return SQLiteSessionStore(path, ttl=ttl, table=table, logger=logger)
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl, logger=logger)
+    raise ValueError(f"{prefix}_BACKEND の値が不正です: {backend}")
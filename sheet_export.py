@@ -0,0 +1,319 @@
+"""
+注文・見積りシートの分析用エクスポート
+
+WebOrderRequests・簡易見積 を get_all_values で丸ごと読むと、シーズン分の行がすべてメモリに載る。
+ここではワークシートを page_rows 行ずつの範囲で読み、列名をキー (WEB_ORDER_COLUMN_KEYS など) に
+読み替え、型を付けて CSV / Parquet のパートファイルに順に書き出す。
+
+- メモリに載るのは1ページ分だけ (Parquet は1ページを1つの row group として書く)
+- パートファイル名に書き出した行番号の範囲を入れるので、再実行すると最後に書き出した行の次から読む
+  (シートは追記のみの前提。既存行の修正は反映しない)
+- パートは一時ファイルに書いてから名前を変えるので、途中で止まっても書きかけのパートは残らない
+- 金額 ("¥1,480")・枚数は整数、デザインの寸法は小数、日時は日本時間の日時に変換する。
+  変換できない値は空 (null) にして件数を数える
+
+Parquet には pyarrow が必要 (任意の依存なので、エクスポートする環境にだけ入れればよい)。
+
+    python sheet_export.py exports/                       # 両シートを Parquet で差分エクスポート
+    python sheet_export.py exports/ --format csv --sheet WebOrderRequests
+"""
+import csv
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from retry_policy import is_retryable_error
+
+JST = timezone(timedelta(hours=9))
+
+EXPORT_PAGE_ROWS = int(os.environ.get("EXPORT_PAGE_ROWS", "2000"))
+EXPORT_PART_ROWS = int(os.environ.get("EXPORT_PART_ROWS", "50000"))
+
+DATETIME_FORMATS = ("%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d", "%Y-%m-%d")
+
+# キーごとの型 (ここに無いキーは文字列)
+COLUMN_TYPES = {
+    # WebOrderRequests
+    "timestamp": "datetime",
+    "size150": "int", "sizeSS": "int", "sizeS": "int", "sizeM": "int",
+    "sizeL": "int", "sizeXL": "int", "sizeXXL": "int", "totalQuantity": "int",
+    "unitPrice": "int", "totalPrice": "int",
+    **{f"designSize{axis}{n}": "float" for axis in "XY" for n in range(1, 5)},
+    # 簡易見積
+    "total_price": "int", "unit_price": "int",
+}
+
+_NUMBER_NOISE = re.compile(r"[¥￥,，\s枚円]")
+_PART_NAME = re.compile(r"^part-(\d{8})-(\d{8})\.(csv|parquet)$")
+
+
+class SheetExportError(RuntimeError):
+    """エクスポートできない (ヘッダーが読めない、pyarrow が無い など)"""
+
+
+# -----------------------
+# 値の変換
+# -----------------------
+def convert_value(value, kind):
+    """
+    シートの表示値を型に合わせて変換し、(値, 変換できたか) を返す。
+    空欄は (None, True)。
+    """
+    if value is None:
+        return None, True
+    text = str(value).strip()
+    if not text:
+        return None, True
+    if kind == "str":
+        return text, True
+    if kind == "int":
+        try:
+            return int(_NUMBER_NOISE.sub("", text)), True
+        except ValueError:
+            return None, False
+    if kind == "float":
+        try:
+            return float(_NUMBER_NOISE.sub("", text)), True
+        except ValueError:
+            return None, False
+    if kind == "datetime":
+        for fmt in DATETIME_FORMATS:
+            try:
+                return datetime.strptime(text, fmt).replace(tzinfo=JST), True
+            except ValueError:
+                pass
+        return None, False
+    raise ValueError(f"未対応の型です: {kind}")
+
+
+def column_letter(n):
+    """1 始まりの列番号を A, B, ..., Z, AA, ... にする"""
+    letters = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+# -----------------------
+# パートファイルの書き出し
+# -----------------------
+class CsvPartWriter:
+    extension = "csv"
+
+    def __init__(self, path, keys, types):
+        self.path = path
+        self.types = [types.get(k, "str") for k in keys]
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(keys)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._writer.writerow(
+                "" if v is None else (v.isoformat() if kind == "datetime" else v)
+                for v, kind in zip(row, self.types)
+            )
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPartWriter:
+    extension = "parquet"
+
+    def __init__(self, path, keys, types):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SheetExportError("Parquet で書き出すには pyarrow が必要です (pip install pyarrow)") from None
+        self._pa = pa
+        arrow_types = {
+            "str": pa.string(), "int": pa.int64(), "float": pa.float64(),
+            "datetime": pa.timestamp("s", tz="Asia/Tokyo"),
+        }
+        self.schema = pa.schema([(k, arrow_types[types.get(k, "str")]) for k in keys])
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        columns = [
+            self._pa.array([row[i] for row in rows], type=field.type)
+            for i, field in enumerate(self.schema)
+        ]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {"csv": CsvPartWriter, "parquet": ParquetPartWriter}
+
+
+# -----------------------
+# エクスポート本体
+# -----------------------
+def exported_through(directory):
+    """directory のパートファイルから、書き出し済みの最後の行番号を返す (無ければ 1 = ヘッダー行)"""
+    last = 1
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            m = _PART_NAME.match(name)
+            if m:
+                last = max(last, int(m.group(2)))
+    return last
+
+
+class SheetExporter:
+    def __init__(self, out_dir, fmt="parquet", page_rows=EXPORT_PAGE_ROWS, part_rows=EXPORT_PART_ROWS,
+                 max_attempts=5, backoff_base=2.0, logger=None):
+        if fmt not in WRITERS:
+            raise ValueError(f"format は {sorted(WRITERS)} のいずれかです: {fmt}")
+        self.out_dir = out_dir
+        self.writer_class = WRITERS[fmt]
+        self.page_rows = page_rows
+        self.part_rows = part_rows
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.logger = logger
+
+    def _call(self, func, *args):
+        # 長いエクスポートの途中で 429/5xx が出ても、そこで止めずに待って読み直す
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return func(*args)
+            except Exception as e:
+                if attempt >= self.max_attempts or not is_retryable_error(e):
+                    raise
+                delay = self.backoff_base * (2 ** (attempt - 1))
+                if self.logger:
+                    self.logger.warning("シートの読み込みを %.0f 秒後に再試行します: %r", delay, e)
+                time.sleep(delay)
+
+    def iter_pages(self, ws, start_row, width):
+        """
+        start_row 行目から page_rows 行ずつ (先頭の行番号, 行のリスト) を返す。末尾の空行は返さない。
+        API はページ末尾の空行を省くので、短いページでは終わりと見なさず、1ページまるごと空になったら終える
+        """
+        last_col = column_letter(width)
+        row_no = start_row
+        while row_no <= ws.row_count:
+            end = min(row_no + self.page_rows - 1, ws.row_count)
+            values = self._call(ws.get, f"A{row_no}:{last_col}{end}")
+            if not values:
+                return
+            yield row_no, values
+            row_no = end + 1
+
+    def export(self, ws, name, keys, header_map, types=COLUMN_TYPES):
+        """
+        ws の未エクスポート分を out_dir/name/ に書き出し、件数をまとめた dict を返す。
+        keys       : 出力する列 (この順・この型で全パート共通)
+        header_map : {シートの列名: キー}。古いヘッダーのシートも列名で読み替える
+        """
+        directory = os.path.join(self.out_dir, name)
+        os.makedirs(directory, exist_ok=True)
+        start_row = exported_through(directory) + 1
+
+        header = self._call(ws.row_values, 1)
+        if not header:
+            raise SheetExportError(f"{ws.title}: ヘッダー行がありません")
+        key_pos = {k: i for i, k in enumerate(keys)}
+        # シートの列番号 → 出力の列番号
+        mapping = [(col, key_pos[header_map[h]]) for col, h in enumerate(header)
+                   if header_map.get(h) in key_pos]
+        unknown = [h for h in header if h and header_map.get(h) not in key_pos]
+        if unknown and self.logger:
+            self.logger.warning("%s: 出力しない列があります %s", ws.title, unknown)
+        kinds = [types.get(k, "str") for k in keys]
+
+        stats = {"sheet": ws.title, "start_row": start_row, "rows": 0, "parts": 0, "invalid": 0}
+        part = None
+        try:
+            for first_row, values in self.iter_pages(ws, start_row, len(header)):
+                if part is None:
+                    part = self._open_part(directory, keys, types, first_row)
+                rows = []
+                for raw in values:
+                    if not any(str(v).strip() for v in raw):
+                        continue  # 途中の空行
+                    row = [None] * len(keys)
+                    for col, pos in mapping:
+                        if col < len(raw):
+                            row[pos], ok = convert_value(raw[col], kinds[pos])
+                            if not ok:
+                                stats["invalid"] += 1
+                    rows.append(row)
+                part["writer"].write_rows(rows)
+                part["rows"] += len(rows)
+                part["last_row"] = first_row + len(values) - 1
+                stats["rows"] += len(rows)
+                if part["rows"] >= self.part_rows:
+                    self._finish_part(part)
+                    stats["parts"] += 1
+                    part = None
+            if part is not None:
+                self._finish_part(part)
+                stats["parts"] += 1
+                part = None
+        finally:
+            if part is not None:
+                self._abort_part(part)
+        stats["exported_through"] = exported_through(directory)
+        return stats
+
+    def _open_part(self, directory, keys, types, first_row):
+        tmp = os.path.join(directory, f".part-{first_row:08d}.{self.writer_class.extension}.tmp")
+        return {"writer": self.writer_class(tmp, keys, types), "tmp": tmp, "directory": directory,
+                "first_row": first_row, "last_row": first_row - 1, "rows": 0}
+
+    def _finish_part(self, part):
+        part["writer"].close()
+        name = f"part-{part['first_row']:08d}-{part['last_row']:08d}.{self.writer_class.extension}"
+        os.replace(part["tmp"], os.path.join(part["directory"], name))
+        if self.logger:
+            self.logger.info("%s を書き出しました (%d 行)", name, part["rows"])
+
+    def _abort_part(self, part):
+        try:
+            part["writer"].close()
+        finally:
+            if os.path.exists(part["tmp"]):
+                os.unlink(part["tmp"])
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="注文・見積りシートを CSV / Parquet に差分エクスポートする")
+    parser.add_argument("out_dir", help="出力先 (シートごとのディレクトリにパートファイルを置く)")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="parquet")
+    parser.add_argument("--sheet", action="append", help="対象のワークシート (省略時は両方)")
+    parser.add_argument("--page-rows", type=int, default=EXPORT_PAGE_ROWS, help="1回の読み込みの行数")
+    parser.add_argument("--part-rows", type=int, default=EXPORT_PART_ROWS, help="1パートファイルの行数の目安")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logger = logging.getLogger("sheet_export")
+
+    # 列の定義・スプレッドシート接続は Bot 本体と同じものを使う
+    from graffitees_LINE_BOT import (
+        ESTIMATE_COLUMN_KEYS, ESTIMATE_HEADERS, WEB_ORDER_COLUMN_KEYS, WEB_ORDER_HEADERS, with_spreadsheet,
+    )
+
+    exports = {
+        "WebOrderRequests": ("web_orders", WEB_ORDER_COLUMN_KEYS, dict(zip(WEB_ORDER_HEADERS, WEB_ORDER_COLUMN_KEYS))),
+        "簡易見積": ("estimates", ESTIMATE_COLUMN_KEYS, dict(zip(ESTIMATE_HEADERS, ESTIMATE_COLUMN_KEYS))),
+    }
+    exporter = SheetExporter(args.out_dir, args.format, args.page_rows, args.part_rows, logger=logger)
+    for title in args.sheet or list(exports):
+        name, keys, header_map = exports[title]
+        started = time.perf_counter()
+        stats = with_spreadsheet(lambda sh: exporter.export(sh.worksheet(title), name, keys, header_map))
+        elapsed = time.perf_counter() - started
+        print(f"{title}: {stats['rows']} 行 / パート {stats['parts']} 件 / 変換できない値 {stats['invalid']} 件"
+              f" / {stats['start_row']}〜{stats['exported_through']} 行目まで書き出し済み ({elapsed:.1f} 秒)")
@@ -0,0 +1,123 @@
+import atexit
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# リポジトリ直下のモジュール (order_log, campaign など) と、
+# ベンチマークの入力生成 (bench_vector_estimate.random_forms など) をそのまま import できるようにする
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+
+import price_index  # noqa: E402
+from campaign import CampaignSender  # noqa: E402
+from order_journal import OrderJournal  # noqa: E402
+from order_log import OrderLog  # noqa: E402
+
+
+class ApiError(Exception):
+    """gspread の APIError / LINE の LineBotApiError の代わり (status_code だけを見る)"""
+
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+@pytest.fixture
+def api_error():
+    return ApiError
+
+
+@pytest.fixture(autouse=True)
+def no_background_thread(monkeypatch):
+    # バックグラウンドのスレッドは起動せず、テストから process_one / replicate を直接呼ぶ
+    monkeypatch.setattr(OrderLog, "_ensure_started", lambda self: None)
+    monkeypatch.setattr(OrderJournal, "_ensure_started", lambda self: None)
+
+
+@pytest.fixture
+def make_order_log(tmp_path):
+    def make(steps, **kwargs):
+        return OrderLog(str(tmp_path / "orders.sqlite3"), steps, **kwargs)
+    return make
+
+
+@pytest.fixture
+def make_sender(tmp_path):
+    # レート制限・バックオフの待ちは入れず、10 件ずつのバッチにする
+    def make(line, campaign_id="early-bird", **kwargs):
+        kwargs.setdefault("rate", 10000)
+        kwargs.setdefault("backoff_base", 0)
+        return CampaignSender(str(tmp_path / "campaigns.sqlite3"), campaign_id, line.send_batch,
+                              batch_size=10, **kwargs)
+    return make
+
+
+class FakeSheets:
+    """append_rows の代わり。errors に入れた例外を呼び出しごとに1つずつ送出する (None なら成功)"""
+
+    def __init__(self):
+        self.errors = []
+        self.rows = {}
+        self.calls = 0
+
+    def append_rows(self, title, rows):
+        self.calls += 1
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        self.rows.setdefault(title, []).extend(rows)
+
+
+@pytest.fixture
+def sheets():
+    return FakeSheets()
+
+
+@pytest.fixture
+def make_journal(tmp_path, sheets):
+    def make(**kwargs):
+        return OrderJournal(str(tmp_path / "journal.sqlite3"), sheets.append_rows, **kwargs)
+    return make
+
+
+LINE_CHANNEL_SECRET = "test-channel-secret"
+
+
+@pytest.fixture(scope="session")
+def bot(tmp_path_factory):
+    """
+    Bot 本体 (graffitees_LINE_BOT) を読み込む。依存が入っていなければテストを飛ばす。
+    SQLite のファイルはすべて一時ディレクトリに置き、スプレッドシート・LINE には接続しない。
+    """
+    for module in ("flask", "gspread", "pytz", "oauth2client", "linebot"):
+        pytest.importorskip(module)
+    tmp = tmp_path_factory.mktemp("bot")
+    os.environ.update({
+        "LINE_CHANNEL_SECRET": LINE_CHANNEL_SECRET,
+        "ORDER_JOURNAL_PATH": str(tmp / "order_journal.sqlite3"),
+        "SHEET_QUEUE_PATH": str(tmp / "sheet_write_queue.sqlite3"),
+        "ORDER_LOG_PATH": str(tmp / "web_orders.sqlite3"),
+        "SUBMITTED_REQUEST_PATH": str(tmp / "submitted_requests.sqlite3"),
+        "ESTIMATE_SESSION_PATH": str(tmp / "estimate_sessions.sqlite3"),
+        "ID_WORKER_ID": "1",
+        "SHEET_QUEUE_FULL_TIMEOUT": "0",
+    })
+    import graffitees_LINE_BOT
+    graffitees_LINE_BOT.app.config["TESTING"] = True
+    # 終了時の複製 (スプレッドシートへの接続) はしない
+    atexit.unregister(graffitees_LINE_BOT.order_journal.stop)
+    atexit.unregister(graffitees_LINE_BOT.web_order_log.stop)
+    return graffitees_LINE_BOT
+
+
+@pytest.fixture
+def restore_prices():
+    """テスト中に差し替えた価格表を元の版に戻す"""
+    index = price_index.PRICE_INDEX
+    rows = [dict(row) for row in index.table]
+    yield
+    price_index.reload_price_index(rows, version=index.version)
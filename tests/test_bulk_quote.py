@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+
+import bulk_quote
+import price_index
+from bench_vector_estimate import random_forms
+from bulk_quote import BulkQuoteError, quote_many, quote_one, read_configs
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(bulk_quote, "BULK_QUOTE_WORKERS", 2)
+    yield
+    bulk_quote.close_pool()
+
+
+def test_pool_matches_inline(pool):
+    forms = random_forms(3000, seed=3)
+    expected = [quote_one(i, f) for i, f in enumerate(forms)]
+
+    ordered = list(quote_many(forms, ordered=True, chunk_size=250, inline_rows=100))
+    assert ordered == expected
+
+    unordered = list(quote_many(forms, chunk_size=250, inline_rows=100))
+    assert sorted(unordered, key=lambda r: r["index"]) == expected
+
+
+def test_small_input_is_computed_inline(monkeypatch):
+    def no_pool():
+        raise AssertionError("プールを使わない件数")
+
+    monkeypatch.setattr(bulk_quote, "get_pool", no_pool)
+    forms = random_forms(50, seed=4)
+    assert list(quote_many(forms, inline_rows=50)) == [quote_one(i, f) for i, f in enumerate(forms)]
+
+
+def test_reload_replaces_pool_and_prices(pool, restore_prices):
+    forms = [{"productName": row["item"], "totalQuantity": str(row["min_qty"])}
+             for row in price_index.PRICE_INDEX.table][:200]
+    before = list(quote_many(forms, ordered=True, chunk_size=20, inline_rows=10))
+    old_pool = bulk_quote.get_pool()
+
+    rows = [dict(row, unit_price=row["unit_price"] + 100) for row in price_index.PRICE_INDEX.table]
+    price_index.reload_price_index(rows, version="test-v2")
+    assert bulk_quote._pool is None  # 古いワーカーは捨てる
+    with pytest.raises(ValueError):
+        old_pool.apply(len, ([],))  # close + join 済み
+
+    after = list(quote_many(forms, ordered=True, chunk_size=20, inline_rows=10))
+    assert {r["estimate"]["price_version"] for r in after} == {"test-v2"}
+    assert after == [quote_one(i, f) for i, f in enumerate(forms)]
+    assert all(a["estimate"]["base_unit"] == b["estimate"]["base_unit"] + 100 for a, b in zip(after, before)
+               if a["estimate"]["qty"])
+
+
+def test_errors_and_limits():
+    result = quote_one(0, {"totalQuantity": "abc"})
+    assert result["error"].startswith("見積りできません (ValueError")
+    with pytest.raises(BulkQuoteError):
+        list(quote_many([{}] * 11, max_rows=10))
+
+
+def test_read_configs():
+    assert list(read_configs(io.StringIO('{"a": "1"}\n\n{"b": "2"}\n'))) == [{"a": "1"}, {"b": "2"}]
+    assert list(read_configs(io.StringIO("a,b\n1,\n"), "csv")) == [{"a": "1"}]
+    with pytest.raises(BulkQuoteError, match="2行目"):
+        list(read_configs(io.StringIO('{"a": 1}\n[1]\n')))
+    with pytest.raises(BulkQuoteError):
+        list(read_configs(io.StringIO(json.dumps({}) + "\n{"), "jsonl"))
@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+
+import pytest
+
+from campaign import dry_run_report, read_recipients_file, unique_user_ids
+
+
+class Crash(BaseException):
+    """送信中にプロセスが落ちた代わり (_send では捕まえない)"""
+
+
+def user_id(n):
+    return f"U{n:032x}"
+
+
+USERS = [user_id(n) for n in range(25)]
+
+
+class FakeLine:
+    def __init__(self):
+        self.sent = []
+        self.lock = threading.Lock()
+        self.fail = {}  # batch の先頭の宛先 -> 送出する例外のリスト
+
+    def send_batch(self, user_ids, retry_key):
+        with self.lock:
+            errors = self.fail.get(user_ids[0])
+            if errors:
+                raise errors.pop(0)
+            self.sent.append((tuple(user_ids), retry_key))
+
+
+def test_sends_all_batches_once(make_sender):
+    line = FakeLine()
+    sender = make_sender(line)
+    assert sender.prepare(USERS) == 3
+    report = sender.run()
+    assert sorted(u for batch, _ in line.sent for u in batch) == USERS
+    assert report["batches"] == {"sent": 3}
+    assert report["recipients"] == {"sent": 25}
+    assert report["this_run"] == {"batches": 3, "recipients": 25}
+
+    assert sender.run()["this_run"] == {"batches": 0, "recipients": 0}
+    assert len(line.sent) == 3
+
+
+def test_resume_after_crash_sends_only_remaining_batches(make_sender):
+    line = FakeLine()
+    sender = make_sender(line, workers=1)
+    sender.prepare(USERS)
+    line.fail[USERS[10]] = [Crash()]
+    line.fail[USERS[20]] = [Crash()]
+    with pytest.raises(Crash):
+        sender.run()
+    assert [batch[0] for batch, _ in line.sent] == [USERS[0]]
+
+    # 再実行では最初に記録したバッチを使い、宛先リストが変わっても送り直さない
+    resumed = make_sender(line)
+    assert resumed.prepare(USERS[:5]) == 3
+    report = resumed.run()
+    assert report["recipients"] == {"sent": 25}
+    assert sorted(batch[0] for batch, _ in line.sent) == [USERS[0], USERS[10], USERS[20]]
+    assert all(key == resumed.retry_key(n) for n, (_, key) in enumerate(sorted(line.sent)))
+
+
+def test_retryable_error_then_success(make_sender, api_error):
+    line = FakeLine()
+    line.fail[USERS[0]] = [api_error(429), api_error(503)]
+    sender = make_sender(line)
+    sender.prepare(USERS)
+    report = sender.run()
+    assert report["batches"] == {"sent": 3}
+    attempts = sqlite3.connect(sender.path).execute(
+        "SELECT attempts FROM campaign_batches WHERE batch_no = 0").fetchone()[0]
+    assert attempts == 3
+
+
+def test_conflict_counts_as_sent(make_sender, api_error):
+    # 409: 前回の実行で同じ retry key のバッチが受け付け済み
+    line = FakeLine()
+    line.fail[USERS[0]] = [api_error(409)]
+    sender = make_sender(line)
+    sender.prepare(USERS)
+    assert sender.run()["batches"] == {"sent": 3}
+    assert len(line.sent) == 2
+
+
+def test_failed_batches_are_resent_only_with_retry_failed(make_sender, api_error):
+    line = FakeLine()
+    line.fail[USERS[10]] = [api_error(400)]
+    sender = make_sender(line, max_attempts=2)
+    sender.prepare(USERS)
+    report = sender.run()
+    assert report["batches"] == {"sent": 2, "failed": 1}
+    assert report["failure_rate"] == pytest.approx(10 / 25)
+
+    assert sender.run()["this_run"]["batches"] == 0
+    report = sender.run(retry_failed=True)
+    assert report["batches"] == {"sent": 3}
+    assert report["failure_rate"] == 0.0
+
+
+def test_dry_run_does_not_touch_state(make_sender):
+    report = dry_run_report("early-bird", USERS, batch_size=10)
+    assert report["batches"] == {"pending": 3}
+    assert report["total_recipients"] == 25
+    assert dry_run_report("early-bird", [])["total_recipients"] == 0
+
+    # 本番の送信状況には何も残らないので、その後の送信で全件送る
+    line = FakeLine()
+    sender = make_sender(line)
+    assert sender.prepare(USERS) == 3
+    assert sender.run()["recipients"] == {"sent": 25}
+
+
+def test_read_recipients(tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text("name,ユーザーID\n山田,%s\n佐藤,%s\n山田,%s\n不明,abc\n" % (USERS[0], USERS[1], USERS[0]),
+                    encoding="utf-8-sig")
+    assert read_recipients_file(str(path), "ユーザーID") == USERS[:2]
+    assert list(unique_user_ids([" " + USERS[0] + "\n", None, USERS[0], "U123"])) == [USERS[0]]
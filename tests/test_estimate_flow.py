@@ -0,0 +1,120 @@
+from types import SimpleNamespace
+
+import pytest
+
+import estimate_flow
+from estimate_flow import COMPLETE, FATAL, INVALID, advance, new_session
+
+SINGLE = ["学生", "14日目以降", "特になし", "ゲームシャツ", "20～29枚", "前のみ", "前 or 背中 1色"]
+BOTH = ["一般", "14日目以内", "2,000円以内", "ゲームシャツ", "30～39枚", "前と背中",
+        "前と背中 前1色 背中1色", "ネーム&背番号セット"]
+
+
+def run(messages):
+    session, replies = new_session(), []
+    for message in messages:
+        result = advance(session, message)
+        replies.append(result.reply)
+        session = result.session
+    return result, replies
+
+
+def test_single_position_completes_after_color_count():
+    result, replies = run(SINGLE)
+    assert replies == [
+        "flex_usage_date", "flex_budget", "flex_item_select", "flex_quantity",
+        "flex_print_position", "flex_color_count_single", COMPLETE,
+    ]
+    assert result.session is None
+    assert result.answers == {
+        "user_type": "学生", "usage_date": "14日目以降", "discount_type": "早割",
+        "budget": "特になし", "item": "ゲームシャツ", "quantity": "20～29枚",
+        "print_position": "前のみ", "color_count": "前 or 背中 1色", "back_name": "なし",
+    }
+
+
+def test_both_positions_ask_for_back_name():
+    result, replies = run(BOTH)
+    assert replies[5:] == ["flex_color_count_both", "flex_back_name", COMPLETE]
+    assert result.answers["discount_type"] == "通常"
+    assert result.answers["back_name"] == "ネーム&背番号セット"
+
+
+def test_is_single_is_carried_to_the_color_step():
+    result, _ = run(SINGLE[:6])
+    assert result.session == {"step": 7, "answers": result.answers, "is_single": True}
+    # 片面の色数の選択肢は両面では無効
+    assert advance(result.session, "前と背中 前1色 背中1色").reply == INVALID
+
+    result, _ = run(BOTH[:6])
+    assert result.session["is_single"] is False
+    assert advance(result.session, "前 or 背中 1色").reply == INVALID
+
+
+def test_advance_does_not_modify_the_session():
+    session = new_session()
+    advance(session, "学生")
+    assert session == new_session()
+
+
+@pytest.mark.parametrize("step", range(1, 9))
+def test_text_outside_the_choices_ends_the_session(step):
+    session = new_session()
+    for message in BOTH[:step - 1]:
+        session = advance(session, message).session
+    assert advance(session, "よろしくお願いします") == (None, INVALID, None)
+
+
+def test_unknown_step_is_fatal():
+    assert advance({"step": 9, "answers": {}}, "学生") == (None, FATAL, None)
+
+
+def test_every_prompt_has_a_flex_message(bot):
+    prompts = {spec.next(choice)[1] for spec in estimate_flow.STEPS.values() for choice in spec.choices}
+    assert set(bot.ESTIMATE_PROMPTS) == prompts - {COMPLETE}
+
+
+@pytest.fixture
+def line_user(bot, monkeypatch):
+    user_id = "U" + "e" * 32
+    replies, writes = [], []
+    monkeypatch.setattr(bot, "reply_or_push", lambda event, message: replies.append(message))
+    monkeypatch.setattr(bot, "write_estimate_to_spreadsheet",
+                        lambda *args: writes.append(args) or "Q-0001")
+    event = SimpleNamespace(source=SimpleNamespace(user_id=user_id))
+    bot.user_estimate_sessions[user_id] = new_session()
+    yield SimpleNamespace(id=user_id, event=event, replies=replies, writes=writes)
+    bot.user_estimate_sessions.pop(user_id, None)
+
+
+def test_bot_walks_the_flow_with_stored_sessions(bot, line_user):
+    for message in SINGLE:
+        bot.process_estimate_flow(line_user.event, message)
+
+    assert bot.user_estimate_sessions.get(line_user.id) is None
+    assert len(line_user.writes) == 1
+    assert line_user.writes[0][0] == line_user.id
+    assert "見積番号: Q-0001" in line_user.replies[-1].text
+    assert line_user.replies[0] is bot.flex_usage_date()
+
+
+def test_bot_ends_the_session_on_invalid_input(bot, line_user):
+    bot.process_estimate_flow(line_user.event, "学生")
+    bot.process_estimate_flow(line_user.event, "あした")
+    assert bot.user_estimate_sessions.get(line_user.id) is None
+    assert line_user.replies[-1] is bot.ESTIMATE_INVALID_MESSAGE
+    assert line_user.writes == []
+
+
+def test_bot_keeps_the_last_step_when_the_journal_is_full(bot, line_user, monkeypatch):
+    for message in SINGLE[:-1]:
+        bot.process_estimate_flow(line_user.event, message)
+    before = bot.user_estimate_sessions.get(line_user.id)
+
+    def full(*args):
+        raise bot.JournalFull("full")
+
+    monkeypatch.setattr(bot, "write_estimate_to_spreadsheet", full)
+    bot.process_estimate_flow(line_user.event, SINGLE[-1])
+    assert line_user.replies[-1] is bot.ESTIMATE_BUSY_MESSAGE
+    assert bot.user_estimate_sessions.get(line_user.id) == before
@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import hmac
+import json
+import re
+import time
+
+import pytest
+
+from conftest import LINE_CHANNEL_SECRET
+from retry_policy import is_retryable_error
+
+
+@pytest.fixture
+def client(bot):
+    return bot.app.test_client()
+
+
+@pytest.fixture
+def journal_full(bot, monkeypatch):
+    monkeypatch.setattr(bot.order_journal, "max_backlog", 0)
+
+
+def line_post(client, body):
+    body = json.dumps(body)
+    signature = base64.b64encode(
+        hmac.new(LINE_CHANNEL_SECRET.encode(), body.encode(), hashlib.sha256).digest()).decode()
+    return client.post("/line/callback", data=body, headers={"X-Line-Signature": signature},
+                       content_type="application/json")
+
+
+def catalog_token(client):
+    client.get("/catalog_form")
+    with client.session_transaction() as s:
+        return s["catalog_form_token"]
+
+
+def test_catalog_form_returns_503_when_journal_is_full(bot, client, monkeypatch):
+    token = catalog_token(client)
+    monkeypatch.setattr(bot.order_journal, "max_backlog", 0)
+    resp = client.post("/submit_form", data={"form_token": token, "name": "山田"})
+    assert resp.status_code == 503
+
+    # 同じトークンで送り直せる
+    monkeypatch.setattr(bot.order_journal, "max_backlog", 5000)
+    resp = client.post("/submit_form", data={"form_token": token, "name": "山田"})
+    assert resp.status_code == 200
+
+
+def test_webhook_returns_503_when_journal_is_full(client, journal_full):
+    assert line_post(client, {"destination": "U0", "events": []}).status_code == 503
+
+
+def test_webhook_accepts_when_journal_has_space(client):
+    assert line_post(client, {"destination": "U0", "events": []}).status_code == 200
+
+
+def test_web_order_returns_503_when_journal_is_full(bot, client, monkeypatch):
+    form = {"form_token": "tok-full", "productName": "ドライTシャツ", "totalQuantity": "30"}
+    monkeypatch.setattr(bot.order_journal, "max_backlog", 0)
+    assert client.post("/submit_web_order_form", data=form).status_code == 503
+
+    monkeypatch.setattr(bot.order_journal, "max_backlog", 5000)
+    resp = client.post("/submit_web_order_form", data=form)
+    assert resp.status_code == 200
+    assert "受付済み" not in resp.get_data(as_text=True)
+
+
+def text_event(event_id, text="こんにちは", user_id="U" + "0" * 32):
+    return {
+        "type": "message", "mode": "active", "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": event_id, "deliveryContext": {"isRedelivery": False},
+        "replyToken": "reply-token", "message": {"id": "1", "type": "text", "text": text},
+    }
+
+
+def test_webhook_queues_events_and_ignores_redelivery(bot, client, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(bot.line_event_pool, "submit",
+                        lambda key, event, timeout=0: submitted.append((key, event.webhook_event_id)) or True)
+    body = {"destination": "U0", "events": [text_event("EV-1")]}
+    assert line_post(client, body).status_code == 200
+    assert line_post(client, body).status_code == 200
+    assert submitted == [("U" + "0" * 32, "EV-1")]
+
+
+def test_webhook_returns_503_when_event_queue_is_full(bot, client, monkeypatch):
+    monkeypatch.setattr(bot.line_event_pool, "submit", lambda key, event, timeout=0: False)
+    monkeypatch.setattr(bot, "dispatch_line_event", lambda event: pytest.fail("その場で処理しない"))
+    body = {"destination": "U0", "events": [text_event("EV-2")]}
+    assert line_post(client, body).status_code == 503
+
+    # 断ったイベントは処理済みにしないので、LINE からの再送は受け付ける
+    submitted = []
+    monkeypatch.setattr(bot.line_event_pool, "submit",
+                        lambda key, event, timeout=0: submitted.append(event.webhook_event_id) or True)
+    assert line_post(client, body).status_code == 200
+    assert submitted == ["EV-2"]
+
+
+def test_fixed_flex_messages_are_built_once(bot):
+    message = bot.flex_budget()
+    assert bot.flex_budget() is message
+    assert message.as_json_dict() == message.message.as_json_dict()
+    assert message.alt_text == message.message.alt_text
+
+
+WEB_ORDER = {"productName": "ドライTシャツ", "totalQuantity": "30", "discountOption": "早割"}
+
+
+def order_no_of(resp):
+    return re.search(r"注文番号 (\S+?)[）\s]", resp.get_data(as_text=True)).group(1)
+
+
+def test_web_order_with_bad_quantity_is_rejected_before_claiming(bot, client):
+    form = dict(WEB_ORDER, form_token="tok-bad-quantity", totalQuantity="たくさん")
+    assert client.post("/submit_web_order_form", data=form).status_code == 400
+    assert bot.submitted_requests.get("web_order:tok-bad-quantity") is None
+
+
+def test_web_order_retry_after_failure_reuses_the_order_no(bot, client, monkeypatch):
+    form = dict(WEB_ORDER, form_token="tok-retry")
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("受付ログに書けない")
+
+    monkeypatch.setattr(bot.web_order_log, "accept", broken)
+    with pytest.raises(RuntimeError):
+        client.post("/submit_web_order_form", data=form)
+    claim = bot.submitted_requests.get("web_order:tok-retry")
+    assert claim["pending"] is True
+    record = bot.order_journal.get(claim["order_no"], "WebOrderRequests")
+    assert record is not None
+
+    monkeypatch.undo()
+    resp = client.post("/submit_web_order_form", data=form)
+    assert resp.status_code == 200
+    assert order_no_of(resp) == claim["order_no"]
+    # ジャーナルは書き直さず、受付ログだけ追いつく
+    again = bot.order_journal.get(claim["order_no"], "WebOrderRequests")
+    assert (again["seq"], again["row"], again["data"]) == (record["seq"], record["row"], record["data"])
+    assert bot.web_order_log.status(claim["order_no"]) is not None
+    assert bot.submitted_requests.get("web_order:tok-retry") == {"order_no": claim["order_no"]}
+
+    resp = client.post("/submit_web_order_form", data=form)
+    assert "受付済み" in resp.get_data(as_text=True)
+    assert order_no_of(resp) == claim["order_no"]
+
+
+def test_web_order_retry_after_busy_reuses_the_order_no(bot, client, monkeypatch):
+    form = dict(WEB_ORDER, form_token="tok-busy")
+    monkeypatch.setattr(bot.order_journal, "max_backlog", 0)
+    assert client.post("/submit_web_order_form", data=form).status_code == 503
+    order_no = bot.submitted_requests.get("web_order:tok-busy")["order_no"]
+
+    monkeypatch.setattr(bot.order_journal, "max_backlog", 5000)
+    assert order_no_of(client.post("/submit_web_order_form", data=form)) == order_no
+
+
+def test_push_step_fails_without_retry_when_the_journal_record_is_missing(bot):
+    with pytest.raises(LookupError) as e:
+        bot._web_order_push_step({"order_no": "W-MISSING"})
+    assert not is_retryable_error(e.value)
@@ -0,0 +1,114 @@
+import io
+import os
+
+import pytest
+
+pytest.importorskip("linebot")
+import requests  # noqa: E402
+
+import line_http  # noqa: E402
+from line_http import LatencyHistogram, PooledHttpClient, endpoint_name  # noqa: E402
+
+API = "https://api.line.me/v2/bot"
+
+
+def response(status):
+    r = requests.Response()
+    r.status_code = status
+    r._content = b"{}"
+    r.raw = io.BytesIO()
+    return r
+
+
+class FakeSession:
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls.append((method, url, timeout, kwargs))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return response(result)
+
+
+@pytest.fixture
+def make_client():
+    def make(results, **kwargs):
+        client = PooledHttpClient(histogram=LatencyHistogram(), backoff=0, **kwargs)
+        client._session, client._pid = FakeSession(results), os.getpid()
+        return client
+    return make
+
+
+@pytest.mark.parametrize("method, url, expected", [
+    ("POST", f"{API}/message/push", "POST /v2/bot/message/push"),
+    ("GET", f"{API}/profile/U{'0' * 32}", "GET /v2/bot/profile/{id}"),
+    ("GET", "https://api-data.line.me/v2/bot/message/123456/content?x=1", "GET /v2/bot/message/{id}/content"),
+    ("POST", f"{API}/user/U{'a' * 32}/richmenu/richmenu-0f3c", "POST /v2/bot/user/{id}/richmenu/{id}"),
+    ("GET", "https://api.line.me", "GET /"),
+])
+def test_endpoint_name_groups_ids(method, url, expected):
+    assert endpoint_name(method, url) == expected
+
+
+def test_histogram_buckets_and_statuses():
+    histogram = LatencyHistogram(buckets=(10, 100))
+    histogram.observe("GET /x", 0.005, 200)
+    histogram.observe("GET /x", 0.050, 200)
+    histogram.observe("GET /x", 0.500, 500)
+    snapshot = histogram.snapshot()["GET /x"]
+    assert snapshot["count"] == 3
+    assert snapshot["buckets"] == {"le_10ms": 1, "le_100ms": 1, "inf": 1}
+    assert snapshot["status"] == {"200": 2, "500": 1}
+    assert snapshot["max_ms"] == pytest.approx(500)
+    assert snapshot["avg_ms"] == pytest.approx(185)
+
+
+@pytest.mark.parametrize("method, url, headers", [
+    ("get", f"{API}/profile/U{'0' * 32}", None),
+    ("post", f"{API}/message/reply", {}),
+    ("post", f"{API}/message/push", {"X-Line-Retry-Key": "key"}),
+])
+def test_retries_transient_errors_when_safe(make_client, method, url, headers):
+    client = make_client([503, 502, 200])
+    assert getattr(client, method)(url, headers=headers).status_code == 200
+    assert len(client._session.calls) == 3
+    assert client.retry_count == 2
+
+
+def test_push_without_retry_key_is_not_resent(make_client):
+    client = make_client([503])
+    assert client.post(f"{API}/message/push", headers={}).status_code == 503
+    assert len(client._session.calls) == 1
+
+
+def test_gives_up_after_the_retry_limit(make_client):
+    client = make_client([500, 500], retries=1)
+    assert client.get(f"{API}/info").status_code == 500
+    stats = client.histogram.snapshot()["GET /v2/bot/info"]
+    assert stats["count"] == 2 and stats["status"] == {"500": 2}
+
+
+def test_client_errors_are_not_retried_and_timeout_is_passed(make_client):
+    client = make_client([400], timeout=3)
+    assert client.post(f"{API}/message/reply", headers={}).status_code == 400
+    assert client._session.calls[0][2] == 3
+
+
+def test_connection_errors_are_recorded_and_raised(make_client):
+    client = make_client([requests.ConnectionError("down")])
+    with pytest.raises(requests.ConnectionError):
+        client.get(f"{API}/info")
+    assert client.histogram.snapshot()["GET /v2/bot/info"]["status"] == {"ConnectionError": 1}
+
+
+def test_session_is_recreated_after_fork():
+    client = line_http.pooled_http_client_factory(pool_size=4)()
+    session = client.session
+    assert client.session is session
+    adapter = session.get_adapter("https://api.line.me")
+    assert adapter._pool_maxsize == 4
+    client._pid = -1  # fork 後の子プロセスに見せかける
+    assert client.session is not session
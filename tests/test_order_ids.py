@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import order_ids
+from order_ids import IdGenerator, SEQUENCE_LIMIT, lease_worker_id
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# 別プロセスでワーカー番号を借り、番号を n 件作って1行ずつ出力する
+WORKER_SCRIPT = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    from order_ids import IdGenerator
+    gen = IdGenerator()
+    print("worker", gen.worker_id, flush=True)
+    for _ in range(int(sys.argv[2])):
+        print(gen.next_id())
+    sys.stdin.read()  # 全員が借り終わるまで番号を持ったまま待つ
+""")
+
+
+def test_workers_lease_distinct_ids_and_never_collide(tmp_path):
+    env = dict(os.environ, ID_WORKER_DB=str(tmp_path / "ids.sqlite3"))
+    env.pop("ID_WORKER_ID", None)
+    procs = [
+        subprocess.Popen([sys.executable, "-c", WORKER_SCRIPT, ROOT, "500"], env=env,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(6)
+    ]
+    # 全員が番号を借りてから終了させる (先に終わったプロセスの番号は借り直されてよい)
+    worker_ids = [int(p.stdout.readline().split()[1]) for p in procs]
+    for p in procs:
+        p.stdin.close()
+    outputs = [p.stdout.read().splitlines() for p in procs]
+    assert all(p.wait(timeout=60) == 0 for p in procs)
+
+    assert sorted(worker_ids) == list(range(6))
+    ids = [line for out in outputs for line in out]
+    assert len(ids) == 6 * 500
+    assert len(set(ids)) == len(ids)
+
+
+def test_ids_are_reused_after_owner_exits(tmp_path):
+    path = str(tmp_path / "ids.sqlite3")
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                          capture_output=True, text=True, check=True)
+    dead_pid = int(dead.stdout)
+    lease_worker_id(path)  # 自分のプロセスの行を作る
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE worker_ids SET pid = ? WHERE worker_id = 0", (dead_pid,))
+        conn.execute("INSERT INTO worker_ids VALUES (1, ?, 0)", (os.getppid(),))
+
+    # 0 は持ち主が終了しているので借り直せる。1 は生きているプロセスのもの
+    assert lease_worker_id(path) == 0
+    assert lease_worker_id(path) == 0  # 同じ pid の古い行も借り直しになる
+    with sqlite3.connect(path) as conn:
+        assert dict(conn.execute("SELECT worker_id, pid FROM worker_ids")) == {0: os.getpid(), 1: os.getppid()}
+
+
+def test_lease_fails_when_exhausted(tmp_path, monkeypatch):
+    path = str(tmp_path / "ids.sqlite3")
+    monkeypatch.setattr(order_ids, "WORKER_ID_LIMIT", 2)
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE worker_ids (worker_id INTEGER PRIMARY KEY, pid INTEGER NOT NULL,"
+                     " leased_at REAL NOT NULL)")
+        conn.executemany("INSERT INTO worker_ids VALUES (?, ?, 0)", [(0, os.getppid()), (1, os.getppid())])
+    with pytest.raises(RuntimeError):
+        lease_worker_id(path)
+
+
+def test_sequence_rollover_and_clock_going_back():
+    now = [1760770000.123]
+    gen = IdGenerator(worker_id=7, clock=lambda: now[0])
+    ids = [gen.next_id() for _ in range(SEQUENCE_LIMIT + 5)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert ids[0] == "20251018154640123-00700"
+    assert ids[SEQUENCE_LIMIT] == "20251018154640124-00700"
+
+    now[0] -= 10  # 時計が戻っても番号は戻らない
+    later = gen.next_id()
+    assert later > ids[-1]
+
+
+def test_env_worker_id(monkeypatch):
+    monkeypatch.setenv("ID_WORKER_ID", "42")
+    assert IdGenerator().worker_id == 42
+    monkeypatch.setenv("ID_WORKER_ID", "1000")
+    with pytest.raises(ValueError):
+        IdGenerator().worker_id
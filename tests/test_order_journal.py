@@ -0,0 +1,230 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from conftest import ROOT
+from order_ids import DuplicateIdError
+from order_journal import JournalFull, OrderJournal
+
+
+def test_replicates_in_batches_per_worksheet(make_journal, sheets):
+    replicated = []
+    journal = make_journal(batch_size=2, on_replicated=lambda title, nos: replicated.append((title, nos)))
+    for i in range(3):
+        journal.append("注文", [f"order-{i}"], record_no=f"A{i}", user_id="U1")
+    journal.append("見積", ["quote-0"], record_no="Q0", user_id="U2")
+
+    assert journal.replicate() == 4
+    assert sheets.rows == {"注文": [["order-0"], ["order-1"], ["order-2"]], "見積": [["quote-0"]]}
+    assert sheets.calls == 3
+    assert replicated == [("注文", ["A0", "A1"]), ("注文", ["A2"]), ("見積", ["Q0"])]
+    assert journal.get("A1")["replica"] == "written"
+    assert journal.stats()["unreplicated"] == 0
+    assert journal.replicate() == 0
+
+
+def test_duplicate_record_no(make_journal):
+    journal = make_journal()
+    seq = journal.append("注文", ["山田"], record_no="A1")
+    assert journal.append("注文", ["山田"], record_no="A1") == seq  # 再送は同じ行
+    assert journal.append("見積", ["山田"], record_no="A1") != seq  # ワークシートが違えば別の記録
+    with pytest.raises(DuplicateIdError):
+        journal.append("注文", ["佐藤"], record_no="A1")
+    assert journal.stats()["duplicates"] == 1
+
+
+def test_retryable_error_releases_claim(make_journal, sheets, api_error):
+    sheets.errors = [api_error(429)]
+    journal = make_journal()
+    journal.append("注文", ["a"], record_no="A1")
+
+    with pytest.raises(api_error):
+        journal.replicate()
+    # リースを返しているので、リースの期限を待たずに次の呼び出しで書き込める
+    assert journal.get("A1")["replica"] == "pending"
+    assert journal.replicate() == 1
+    assert sheets.rows == {"注文": [["a"]]}
+
+
+def test_non_retryable_error_marks_failed_and_requeue(make_journal, sheets, api_error):
+    sheets.errors = [api_error(400)]
+    failed = []
+    journal = make_journal(on_failed=lambda title, nos, error: failed.append((title, nos, error.status_code)))
+    journal.append("注文", ["a"], record_no="A1")
+    journal.append("注文", ["b"], record_no="A2")
+
+    assert journal.replicate() == 0
+    assert failed == [("注文", ["A1", "A2"], 400)]
+    assert journal.get("A1")["replica"] == "failed"
+    assert journal.stats()["failed"] == 2
+
+    assert journal.requeue_failed() == 2
+    assert journal.replicate() == 2
+    assert sheets.rows == {"注文": [["a"], ["b"]]}
+    assert journal.stats()["failed"] == 0
+
+
+def test_expired_lease_is_taken_over(make_journal):
+    journal = make_journal(lease_seconds=0.2)
+    journal.append("注文", ["a"], record_no="A1")
+
+    title, rows = journal._claim("crashed-worker")
+    assert len(rows) == 1
+    assert journal.replicate() == 0  # リース中
+    time.sleep(0.25)
+    assert journal.replicate() == 1
+
+
+def test_concurrent_replicators_never_double_send(tmp_path):
+    sent = Counter()
+    lock = threading.Lock()
+
+    def append_rows(title, rows):
+        time.sleep(0.005)
+        with lock:
+            sent.update(row[0] for row in rows)
+
+    path = str(tmp_path / "journal.sqlite3")
+    journals = [OrderJournal(path, append_rows, batch_size=7) for _ in range(4)]
+    for i in range(300):
+        journals[i % 4].append("注文", [f"A{i}"], record_no=f"A{i}")
+
+    threads = [threading.Thread(target=j.replicate) for j in journals]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(sent) == 300
+    assert set(sent.values()) == {1}
+    assert journals[0].stats()["unreplicated"] == 0
+
+
+def test_import_sheet_queue_runs_once(tmp_path, make_journal):
+    queue_path = str(tmp_path / "sheet_write_queue.sqlite3")
+    with sqlite3.connect(queue_path) as queue:
+        queue.execute("CREATE TABLE pending (id INTEGER PRIMARY KEY, title TEXT, row TEXT, created_at REAL, ref TEXT)")
+        queue.execute("""INSERT INTO pending (title, row, created_at, ref) VALUES ('注文', '["a"]', 1760770000, 'A1')""")
+        queue.execute("""INSERT INTO pending (title, row, created_at, ref) VALUES ('見積', '["q"]', 1760770001, NULL)""")
+
+    journal = make_journal()
+    assert journal.import_sheet_queue(queue_path) == 2
+    assert journal.import_sheet_queue(queue_path) == 0
+    assert journal.get("A1")["created_date"] == "2025-10-18"
+    assert journal.stats()["unreplicated"] == 2
+    assert journal.import_sheet_queue(str(tmp_path / "missing.sqlite3")) == 0
+
+
+def test_lookups(make_journal):
+    journal = make_journal()
+    journal.append("注文", ["a"], record_no="A1", user_id="U1", data={"n": 1}, created_at=1760770000)
+    journal.append("注文", ["b"], record_no="A2", user_id="U2", created_at=1760856400)
+    journal.append("見積", ["c"], record_no="Q1", user_id="U1", created_at=1760856500)
+
+    assert [r["record_no"] for r in journal.find_by_user("U1")] == ["Q1", "A1"]
+    assert [r["record_no"] for r in journal.find_by_user("U1", title="注文")] == ["A1"]
+    assert [r["record_no"] for r in journal.iter_by_date("2025-10-18", "2025-10-19")] == ["A1", "A2", "Q1"]
+    assert [r["record_no"] for r in journal.iter_by_date("2025-10-19", title="注文")] == ["A2"]
+    assert journal.user_ids() == ["U1", "U2"]
+    assert journal.get("A1")["data"] == {"n": 1}
+    assert journal.get("missing") is None
+
+
+def test_append_rejects_when_backlog_is_full(make_journal, sheets, api_error):
+    journal = make_journal(max_backlog=2, full_timeout=0.05, flush_interval=0.01)
+    journal.append("注文", ["a"], record_no="A1")
+    journal.append("注文", ["b"], record_no="A2")
+    assert journal.is_full()
+
+    with pytest.raises(JournalFull):
+        journal.append("注文", ["c"], record_no="A3")
+    # 記録済みの再送は満杯でも受け付ける
+    assert journal.append("注文", ["a"], record_no="A1") == 1
+    assert journal.stats()["rejected"] == 1
+
+    # failed の行も上限に数える
+    sheets.errors = [api_error(400)]
+    assert journal.replicate() == 0
+    assert journal.backlog() == 2
+    with pytest.raises(JournalFull):
+        journal.append("注文", ["c"], record_no="A3", timeout=0)
+
+    assert journal.requeue_failed() == 2
+    assert journal.replicate() == 2
+    assert journal.append("注文", ["c"], record_no="A3", timeout=0) == 3
+
+
+def test_append_waits_for_replication(make_journal, sheets):
+    journal = make_journal(max_backlog=1, full_timeout=5, flush_interval=0.01)
+    journal.append("注文", ["a"], record_no="A1")
+
+    replicator = threading.Timer(0.1, journal.replicate)
+    replicator.start()
+    started = time.monotonic()
+    journal.append("注文", ["b"], record_no="A2")
+    replicator.join()
+    assert 0.05 < time.monotonic() - started < 5
+    assert sheets.rows == {"注文": [["a"]]}
+
+
+def test_import_sheet_queue_ignores_backlog_limit(tmp_path, make_journal):
+    queue_path = str(tmp_path / "sheet_write_queue.sqlite3")
+    with sqlite3.connect(queue_path) as queue:
+        queue.execute("CREATE TABLE pending (id INTEGER PRIMARY KEY, title TEXT, row TEXT, created_at REAL, ref TEXT)")
+        queue.executemany("INSERT INTO pending (title, row, created_at, ref) VALUES ('注文', '[]', 0, ?)",
+                          [(f"A{i}",) for i in range(3)])
+    journal = make_journal(max_backlog=1, full_timeout=0)
+    assert journal.import_sheet_queue(queue_path) == 3
+    assert journal.backlog() == 3
+
+
+def test_lease_is_renewed_during_slow_append(tmp_path):
+    writing, release, sent = threading.Event(), threading.Event(), []
+
+    def slow_append(title, rows):
+        writing.set()
+        release.wait(5)
+        sent.extend(rows)
+
+    journal = OrderJournal(str(tmp_path / "journal.sqlite3"), slow_append, lease_seconds=0.3)
+    journal.append("注文", ["a"], record_no="A1")
+    worker = threading.Thread(target=journal.replicate)
+    worker.start()
+    assert writing.wait(5)
+    time.sleep(0.6)  # リースの2倍以上書き込みが続いても
+    assert journal._claim("other-worker") == (None, [])
+    release.set()
+    worker.join(5)
+    assert sent == [["a"]]
+    assert journal.get("A1")["replica"] == "written"
+
+
+def test_failed_records_and_cli_requeue(make_journal, sheets, api_error, tmp_path):
+    sheets.errors = [api_error(400), api_error(400)]
+    journal = make_journal()
+    journal.append("注文", ["a"], record_no="A1")
+    journal.append("簡易見積", ["q"], record_no="Q1")
+    assert journal.replicate() == 0
+
+    assert [r["record_no"] for r in journal.failed_records()] == ["A1", "Q1"]
+    assert "400" in journal.failed_records(title="簡易見積")[0]["last_error"]
+
+    def cli(*args):
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "order_journal.py"), *args, "--path", journal.path],
+            capture_output=True, text=True, timeout=30, check=True,
+        )
+        return result.stdout
+
+    assert "failed 2 行" in cli("stats")
+    assert "Q1" in cli("failed", "--title", "簡易見積")
+    assert "1 行を送り直し待ちに戻しました" in cli("requeue", "--title", "注文")
+    assert [r["record_no"] for r in journal.failed_records()] == ["Q1"]
+    assert journal.replicate() == 1
+    assert sheets.rows["注文"] == [["a"]]
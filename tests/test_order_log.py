@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+import order_log
+from order_ids import DuplicateIdError
+from order_log import OrderLog
+
+
+def test_steps_run_in_order_and_complete(make_order_log):
+    calls = []
+    log = make_order_log({
+        "sheet": lambda order: calls.append(("sheet", order["name"])) or "queued",
+        "push": lambda order: calls.append(("push", order["name"])),
+    }, done_states={"sheet": {"written"}})
+    log.accept("A1", {"name": "山田"})
+
+    assert log.process_one() is True
+    assert calls == [("sheet", "山田"), ("push", "山田")]
+    assert log.status("A1")["steps"] == {"sheet": "queued", "push": "done"}
+    assert log.status("A1")["status"] == "processing"
+    log.mark(["A1"], "sheet", "written")
+    assert log.status("A1")["status"] == "completed"
+    assert log.process_one() is False
+
+
+def test_skip_and_duplicate_accept(make_order_log):
+    log = make_order_log({"push": lambda order: None})
+    log.accept("A1", {"name": "山田"}, skip=("push",))
+    log.accept("A1", {"name": "山田"})  # 同じ内容の再送は無視する
+    assert log.status("A1")["steps"] == {"push": "skipped"}
+    assert log.stats()["accepted"] == 1
+    with pytest.raises(DuplicateIdError):
+        log.accept("A1", {"name": "佐藤"})
+
+
+def test_lease_blocks_second_worker_until_expiry(make_order_log):
+    first = make_order_log({"push": lambda order: None}, lease_seconds=0.2)
+    second = make_order_log({"push": lambda order: None}, lease_seconds=0.2)
+    first.accept("A1", {})
+
+    assert first._claim("worker-1") is not None
+    assert second._claim("worker-2") is None  # リース中は他のワーカーに渡さない
+    time.sleep(0.25)
+    assert second._claim("worker-2") is not None  # リースが切れたら引き取れる
+
+
+def test_retryable_error_backs_off_then_succeeds(make_order_log, api_error, monkeypatch):
+    results = [api_error(503), api_error(429), None]
+
+    def push(order):
+        result = results.pop(0)
+        if result is not None:
+            raise result
+
+    now = [1000.0]
+    monkeypatch.setattr(order_log.time, "time", lambda: now[0])
+    log = make_order_log({"push": push}, backoff_base=2, backoff_max=3)
+    log.accept("A1", {})
+
+    assert log.process_one() is True
+    status = log.status("A1")
+    assert status["steps"] == {"push": "pending"}
+    assert status["attempts"] == 1
+    assert "503" in status["last_error"]
+    assert log.process_one() is False  # バックオフ中 (2 秒後)
+
+    now[0] += 2
+    assert log.process_one() is True
+    assert log.process_one() is False  # 2 回目は 4 秒 → backoff_max の 3 秒
+    now[0] += 3
+    assert log.process_one() is True
+    assert log.status("A1")["status"] == "completed"
+    assert log.stats()["retries"] == 2
+
+
+def test_non_retryable_error_fails_immediately(make_order_log, api_error):
+    def push(order):
+        raise api_error(400)
+
+    log = make_order_log({"push": push})
+    log.accept("A1", {})
+    assert log.process_one() is True
+    status = log.status("A1")
+    assert status["status"] == "failed"
+    assert status["steps"] == {"push": "failed"}
+    assert log.stats()["open"] == 0
+
+
+def test_gives_up_after_max_attempts(make_order_log):
+    def push(order):
+        raise ConnectionError("reset")
+
+    log = make_order_log({"push": push}, max_attempts=3, backoff_base=0, backoff_max=0)
+    log.accept("A1", {})
+    for _ in range(3):
+        assert log.process_one() is True
+    status = log.status("A1")
+    assert status["status"] == "failed"
+    assert status["attempts"] == 3
+    assert log.process_one() is False
+
+
+def test_unregistered_legacy_step_does_not_keep_order_open(tmp_path):
+    path = str(tmp_path / "orders.sqlite3")
+    OrderLog(path, {"sheet": lambda order: None, "push": lambda order: None}).accept("A1", {})
+    log = OrderLog(path, {"push": lambda order: None})
+    assert log.process_one() is True
+    assert log.status("A1")["steps"] == {"sheet": "pending", "push": "done"}
+    assert log.stats()["open"] == 0
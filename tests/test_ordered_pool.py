@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from ordered_pool import OrderedWorkerPool
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.005)
+
+
+def test_jobs_for_the_same_key_run_in_order():
+    seen = defaultdict(list)
+    lock = threading.Lock()
+
+    def work(key, n):
+        time.sleep(0.0005 * (n % 3))
+        with lock:
+            seen[key].append(n)
+
+    pool = OrderedWorkerPool(work, workers=4, max_queue=4000, name="test")
+    for n in range(200):
+        for key in ("U1", "U2", "U3", "U4", "U5"):
+            assert pool.submit(key, key, n)
+    wait_until(lambda: pool.stats()["processed"] == 1000)
+    assert all(seen[key] == list(range(200)) for key in seen)
+    assert len(seen) == 5
+
+
+def test_full_queue_rejects_after_timeout():
+    release = threading.Event()
+    pool = OrderedWorkerPool(lambda: release.wait(5), workers=1, max_queue=1, name="test")
+    assert pool.submit("U1")  # 処理中
+    wait_until(lambda: pool.depth() == 0)
+    assert pool.submit("U1")  # キューに1件
+
+    started = time.monotonic()
+    assert not pool.submit("U1", timeout=0.1)
+    assert time.monotonic() - started >= 0.1
+    assert not pool.submit("U1")
+    assert pool.stats()["rejected"] == 2
+
+    release.set()
+    wait_until(lambda: pool.stats()["processed"] == 2)
+    assert pool.submit("U1", timeout=0.1)
+
+
+def test_submit_waits_for_space():
+    release = threading.Event()
+    pool = OrderedWorkerPool(lambda: release.wait(5), workers=1, max_queue=1, name="test")
+    pool.submit("U1")
+    wait_until(lambda: pool.depth() == 0)
+    pool.submit("U1")
+    threading.Timer(0.05, release.set).start()
+    assert pool.submit("U1", timeout=2)
+
+
+def test_errors_are_logged_and_the_worker_keeps_going(caplog):
+    done = []
+
+    def work(n):
+        if n == 0:
+            raise RuntimeError("boom")
+        done.append(n)
+
+    pool = OrderedWorkerPool(work, workers=1, name="test", logger=logging.getLogger("pool-test"))
+    with caplog.at_level(logging.ERROR, logger="pool-test"):
+        pool.submit("U1", 0)
+        pool.submit("U1", 1)
+        wait_until(lambda: pool.stats()["processed"] == 2)
+    assert done == [1]
+    assert pool.stats()["errors"] == 1
+    assert "ジョブの処理に失敗しました" in caplog.text
@@ -0,0 +1,90 @@
+import sys
+
+import pytest
+
+from PRICE_TABLE_2025 import PRICE_TABLE
+from price_index import PRICE_INDEX, ROW_KEYS, CompactPriceTable, PriceIndex, PriceTableError, find_price_row
+
+
+def linear_find(item_name, discount_type, quantity):
+    # インデックス導入前の線形探索
+    for row in PRICE_TABLE:
+        if (row["item"] == item_name and row["discount_type"] == discount_type
+                and row["min_qty"] <= quantity <= row["max_qty"]):
+            return row
+    return None
+
+
+def tier(min_qty, max_qty, item="Tシャツ", discount_type="通常", unit_price=1000):
+    row = dict(PRICE_TABLE[0], item=item, discount_type=discount_type, min_qty=min_qty, max_qty=max_qty)
+    row["unit_price"] = unit_price
+    return row
+
+
+def test_find_matches_linear_scan_on_every_boundary():
+    quantities = sorted({q for row in PRICE_TABLE for q in (row["min_qty"] - 1, row["min_qty"], row["max_qty"],
+                                                            row["max_qty"] + 1)} | {0, 1, 10000})
+    for item, discount_type in PRICE_INDEX.keys():
+        for quantity in quantities:
+            expected = linear_find(item, discount_type, quantity)
+            found = find_price_row(item, discount_type, quantity)
+            assert (None if found is None else dict(found)) == expected, (item, discount_type, quantity)
+
+
+def test_unknown_item_or_discount():
+    assert find_price_row("未登録の商品", "通常", 20) is None
+    assert find_price_row(PRICE_TABLE[0]["item"], "半額", 20) is None
+
+
+def test_tiers_are_sorted_regardless_of_row_order():
+    index = PriceIndex([tier(30, 49, unit_price=900), tier(10, 29, unit_price=1000)])
+    assert index.find("Tシャツ", "通常", 9) is None
+    assert index.find("Tシャツ", "通常", 10)["unit_price"] == 1000
+    assert index.find("Tシャツ", "通常", 30)["unit_price"] == 900
+    assert index.find("Tシャツ", "通常", 50) is None
+
+
+def test_rejects_overlapping_tiers():
+    with pytest.raises(PriceTableError, match="重複"):
+        PriceIndex([tier(10, 29), tier(29, 49)])
+
+
+def test_rejects_missing_tiers():
+    with pytest.raises(PriceTableError, match="抜けています \\(30-34\\)"):
+        PriceIndex([tier(10, 29), tier(35, 49)])
+
+
+def test_rejects_inverted_tier():
+    with pytest.raises(PriceTableError, match="min_qty > max_qty"):
+        PriceIndex([tier(30, 10)])
+
+
+def test_tiers_are_checked_per_item_and_discount():
+    # 商品・割引区分が違えば枚数帯が重なってもよい
+    index = PriceIndex([tier(10, 29), tier(10, 29, discount_type="早割"), tier(10, 29, item="パーカー")])
+    assert len(index.keys()) == 3
+
+
+def test_compact_table_round_trips_rows():
+    table = CompactPriceTable(PRICE_TABLE)
+    assert len(table) == len(PRICE_TABLE)
+    assert [dict(row) for row in table] == PRICE_TABLE
+    row = table[0]
+    assert row["item"] is sys.intern(PRICE_TABLE[0]["item"])
+    assert set(row) == set(ROW_KEYS)
+    with pytest.raises(KeyError):
+        row["unknown"]
+
+
+def test_compact_table_rejects_missing_columns():
+    row = dict(PRICE_TABLE[0])
+    del row["unit_price"]
+    with pytest.raises(PriceTableError, match="1行目: 列が不足しています \\['unit_price'\\]"):
+        CompactPriceTable([PRICE_TABLE[0], row])
+
+
+def test_version_is_content_digest():
+    assert PriceIndex(PRICE_TABLE).version == PriceIndex([dict(r) for r in PRICE_TABLE]).version
+    changed = [dict(PRICE_TABLE[0], unit_price=PRICE_TABLE[0]["unit_price"] + 1)] + PRICE_TABLE[1:]
+    assert PriceIndex(changed).version != PriceIndex(PRICE_TABLE).version
+    assert PriceIndex(PRICE_TABLE, version="v1").version == "v1"
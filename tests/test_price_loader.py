@@ -0,0 +1,203 @@
+import csv
+import itertools
+import json
+import os
+
+import pytest
+
+import price_index
+import price_loader
+from price_index import ROW_KEYS, PriceTableError
+from price_loader import PriceTableWatcher
+
+
+def current_rows(change=0):
+    return [dict(row, unit_price=row["unit_price"] + change) for row in price_index.PRICE_INDEX.table]
+
+
+_mtimes = itertools.count(1_700_000_000)
+
+
+def write(path, payload):
+    # 同じ大きさで続けて書いても変更として拾えるよう、更新時刻を毎回ずらす
+    path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    mtime = next(_mtimes)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def watcher(tmp_path, restore_prices):
+    return PriceTableWatcher(str(tmp_path / "prices.json"), interval=3600)
+
+
+def test_reloads_when_the_file_changes(watcher, tmp_path):
+    path = tmp_path / "prices.json"
+    assert watcher.check() is False  # ファイルが無ければ現在の版のまま
+
+    write(path, {"version": "2026-04", "rows": current_rows(10)})
+    assert watcher.check() is True
+    assert price_index.PRICE_INDEX.version == "2026-04"
+    assert watcher.check() is False  # 変わっていなければ読み直さない
+
+    write(path, {"version": "2026-05", "rows": current_rows(20)})
+    assert watcher.check() is True
+    assert watcher.stats()["reloads"] == 2
+    assert watcher.stats()["version"] == "2026-05"
+
+
+@pytest.mark.parametrize("payload, message", [
+    ("{not json", "JSON"),
+    ({"version": "x"}, "行のリスト"),
+    ({"rows": []}, "空"),
+])
+def test_broken_files_keep_the_current_version(watcher, tmp_path, payload, message):
+    before = price_index.PRICE_INDEX
+    path = tmp_path / "prices.json"
+    if isinstance(payload, str):
+        path.write_text(payload, encoding="utf-8")
+    else:
+        write(path, payload)
+    assert watcher.check() is False
+    assert price_index.PRICE_INDEX is before
+    assert message in watcher.stats()["last_error"]
+    assert watcher.stats()["failures"] == 1
+
+
+def test_overlapping_tiers_are_rejected(watcher, tmp_path):
+    rows = current_rows()
+    key = (rows[0]["item"], rows[0]["discount_type"])
+    first, second = [r for r in rows if (r["item"], r["discount_type"]) == key][:2]
+    second["min_qty"] = first["max_qty"]
+    write(tmp_path / "prices.json", {"rows": rows})
+    assert watcher.check() is False
+    assert "重複" in watcher.stats()["last_error"]
+
+
+def test_new_items_are_rejected_with_the_reload_scope(watcher, tmp_path):
+    rows = current_rows() + [dict(current_rows()[0], item="新商品")]
+    write(tmp_path / "prices.json", {"rows": rows})
+    assert watcher.check() is False
+    assert "既存商品の価格だけ" in watcher.stats()["last_error"]
+
+
+def test_removed_items_are_rejected(watcher, tmp_path):
+    first = current_rows()[0]["item"]
+    write(tmp_path / "prices.json", {"rows": [r for r in current_rows() if r["item"] != first]})
+    assert watcher.check() is False
+    assert first in watcher.stats()["last_error"]
+
+
+def test_discount_types_cannot_change(restore_prices):
+    rows = current_rows() + [dict(r, discount_type="学割") for r in current_rows() if r["discount_type"] == "通常"]
+    with pytest.raises(PriceTableError, match="割引区分"):
+        price_index.reload_price_index(rows, validate=price_loader.validate_price_index)
+
+
+def test_csv_files_use_the_content_hash_as_version(tmp_path):
+    path = tmp_path / "prices_2026.csv"
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=ROW_KEYS)
+        writer.writeheader()
+        writer.writerows(current_rows())
+    rows, version = price_loader.load_price_file(str(path))
+    assert version.startswith("prices_2026@")
+    assert price_index.PriceIndex(rows).find(*next(iter(price_index.PRICE_INDEX.keys())), 30) is not None
+
+
+def sheet_records(change=0):
+    return [{k: (f"{v:,}" if k == "unit_price" else v) for k, v in row.items()} for row in current_rows(change)]
+
+
+class StopAfter:
+    """_run の待ち時間を記録し、n 回目で止める"""
+
+    def __init__(self, n):
+        self.n = n
+        self.delays = []
+
+    def wait(self, delay):
+        self.delays.append(delay)
+        return len(self.delays) > self.n
+
+    def clear(self):
+        pass
+
+
+@pytest.fixture
+def make_refresher(tmp_path):
+    def make(probe, fetch, **kwargs):
+        return price_loader.PriceSheetRefresher(str(tmp_path / "snapshot.json"), probe, fetch, **kwargs)
+    return make
+
+
+def test_refresh_skips_unchanged_probe_and_content(make_refresher, tmp_path):
+    revisions, fetches = ["r1", "r1", "r2", "r3"], []
+    records = [sheet_records(), sheet_records(), sheet_records(10)]
+    refresher = make_refresher(lambda: revisions.pop(0), lambda: fetches.append(1) or records.pop(0))
+
+    assert refresher.refresh() is True
+    version, revision = price_loader.read_snapshot_meta(str(tmp_path / "snapshot.json"))
+    assert (version.startswith("sheet@"), revision) == (True, "r1")
+    assert refresher.refresh() is False  # probe が同じなら取得しない
+    assert len(fetches) == 1
+    assert refresher.refresh() is False  # probe が変わっても内容が同じなら書き直さない
+    assert refresher.refresh() is True
+    assert refresher.stats()["fetches"] == 2
+    assert refresher.stats()["unchanged"] == 2
+
+
+def test_invalid_sheet_is_not_written(make_refresher, tmp_path):
+    records = sheet_records()
+    records[0]["unit_price"] = "お問い合わせ"
+    refresher = make_refresher(lambda: "r1", lambda: records)
+    with pytest.raises(PriceTableError, match="unit_price"):
+        refresher.refresh()
+    assert not (tmp_path / "snapshot.json").exists()
+
+
+def test_failures_back_off_and_success_resets(make_refresher):
+    outcomes = [OSError("down")] * 4 + [None, OSError("down")]
+
+    def probe():
+        outcome = outcomes.pop(0)
+        if outcome:
+            raise outcome
+        return "same"
+
+    refresher = make_refresher(probe, sheet_records, interval=10, backoff_max=35)
+    refresher._revision = "same"
+    refresher._stop = StopAfter(6)
+    refresher._run()
+    assert refresher._stop.delays == [0.0, 10, 20, 35, 35, 10, 10]
+    assert refresher.stats()["failures"] == 5
+    assert "down" in refresher.stats()["last_error"]
+
+
+class FakeWorksheet:
+    def __init__(self, values, cell=None):
+        self.values = values
+        self.cell = cell
+
+    def acell(self, label):
+        return type("Cell", (), {"value": self.cell})()
+
+    def get_all_values(self):
+        return self.values
+
+
+def probe_with(bot, monkeypatch, ws, version_cell=""):
+    sheets = type("Spreadsheet", (), {"worksheet": lambda self, title: ws})()
+    monkeypatch.setattr(bot, "with_spreadsheet", lambda func: func(sheets))
+    monkeypatch.setattr(bot, "PRICE_SHEET_VERSION_CELL", version_cell)
+    return bot._probe_price_sheet()
+
+
+def test_probe_looks_only_at_the_price_worksheet(bot, monkeypatch):
+    values = [["item", "unit_price"], ["ゲームシャツ", "1,650"]]
+    first = probe_with(bot, monkeypatch, FakeWorksheet(values))
+    assert first == probe_with(bot, monkeypatch, FakeWorksheet([list(r) for r in values]))
+    assert first != probe_with(bot, monkeypatch, FakeWorksheet([values[0], ["ゲームシャツ", "1,700"]]))
+
+    assert probe_with(bot, monkeypatch, FakeWorksheet(values, cell="v7"), version_cell="P1") == "cell:v7"
+    # 版セルが空なら内容のハッシュで確認する
+    assert probe_with(bot, monkeypatch, FakeWorksheet(values, cell=None), version_cell="P1") == first
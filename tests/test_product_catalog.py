@@ -0,0 +1,81 @@
+import gzip
+import json
+
+import pytest
+
+import product_catalog
+from product_catalog import CatalogAsset, parse_accept_encoding
+
+
+@pytest.fixture
+def asset():
+    asset = CatalogAsset({"names": ["ゲームシャツ"]})
+    # brotli が無い環境でも br の選択を確かめられるようにする
+    asset.encoded.setdefault("br", b"br-body")
+    return asset
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, br;q=0.5, identity; q=0, *;q=abc") == {
+        "gzip": 1.0, "br": 0.5, "identity": 0.0, "*": 0.0,
+    }
+    assert parse_accept_encoding(None) == {}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0.1, br;q=0", "gzip"),
+    ("identity", None),
+    ("", None),
+    (None, None),
+])
+def test_negotiate_respects_q_values(asset, header, expected):
+    encoding, body = asset.negotiate(header)
+    assert encoding == expected
+    assert body == (asset.encoded[expected] if expected else asset.body)
+
+
+def test_gzip_body_round_trips(asset):
+    assert json.loads(gzip.decompress(asset.encoded["gzip"])) == {"names": ["ゲームシャツ"]}
+
+
+def test_catalog_etag_and_cache_control(bot):
+    client = bot.app.test_client()
+    version = product_catalog.CATALOG_ASSET.version
+
+    resp = client.get(f"/web_order_catalog.json?v={version}", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert resp.get_etag()[0] == version
+    assert json.loads(gzip.decompress(resp.data)) == product_catalog.catalog_payload()
+
+    resp = client.get("/web_order_catalog.json", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in resp.headers
+    assert resp.headers["Cache-Control"] == "public, max-age=300"
+    assert json.loads(resp.data) == product_catalog.catalog_payload()
+
+    resp = client.get("/web_order_catalog.json", headers={"If-None-Match": f'"{version}"'})
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert resp.get_etag()[0] == version
+
+
+def test_shipped_catalog_is_valid():
+    product_catalog.validate_catalog()
+    colors = product_catalog.NAME_NUMBER_SINGLE_COLORS
+    assert len(colors) == len(set(colors))
+
+
+@pytest.mark.parametrize("name", ["PRODUCT_NAMES", "NAME_NUMBER_SINGLE_COLORS", "NAME_NUMBER_EDGE_COLORS"])
+def test_validate_catalog_rejects_duplicates(monkeypatch, name):
+    values = getattr(product_catalog, name)
+    monkeypatch.setattr(product_catalog, name, values + [values[-1]])
+    with pytest.raises(product_catalog.CatalogError, match=name):
+        product_catalog.validate_catalog()
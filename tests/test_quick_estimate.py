@@ -0,0 +1,52 @@
+import csv
+import io
+import itertools
+
+import price_index
+import quick_estimate
+from quick_estimate import (
+    BACK_NAMES, COLOR_COST_MAP_BOTH, COLOR_COST_MAP_SINGLE, DISCOUNT_TYPES, ESTIMATE_ITEMS, NO_BACK_NAME,
+    PRINT_POSITIONS, QUANTITY_MAP, SINGLE_POSITIONS, calculate_estimate, compute_estimate, quote_estimate,
+)
+
+
+def all_choices():
+    for item, discount_type, quantity, position in itertools.product(
+            ESTIMATE_ITEMS, DISCOUNT_TYPES, QUANTITY_MAP, PRINT_POSITIONS):
+        colors = COLOR_COST_MAP_SINGLE if position in SINGLE_POSITIONS else COLOR_COST_MAP_BOTH
+        for color, back_name in itertools.product(colors, BACK_NAMES + [NO_BACK_NAME]):
+            yield {"item": item, "discount_type": discount_type, "quantity": quantity,
+                   "print_position": position, "color_count": color, "back_name": back_name}
+
+
+def test_matrix_matches_direct_calculation():
+    count = 0  # 6600 通り
+    for data in all_choices():
+        assert calculate_estimate(data) == compute_estimate(data), data
+        count += 1
+    assert count == len(ESTIMATE_ITEMS) * len(DISCOUNT_TYPES) * len(QUANTITY_MAP) * 5 * (2 * 3 + 5)
+
+
+def test_inputs_outside_the_choices_fall_back_to_direct_calculation():
+    data = {"item": ESTIMATE_ITEMS[0], "discount_type": "通常", "quantity": "20～29枚",
+            "print_position": "前と背中", "color_count": "前と背中 前2色 背中2色", "back_name": "未知の背ネーム"}
+    assert calculate_estimate(data) == compute_estimate(data)
+    assert calculate_estimate(dict(data, item="未登録の商品")) == (0, 0)
+    assert calculate_estimate(dict(data, quantity="1000枚")) == compute_estimate(dict(data, quantity="1000枚"))
+
+
+def test_quote_records_matrix_version():
+    data = next(all_choices())
+    assert quote_estimate(data)[2] == price_index.PRICE_INDEX.version
+
+
+def test_export_skips_duplicate_and_invalid_combinations():
+    f = io.StringIO()
+    quick_estimate.QUOTE_MATRIX.export_csv(f)
+    rows = list(csv.reader(io.StringIO(f.getvalue())))
+    body = rows[1:]
+    assert len(body) == len(ESTIMATE_ITEMS) * len(DISCOUNT_TYPES) * len(QUANTITY_MAP) * (2 * 3 + 5 * 5)
+    for item, discount_type, quantity, position, color, back_name, total, unit in body[:50]:
+        data = {"item": item, "discount_type": discount_type, "quantity": quantity, "print_position": position,
+                "color_count": color, "back_name": back_name}
+        assert (int(total), int(unit)) == compute_estimate(data)
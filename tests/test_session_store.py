@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from session_store import MemorySessionStore, SQLiteSessionStore, create_session_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(ttl=60, **kwargs):
+        if request.param == "memory":
+            return MemorySessionStore(ttl=ttl, **kwargs)
+        return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl=ttl, **kwargs)
+    return make
+
+
+def test_values_are_stored_as_copies(make_store):
+    store = make_store()
+    data = {"step": 1, "answers": {}}
+    store["U1"] = data
+    data["step"] = 2
+    assert store["U1"] == {"step": 1, "answers": {}}
+    assert "U1" in store
+    assert store.get("U2") is None
+    with pytest.raises(KeyError):
+        store["U2"]
+
+
+def test_entries_expire_after_ttl(make_store):
+    store = make_store(ttl=0.05)
+    store["U1"] = {"step": 1}
+    assert store.get("U1") == {"step": 1}
+    time.sleep(0.1)
+    assert store.get("U1") is None
+    assert "U1" not in store
+
+
+def test_write_extends_ttl(make_store):
+    store = make_store(ttl=0.15)
+    store["U1"] = {"step": 1}
+    time.sleep(0.1)
+    store["U1"] = {"step": 2}
+    time.sleep(0.1)
+    assert store.get("U1") == {"step": 2}
+
+
+def test_setdefault_keeps_first_value(make_store):
+    store = make_store()
+    first = {"order_no": "A1"}
+    assert store.setdefault("k", first) is first
+    assert store.setdefault("k", {"order_no": "A2"}) == first
+
+
+def test_setdefault_replaces_expired_entry(make_store):
+    store = make_store(ttl=0.05)
+    store.setdefault("k", {"order_no": "A1"})
+    time.sleep(0.1)
+    assert store.setdefault("k", {"order_no": "A2"}) == {"order_no": "A2"}
+
+
+def test_setdefault_is_atomic_across_threads(make_store):
+    store = make_store()
+    winners = []
+    barrier = threading.Barrier(8)
+
+    def claim(n):
+        barrier.wait()
+        winners.append(store.setdefault("k", {"n": n})["n"])
+
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(winners)) == 1
+
+
+def test_pop_and_delete(make_store):
+    store = make_store()
+    store["U1"] = {"step": 1}
+    assert store.pop("U1") == {"step": 1}
+    assert store.pop("U1", "none") == "none"
+    with pytest.raises(KeyError):
+        del store["U1"]
+
+
+def test_sweep_removes_only_expired(make_store):
+    store = make_store(ttl=0.05)
+    store["old"] = {}
+    time.sleep(0.1)
+    store.ttl = 60
+    store["new"] = {}
+    assert store.sweep() == 1
+    assert len(store) == 1
+
+
+def test_sweeper_logs_failures(make_store, caplog):
+    store = make_store(sweep_interval=0.01, logger=logging.getLogger("sessions-test"))
+    swept = threading.Event()
+
+    def broken_sweep():
+        swept.set()
+        raise RuntimeError("database is locked")
+
+    store.sweep = broken_sweep
+    with caplog.at_level(logging.ERROR, logger="sessions-test"):
+        store["U1"] = {}
+        assert swept.wait(2)
+        time.sleep(0.05)
+        # スイーパーのスレッドは止められないので、以降は失敗させず間隔も空ける
+        store.sweep_interval = 3600
+        store.sweep = lambda: 0
+    assert "期限切れセッションの削除に失敗しました" in caplog.text
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    worker1 = SQLiteSessionStore(path)
+    worker2 = SQLiteSessionStore(path)
+    worker1["U1"] = {"step": 3}
+    assert worker2["U1"] == {"step": 3}
+
+
+def test_create_session_store_from_environment(tmp_path, monkeypatch):
+    assert isinstance(create_session_store(), MemorySessionStore)
+    monkeypatch.setenv("ESTIMATE_SESSION_BACKEND", "sqlite")
+    monkeypatch.setenv("ESTIMATE_SESSION_PATH", str(tmp_path / "s.sqlite3"))
+    monkeypatch.setenv("ESTIMATE_SESSION_TTL", "5")
+    store = create_session_store()
+    assert isinstance(store, SQLiteSessionStore)
+    assert store.ttl == 5
+    monkeypatch.setenv("ESTIMATE_SESSION_BACKEND", "redis")
+    with pytest.raises(ValueError):
+        create_session_store()
+
+
+def test_bot_shares_estimate_sessions_between_workers(bot):
+    assert isinstance(bot.user_estimate_sessions, SQLiteSessionStore)
+    assert isinstance(bot.submitted_requests, SQLiteSessionStore)
@@ -0,0 +1,153 @@
+import csv
+import re
+from datetime import datetime
+
+import pytest
+
+import sheet_export
+from sheet_export import JST, SheetExporter, column_letter, convert_value, exported_through
+
+HEADER = ["タイムスタンプ", "注文番号", "合計金額", "メモ"]
+HEADER_MAP = {"タイムスタンプ": "timestamp", "注文番号": "orderNo", "合計金額": "totalPrice"}
+KEYS = ["timestamp", "orderNo", "totalPrice"]
+
+
+class ApiError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.response = type("Response", (), {"status_code": status_code})()
+
+
+class FakeWorksheet:
+    title = "WebOrderRequests"
+
+    def __init__(self, rows, row_count=None, errors=()):
+        self.rows = [HEADER] + rows
+        self._row_count = row_count
+        self.errors = list(errors)
+        self.ranges = []
+
+    @property
+    def row_count(self):
+        return self._row_count or len(self.rows) + 10  # シート末尾の空行
+
+    def row_values(self, n):
+        return self.rows[n - 1]
+
+    def get(self, a1):
+        self.ranges.append(a1)
+        if self.errors:
+            error = self.errors.pop(0)
+            if error:
+                raise error
+        first, last = map(int, re.findall(r"\d+", a1))
+        values = self.rows[first - 1:last]
+        while values and not any(values[-1]):
+            values.pop()  # Sheets API は末尾の空行を返さない
+        return values
+
+
+def order(n, total="¥1,480"):
+    return [f"2026/04/{n % 28 + 1:02d} 10:00:00", f"W{n:04d}", total, "メモ"]
+
+
+def read_parts(directory):
+    rows = []
+    for path in sorted(directory.glob("part-*.csv")):
+        with open(path, encoding="utf-8", newline="") as f:
+            rows.extend(csv.DictReader(f))
+    return rows
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    return SheetExporter(str(tmp_path), "csv", page_rows=2, part_rows=3, backoff_base=0)
+
+
+def test_convert_value():
+    assert convert_value(" ¥1,480 ", "int") == (1480, True)
+    assert convert_value("30枚", "int") == (30, True)
+    assert convert_value("12.5", "float") == (12.5, True)
+    assert convert_value("2026/04/01 09:30:00", "datetime") == (datetime(2026, 4, 1, 9, 30, tzinfo=JST), True)
+    assert convert_value("", "int") == (None, True)
+    assert convert_value("お見積り", "int") == (None, False)
+    assert convert_value("来週", "datetime") == (None, False)
+
+
+def test_column_letter():
+    assert [column_letter(n) for n in (1, 26, 27, 52, 703)] == ["A", "Z", "AA", "AZ", "AAA"]
+
+
+def test_exported_through_reads_part_names(tmp_path):
+    assert exported_through(str(tmp_path / "missing")) == 1
+    for name in ("part-00000002-00000501.csv", "part-00000502-00000800.parquet",
+                 ".part-00000801.csv.tmp", "part-9.csv", "notes.txt"):
+        (tmp_path / name).write_text("")
+    assert exported_through(str(tmp_path)) == 800
+
+
+def test_export_in_pages_and_parts(exporter, tmp_path):
+    ws = FakeWorksheet([order(n) for n in range(1, 6)])
+    stats = exporter.export(ws, "web_orders", KEYS, HEADER_MAP)
+
+    assert stats == {"sheet": "WebOrderRequests", "start_row": 2, "rows": 5, "parts": 2, "invalid": 0,
+                     "exported_through": 6}
+    assert sorted(p.name for p in (tmp_path / "web_orders").iterdir()) == [
+        "part-00000002-00000005.csv", "part-00000006-00000006.csv",
+    ]
+    assert ws.ranges == ["A2:D3", "A4:D5", "A6:D7", "A8:D9"]
+    rows = read_parts(tmp_path / "web_orders")
+    assert [r["orderNo"] for r in rows] == [f"W{n:04d}" for n in range(1, 6)]
+    assert rows[0] == {"timestamp": "2026-04-02T10:00:00+09:00", "orderNo": "W0001", "totalPrice": "1480"}
+
+
+def test_rerun_resumes_after_the_last_part(exporter, tmp_path):
+    ws = FakeWorksheet([order(n) for n in range(1, 4)])
+    exporter.export(ws, "web_orders", KEYS, HEADER_MAP)
+    before = {p.name: p.read_bytes() for p in (tmp_path / "web_orders").iterdir()}
+
+    ws.rows += [order(4), order(5, total="未定")]
+    ws.ranges.clear()
+    stats = exporter.export(ws, "web_orders", KEYS, HEADER_MAP)
+    assert (stats["start_row"], stats["rows"], stats["invalid"], stats["exported_through"]) == (5, 2, 1, 6)
+    assert ws.ranges[0] == "A5:D6"
+    for name, data in before.items():
+        assert (tmp_path / "web_orders" / name).read_bytes() == data
+    rows = read_parts(tmp_path / "web_orders")
+    assert [r["orderNo"] for r in rows] == [f"W{n:04d}" for n in range(1, 6)]
+    assert rows[-1]["totalPrice"] == ""
+
+    # 新しい行が無ければ何も書かない
+    assert exporter.export(ws, "web_orders", KEYS, HEADER_MAP)["parts"] == 0
+
+
+def test_failed_export_leaves_no_partial_part(exporter, tmp_path):
+    ws = FakeWorksheet([order(n) for n in range(1, 6)], errors=[None, None, ApiError(400)])
+    with pytest.raises(ApiError):
+        exporter.export(ws, "web_orders", KEYS, HEADER_MAP)
+    names = sorted(p.name for p in (tmp_path / "web_orders").iterdir())
+    assert names == ["part-00000002-00000005.csv"]
+
+    ws.errors = [ApiError(503), ApiError(429)]  # 一時的なエラーは読み直す
+    stats = exporter.export(ws, "web_orders", KEYS, HEADER_MAP)
+    assert (stats["start_row"], stats["rows"]) == (6, 1)
+    assert [r["orderNo"] for r in read_parts(tmp_path / "web_orders")] == [f"W{n:04d}" for n in range(1, 6)]
+
+
+def test_old_headers_and_blank_rows(exporter, tmp_path):
+    # ページ末尾の空行は API が省くので、短いページの後も読み続ける
+    ws = FakeWorksheet([order(1), ["", "", "", ""], order(3)])
+    ws.rows[0] = ["受付日時", "注文番号", "合計金額"]
+    stats = exporter.export(ws, "web_orders", KEYS, dict(HEADER_MAP, 受付日時="timestamp"))
+    assert (stats["rows"], stats["exported_through"]) == (2, 4)
+    assert [r["timestamp"][:10] for r in read_parts(tmp_path / "web_orders")] == ["2026-04-02", "2026-04-04"]
+
+
+def test_parquet_parts(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    exporter = SheetExporter(str(tmp_path), "parquet", page_rows=2, part_rows=10)
+    exporter.export(FakeWorksheet([order(n) for n in range(1, 4)]), "web_orders", KEYS, HEADER_MAP)
+    (path,) = (tmp_path / "web_orders").glob("part-*.parquet")
+    table = pq.read_table(path)
+    assert table.column("totalPrice").to_pylist() == [1480] * 3
+    assert sheet_export.exported_through(str(tmp_path / "web_orders")) == 4
@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import vector_estimate  # noqa: E402
+from bench_vector_estimate import random_forms  # noqa: E402
+from web_order_estimate import calculate_web_order_estimate, compute_web_order_estimate  # noqa: E402
+
+
+def test_random_forms_match_scalar():
+    forms = random_forms(3000, seed=1)
+    assert vector_estimate.audit(forms) == []
+
+
+def test_matches_public_scalar_api():
+    forms = random_forms(200, seed=2)
+    for vec, form in zip(vector_estimate.estimate_forms(forms), forms):
+        assert vec == calculate_web_order_estimate(form)
+
+
+def test_edge_cases():
+    index = vector_estimate.get_price_vectors().index
+    forms = [
+        {},
+        {"productName": "未登録の商品", "totalQuantity": "10"},
+        {"totalQuantity": "-5"},
+    ]
+    assert vector_estimate.estimate_forms(forms) == [compute_web_order_estimate(f, index) for f in forms]
+
+
+def test_invalid_quantity_raises_like_scalar():
+    form = {"productName": "", "totalQuantity": "abc"}
+    with pytest.raises(ValueError):
+        calculate_web_order_estimate(form)
+    with pytest.raises(ValueError):
+        vector_estimate.estimate_forms([form])
+
+
+def test_empty_input():
+    assert vector_estimate.estimate_forms([]) == []
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import price_index
+import web_order_estimate
+from bench_vector_estimate import random_forms
+from web_order_estimate import (
+    calculate_web_order_estimate, canonical_estimate_key, compute_web_order_estimate, estimate_cache_info,
+)
+
+FORM = {
+    "productName": "ドライTシャツ", "totalQuantity": "30", "discountOption": "早割",
+    "printPositionNo1": "1", "printColorOption1_1": "ホワイト", "printColorOption1_2": "ブラック",
+    "edgeType1": "なし", "edgeCustomTextColor1": "ゴールド",
+}
+
+
+def test_cached_matches_direct_calculation():
+    for form in random_forms(2000, seed=5):
+        assert calculate_web_order_estimate(form) == compute_web_order_estimate(form)
+
+
+def test_key_ignores_fields_that_do_not_affect_price():
+    key = canonical_estimate_key(FORM)
+    assert canonical_estimate_key(dict(FORM, schoolName="○○高校", lineUserId="U1", sizeM="10")) == key
+    # 色の並び順・フチ無しのときのフチ色・割引の表記ゆれ
+    assert canonical_estimate_key(dict(FORM, printColorOption1_1="ブラック", printColorOption1_2="ホワイト")) == key
+    assert canonical_estimate_key(dict(FORM, edgeCustomTextColor1="シルバー")) == key
+    assert canonical_estimate_key(dict(FORM, discountOption="")) == canonical_estimate_key(
+        dict(FORM, discountOption="いっしょ割"))
+    # 料金に関係する項目は区別する
+    assert canonical_estimate_key(dict(FORM, edgeType1="フチ付き")) != key
+    assert canonical_estimate_key(dict(FORM, totalQuantity="31")) != key
+
+
+def test_repeat_hits_cache_and_returns_copies():
+    web_order_estimate.clear_estimate_cache()
+    first = calculate_web_order_estimate(FORM)
+    first["total_price"] = -1
+    second = calculate_web_order_estimate(dict(FORM, schoolName="別の学校"))
+    assert second == compute_web_order_estimate(FORM)
+    info = estimate_cache_info()
+    assert (info["hits"], info["misses"], info["currsize"]) == (1, 1, 1)
+
+
+def test_price_reload_clears_cache(restore_prices):
+    calculate_web_order_estimate(FORM)
+    rows = [dict(row, unit_price=row["unit_price"] + 10) for row in price_index.PRICE_INDEX.table]
+    price_index.reload_price_index(rows, version="test-v2")
+    assert estimate_cache_info()["currsize"] == 0
+    est = calculate_web_order_estimate(FORM)
+    assert est["price_version"] == "test-v2"
+    assert est == compute_web_order_estimate(FORM)
+
+
+def test_quote_endpoint_accepts_json_and_form(bot):
+    client = bot.app.test_client()
+    expected = compute_web_order_estimate(FORM)
+    assert client.post("/web_order_quote", json=FORM).get_json() == expected
+    assert client.post("/web_order_quote", data=FORM).get_json() == expected
+
+
+@pytest.mark.parametrize("body, message", [
+    ('{"productName": "ドライTシャツ", ', "読み取れません"),
+    ("null", "読み取れません"),
+    ('["ドライTシャツ"]', "オブジェクト"),
+    (json.dumps(dict(FORM, totalQuantity="たくさん")), "合計枚数"),
+])
+def test_quote_endpoint_rejects_bad_json(bot, body, message):
+    resp = bot.app.test_client().post("/web_order_quote", data=body.encode("utf-8"),
+                                      content_type="application/json")
+    assert resp.status_code == 400
+    assert message in resp.get_json()["error"]
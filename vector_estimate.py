@@ -0,0 +1,285 @@
+"""
+Web オーダー見積りの一括計算 (NumPy による列指向版)
+
+レポートや価格監査で数十万件を計算するときに使う。
+calculate_web_order_estimate と同じ計算を、件数ぶんの配列に対してまとめて行う。
+
+- 価格行の検索: (商品, 割引区分, 枚数下限) を1つの整数キーに並べ、np.searchsorted で引く
+- 料金: 色数・オプションインク数・フルカラーサイズ・フチ有無などの列から配列演算で求める
+
+入力は EstimateColumns (列の集まり)。フォームの dict から作る場合は encode_forms を使う。
+NumPy は任意の依存 (requirements-optional.txt) なので、この機能を使う環境にだけ入れればよい。
+NumPy が無い環境では、同じ結果を返すスカラー版 web_order_estimate.calculate_web_order_estimate
+(大量件数なら bulk_quote.quote_many) を使う。Bot 本体はこのモジュールを import しない。
+
+    python vector_estimate.py orders.jsonl   # スカラー版と全件一致するか確認する
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+import price_index
+from PRICE_TABLE_2025 import (
+    COLOR_ATTR_MAP, SPECIAL_SINGLE_COLOR_FEE, FULLCOLOR_SIZE_FEE, BACK_NAME_FEE, OPTION_INK_EXTRA
+)
+from web_order_estimate import PRINT_POSITION_RANGE, compute_web_order_estimate
+
+# 割引区分のコード (フォームの discountOption は 早割 以外すべて 通常)
+DISCOUNT_CODES = {"通常": 0, "早割": 1}
+# フルカラーサイズのコード (0 は指定なし)
+FULLCOLOR_SIZES = ("",) + tuple(FULLCOLOR_SIZE_FEE)
+FULLCOLOR_SIZE_CODES = {size: i for i, size in enumerate(FULLCOLOR_SIZES)}
+FULLCOLOR_FEE_BY_CODE = np.array([FULLCOLOR_SIZE_FEE.get(size, 0) for size in FULLCOLOR_SIZES], dtype=np.int64)
+# フチ付き1箇所あたりの加算
+EDGE_FEE = 100
+
+N_POSITIONS = len(PRINT_POSITION_RANGE)
+
+ESTIMATE_FIELDS = (
+    "unit_price", "total_price", "base_unit", "pos_add_fee", "color_fee",
+    "back_name_fee", "option_ink_extra", "fullcolor_extra", "qty",
+)
+
+
+class EstimateColumns(NamedTuple):
+    """
+    見積り条件の列。n 件ぶんで、プリント位置ごとの列は (n, 4)。
+    fixed_fee は色名で決まる固定費 (背ネーム・特殊色・単色・フチのカスタム色) の合計。
+    """
+    item: np.ndarray            # 商品コード (PriceVectors.item_codes、未登録は -1)
+    discount: np.ndarray        # DISCOUNT_CODES
+    qty: np.ndarray
+    position: np.ndarray        # (n, 4) bool プリント位置の有無
+    color_count: np.ndarray     # (n, 4) 入力された色数 (0〜3)
+    ink_count: np.ndarray       # (n, 4) オプションインクの色数
+    fullcolor_size: np.ndarray  # (n, 4) FULLCOLOR_SIZE_CODES
+    edge: np.ndarray            # (n, 4) bool フチ付き
+    fixed_fee: np.ndarray       # (n,)
+
+
+class PriceVectors:
+    """
+    価格表を np.searchsorted 用に並べ直したもの。
+    キーは (商品コード * 割引区分数 + 割引コード) * stride + 枚数下限 で昇順。
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.version = index.version
+        table = index.table
+        self.item_names = table.item_names
+        self.item_codes = {name: i for i, name in enumerate(self.item_names)}
+
+        # 割引区分は DISCOUNT_CODES の並びに揃える (価格表に無い区分の行は使われない)
+        discount_map = np.array([DISCOUNT_CODES.get(d, -1) for d in table.discount_types], dtype=np.int64)
+        item = np.frombuffer(table.item_col, dtype=np.uint16).astype(np.int64)
+        discount = discount_map[np.frombuffer(table.discount_col, dtype=np.uint8)]
+        cols = {field: np.frombuffer(col, dtype=np.int32).astype(np.int64) for field, col in table.columns.items()}
+
+        keep = discount >= 0
+        self.n_discounts = len(DISCOUNT_CODES)
+        # 枚数の上限より大きな刻みにして、商品・割引区分ごとのキーが重ならないようにする
+        self.stride = int(cols["max_qty"].max(initial=0)) + 2
+        group = item * self.n_discounts + discount
+        keys = group * self.stride + cols["min_qty"]
+
+        order = np.argsort(keys[keep], kind="stable")
+        self.keys = keys[keep][order]
+        self.group = group[keep][order]
+        self.max_qty = cols["max_qty"][keep][order]
+        self.unit_price = cols["unit_price"][keep][order]
+        self.pos_add = cols["pos_add"][keep][order]
+        self.color_add = cols["color_add"][keep][order]
+
+    def find(self, item, discount, qty):
+        """各件の価格行の位置を返す。該当なしは -1"""
+        item = np.asarray(item, dtype=np.int64)
+        qty = np.asarray(qty, dtype=np.int64)
+        group = item * self.n_discounts + np.asarray(discount, dtype=np.int64)
+        if not len(self.keys):
+            return np.full(group.shape, -1, dtype=np.int64)
+        # 枚数を [-1, stride-1] に収めても、範囲外は下の判定で該当なしになる
+        probe = group * self.stride + np.clip(qty, -1, self.stride - 1)
+        i = np.searchsorted(self.keys, probe, side="right") - 1
+        safe = np.maximum(i, 0)
+        found = (
+            (i >= 0) & (item >= 0)
+            & (self.group[safe] == group)
+            & (qty >= self.keys[safe] - group * self.stride)
+            & (qty <= self.max_qty[safe])
+        )
+        return np.where(found, i, -1)
+
+
+_vectors = None
+
+
+def get_price_vectors():
+    """現在の価格表の PriceVectors (差し替え後に初めて呼ばれた場合は作り直す)"""
+    global _vectors
+    vectors = _vectors
+    if vectors is None or vectors.index is not price_index.PRICE_INDEX:
+        vectors = _vectors = PriceVectors(price_index.PRICE_INDEX)
+    return vectors
+
+
+@price_index.on_price_reload
+def rebuild_price_vectors(index=None):
+    global _vectors
+    _vectors = PriceVectors(index if index is not None else price_index.PRICE_INDEX)
+    return _vectors
+
+
+# -----------------------
+# フォーム → 列
+# -----------------------
+def _color_fixed_fee(color):
+    return BACK_NAME_FEE.get(color, 0) + SPECIAL_SINGLE_COLOR_FEE.get(color, 0)
+
+
+def encode_forms(forms, vectors=None):
+    """フォームの dict のリストを EstimateColumns にする (totalQuantity が数字でなければ ValueError)"""
+    vectors = vectors or get_price_vectors()
+    item_codes = vectors.item_codes
+    # 要素ごとに ndarray へ書くと遅いので、list に溜めてから配列にする
+    item, discount, qty, fixed_fee = [], [], [], []
+    position, color_count, ink_count, fullcolor_size, edge = [], [], [], [], []
+
+    for data in forms:
+        item.append(item_codes.get(data.get("productName", ""), -1))
+        discount.append(DISCOUNT_CODES["早割" if data.get("discountOption") == "早割" else "通常"])
+        qty.append(int(data.get("totalQuantity", "0") or 0))
+        fee = 0
+        pos_row, color_row, ink_row, size_row, edge_row = [], [], [], [], []
+        for p in PRINT_POSITION_RANGE:
+            if not data.get(f"printPositionNo{p}"):
+                pos_row.append(0)
+                color_row.append(0)
+                ink_row.append(0)
+                size_row.append(0)
+                edge_row.append(0)
+                continue
+            colors = [c for c in (data.get(f"printColorOption{p}_{i}") for i in (1, 2, 3)) if c]
+            pos_row.append(1)
+            color_row.append(len(colors))
+            ink_row.append(sum(1 for c in colors if COLOR_ATTR_MAP.get(c) == "オプションインク"))
+            fee += sum(_color_fixed_fee(c) for c in colors)
+            # サイズ表に無い値は料金 0 (指定なしと同じ)
+            size_row.append(FULLCOLOR_SIZE_CODES.get(data.get(f"fullColorSize{p}") or "", 0))
+            fee += SPECIAL_SINGLE_COLOR_FEE.get(data.get(f"singleColor{p}") or "", 0)
+            edge_type = data.get(f"edgeType{p}")
+            if edge_type and edge_type != "なし":
+                edge_row.append(1)
+                for key in (f"edgeCustomTextColor{p}", f"edgeCustomEdgeColor{p}", f"edgeCustomEdgeColor2_{p}"):
+                    fee += SPECIAL_SINGLE_COLOR_FEE.get(data.get(key) or "", 0)
+            else:
+                edge_row.append(0)
+        position.append(pos_row)
+        color_count.append(color_row)
+        ink_count.append(ink_row)
+        fullcolor_size.append(size_row)
+        edge.append(edge_row)
+        fixed_fee.append(fee)
+
+    def matrix(rows, dtype):
+        return np.array(rows, dtype=dtype).reshape(len(rows), N_POSITIONS)
+
+    return EstimateColumns(
+        np.array(item, dtype=np.int64),
+        np.array(discount, dtype=np.int64),
+        np.array(qty, dtype=np.int64),
+        matrix(position, bool),
+        matrix(color_count, np.int64),
+        matrix(ink_count, np.int64),
+        matrix(fullcolor_size, np.int64),
+        matrix(edge, bool),
+        np.array(fixed_fee, dtype=np.int64),
+    )
+
+
+# -----------------------
+# 計算
+# -----------------------
+def estimate_columns(cols, vectors=None):
+    """
+    EstimateColumns から calculate_web_order_estimate と同じ内訳を列で返す。
+    戻り値は {ESTIMATE_FIELDS の各項目: int64 の配列} と price_version (計算に使った版)。
+    価格行が無い件は qty 以外 0。
+    """
+    vectors = vectors or get_price_vectors()
+    qty = np.asarray(cols.qty, dtype=np.int64)
+    row = vectors.find(cols.item, cols.discount, qty)
+    found = row >= 0
+    safe = np.maximum(row, 0)
+
+    position = np.asarray(cols.position, dtype=bool)
+    pos_cnt = position.sum(axis=1)
+    # 2色なら +1、3色なら +2 (有効なプリント位置のみ)
+    color_add_cnt = np.where(position, np.maximum(np.asarray(cols.color_count) - 1, 0), 0).sum(axis=1)
+    option_ink_extra = np.where(position, cols.ink_count, 0).sum(axis=1) * OPTION_INK_EXTRA
+    fullcolor_extra = np.where(position, FULLCOLOR_FEE_BY_CODE[cols.fullcolor_size], 0).sum(axis=1)
+    back_name_fee = np.asarray(cols.fixed_fee, dtype=np.int64) + (position & cols.edge).sum(axis=1) * EDGE_FEE
+
+    base_unit = vectors.unit_price[safe]
+    pos_add_fee = vectors.pos_add[safe] * np.maximum(pos_cnt - 1, 0)
+    color_fee = color_add_cnt * vectors.color_add[safe] + fullcolor_extra + option_ink_extra
+    unit_price = base_unit + pos_add_fee + color_fee + back_name_fee
+
+    out = {
+        "unit_price": unit_price,
+        "total_price": unit_price * qty,
+        "base_unit": base_unit,
+        "pos_add_fee": pos_add_fee,
+        "color_fee": color_fee,
+        "back_name_fee": back_name_fee,
+        "option_ink_extra": option_ink_extra,
+        "fullcolor_extra": fullcolor_extra,
+    }
+    for key, values in out.items():
+        out[key] = np.where(found, values, 0)
+    out["qty"] = qty
+    out["price_version"] = vectors.version
+    return out
+
+
+def estimate_forms(forms, vectors=None):
+    """フォームの dict のリストを計算し、calculate_web_order_estimate と同じ形の dict のリストを返す"""
+    # 列の作成と計算で同じ版の価格表を使う
+    vectors = vectors or get_price_vectors()
+    return to_dicts(estimate_columns(encode_forms(forms, vectors), vectors))
+
+
+def to_dicts(result):
+    columns = [result[field].tolist() for field in ESTIMATE_FIELDS]
+    version = result["price_version"]
+    return [dict(zip(ESTIMATE_FIELDS, values), price_version=version) for values in zip(*columns)]
+
+
+def audit(forms):
+    """列指向版とスカラー版 (compute_web_order_estimate) の結果が食い違う件の (番号, 列指向, スカラー) を返す"""
+    mismatches = []
+    vectors = get_price_vectors()
+    for n, (vec, form) in enumerate(zip(estimate_forms(forms, vectors), forms)):
+        scalar = compute_web_order_estimate(form, vectors.index)
+        if vec != scalar:
+            mismatches.append((n, vec, scalar))
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from bulk_quote import detect_format, read_configs
+
+    parser = argparse.ArgumentParser(description="列指向版の見積りがスカラー版と一致するか確認する")
+    parser.add_argument("input", help="見積り条件の JSONL / CSV (bulk_quote と同じ形式)")
+    args = parser.parse_args()
+
+    with open(args.input, newline="", encoding="utf-8-sig") as f:
+        forms = list(read_configs(f, detect_format(args.input)))
+    mismatches = audit(forms)
+    for n, vec, scalar in mismatches[:20]:
+        print(f"#{n}\n  vector: {vec}\n  scalar: {scalar}")
+    print(f"{len(forms)} 件中 {len(mismatches)} 件が不一致")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,222 @@
+"""
+Web オーダーフォームの料金計算
+
+calculate_web_order_estimate は料金に関係する項目だけを正規化したタプルをキーに
+LRU キャッシュを引く。ほぼ同じ内容の再送信では再計算しない。
+キーには価格表のインデックスも含めるので、差し替え前の版の結果が新しい版で返ることはない
+(差し替え時にはキャッシュも破棄する)。結果の price_version に計算に使った版が入る。
+"""
+import os
+from functools import lru_cache
+
+import price_index
+from PRICE_TABLE_2025 import (
+    COLOR_ATTR_MAP, SPECIAL_SINGLE_COLOR_FEE, FULLCOLOR_SIZE_FEE, BACK_NAME_FEE, OPTION_INK_EXTRA
+)
+
+WEB_ORDER_ESTIMATE_CACHE_SIZE = int(os.environ.get("WEB_ORDER_ESTIMATE_CACHE_SIZE", "4096"))
+
+PRINT_POSITION_RANGE = range(1, 5)
+
+
+def compute_web_order_estimate(data: dict, index=None) -> dict:
+    """Web オーダーフォーム１件ぶんの単価・合計金額を返す (キャッシュを使わない直接計算)"""
+    index = index or price_index.PRICE_INDEX
+
+    # 1) 基本行を PRICE_TABLE から取得 ------------------------------
+    item          = data.get("productName", "")
+    qty           = int(data.get("totalQuantity", "0") or 0)
+    discount_type = "早割" if data.get("discountOption") == "早割" else "通常"
+
+    # プリント位置数 (printPositionNo1〜4 に値が入っている数)
+    pos_cnt = sum(1 for i in range(1,5) if data.get(f"printPositionNo{i}"))
+
+    # PRICE_TABLE から該当行検索 (インデックス経由)
+    row = price_index.find_price_row(item, discount_type, qty, index)
+    if not row:
+        # 見つからない場合は金額0を返すなど、適宜処理
+        return {
+            "unit_price": 0,
+            "total_price": 0,
+            "base_unit": 0,
+            "pos_add_fee": 0,
+            "color_fee": 0,
+            "back_name_fee": 0,
+            "option_ink_extra": 0,
+            "fullcolor_extra": 0,
+            "qty": qty,
+            "price_version": index.version
+        }
+
+    base_unit   = row["unit_price"]
+    pos_add_fee = row["pos_add"] * max(0, pos_cnt-1)
+
+    # 2) プリントカラー追加料金 ------------------------------
+    color_add_cnt    = 0     # 2色なら+1、3色なら+2
+    option_ink_extra = 0
+    fullcolor_extra  = 0
+    back_name_fee    = 0     # 背ネーム・番号セット等の加算
+    # ↑ 従来の背ネーム類はここへ合算していく
+
+    for p in range(1,5):
+        if not data.get(f"printPositionNo{p}"):
+            continue
+
+        # 1〜3色入力欄(プリントカラー・オプション)で実際に入力された値を取得
+        color_list = [
+            data.get(f"printColorOption{p}_1"),
+            data.get(f"printColorOption{p}_2"),
+            data.get(f"printColorOption{p}_3"),
+        ]
+        color_list = [c for c in color_list if c]  # 空文字除外
+
+        # 2色指定なら +1、3色指定なら +2
+        if len(color_list) == 2:
+            color_add_cnt += 1
+        elif len(color_list) == 3:
+            color_add_cnt += 2
+
+        # 各色の属性チェック
+        for c in color_list:
+            # (A) ネーム＆背番号セット/ネーム(大)/(小)/番号(大)/(小) が含まれていたら back_name_fee
+            if c in BACK_NAME_FEE:  
+                back_name_fee += BACK_NAME_FEE[c]
+
+            # (B) 特殊カラー(グリッター等)があれば SPECIAL_SINGLE_COLOR_FEE
+            if c in SPECIAL_SINGLE_COLOR_FEE:
+                back_name_fee += SPECIAL_SINGLE_COLOR_FEE[c]
+
+            # (C) COLOR_ATTR_MAP で "オプションインク" なら、option_ink_extra を加算
+            if COLOR_ATTR_MAP.get(c) == "オプションインク":
+                option_ink_extra += OPTION_INK_EXTRA
+
+        # フルカラーオプション
+        fcs = data.get(f"fullColorSize{p}")  # "S"/"M"/"L" など
+        if fcs:
+            fullcolor_extra += FULLCOLOR_SIZE_FEE.get(fcs, 0)  # サイズ別に加算
+
+        # 3) ネーム&番号カラーオプション（単色 or フチ付き）----------------
+        # 単色カラーを選択していた場合
+        single_color = data.get(f"singleColor{p}")
+        if single_color and single_color in SPECIAL_SINGLE_COLOR_FEE:
+            back_name_fee += SPECIAL_SINGLE_COLOR_FEE[single_color]
+
+        # フチ付きタイプを選択していた場合
+        edge_type = data.get(f"edgeType{p}")
+        if edge_type and edge_type != "なし":
+            # たとえばフチ付きは +100円
+            back_name_fee += 100
+
+            # カスタムフチ色の場合、edgeCustomTextColor{p} / edgeCustomEdgeColor{p} / edgeCustomEdgeColor2_{p} の中に
+            # 特殊色があれば追加
+            edge_text = data.get(f"edgeCustomTextColor{p}")
+            edge_col1 = data.get(f"edgeCustomEdgeColor{p}")
+            edge_col2 = data.get(f"edgeCustomEdgeColor2_{p}")
+
+            for ec in (edge_text, edge_col1, edge_col2):
+                if ec and ec in SPECIAL_SINGLE_COLOR_FEE:
+                    back_name_fee += SPECIAL_SINGLE_COLOR_FEE[ec]
+
+    # カラー追加料金 (各1色目はベース料金に含まれている想定)
+    # color_add_cnt * row["color_add"] で追加料金
+    color_fee = color_add_cnt * row["color_add"] + fullcolor_extra + option_ink_extra
+
+    # 4) 単価・合計 ---------------------------------
+    unit_price  = base_unit + pos_add_fee + color_fee + back_name_fee
+    total_price = unit_price * qty
+
+    return {
+        "unit_price":       unit_price,
+        "total_price":      total_price,
+        "base_unit":        base_unit,
+        "pos_add_fee":      pos_add_fee,
+        "color_fee":        color_fee,
+        "back_name_fee":    back_name_fee,
+        "option_ink_extra": option_ink_extra,
+        "fullcolor_extra":  fullcolor_extra,
+        "qty":              qty,
+        "price_version":    index.version
+    }
+
+
+def canonical_estimate_key(data: dict) -> tuple:
+    """
+    料金に影響する項目だけを取り出したキーを返す。
+    productName / totalQuantity / discountOption と、プリント位置ごとの
+    printColorOption* / fullColorSize* / singleColor* / edgeType* / edgeCustom* が対象。
+    プリント位置が空の箇所、フチ無しのときのフチ色は料金に影響しないので含めない。
+    """
+    qty = int(data.get("totalQuantity", "0") or 0)
+    discount_type = "早割" if data.get("discountOption") == "早割" else "通常"
+
+    positions = []
+    for p in PRINT_POSITION_RANGE:
+        if not data.get(f"printPositionNo{p}"):
+            positions.append(None)
+            continue
+        # 色の並び順は料金に影響しない
+        colors = tuple(sorted(
+            c for c in (data.get(f"printColorOption{p}_{i}") for i in (1, 2, 3)) if c
+        ))
+        edge_type = data.get(f"edgeType{p}") or ""
+        if edge_type and edge_type != "なし":
+            edge_colors = (
+                data.get(f"edgeCustomTextColor{p}") or "",
+                data.get(f"edgeCustomEdgeColor{p}") or "",
+                data.get(f"edgeCustomEdgeColor2_{p}") or "",
+            )
+        else:
+            edge_type, edge_colors = "", ()
+        positions.append((
+            colors,
+            data.get(f"fullColorSize{p}") or "",
+            data.get(f"singleColor{p}") or "",
+            edge_type,
+            edge_colors,
+        ))
+
+    return (data.get("productName", ""), qty, discount_type, tuple(positions))
+
+
+def _data_from_key(key: tuple) -> dict:
+    """canonical_estimate_key のキーから計算用の最小限のフォームデータを組み立てる"""
+    item, qty, discount_type, positions = key
+    data = {"productName": item, "totalQuantity": str(qty), "discountOption": discount_type}
+    for p, pos in zip(PRINT_POSITION_RANGE, positions):
+        if pos is None:
+            continue
+        colors, full_color_size, single_color, edge_type, edge_colors = pos
+        data[f"printPositionNo{p}"] = p
+        for i, c in enumerate(colors, start=1):
+            data[f"printColorOption{p}_{i}"] = c
+        data[f"fullColorSize{p}"] = full_color_size
+        data[f"singleColor{p}"] = single_color
+        data[f"edgeType{p}"] = edge_type
+        if edge_colors:
+            (data[f"edgeCustomTextColor{p}"],
+             data[f"edgeCustomEdgeColor{p}"],
+             data[f"edgeCustomEdgeColor2_{p}"]) = edge_colors
+    return data
+
+
+@lru_cache(maxsize=WEB_ORDER_ESTIMATE_CACHE_SIZE)
+def _cached_estimate(index, key: tuple) -> dict:
+    return compute_web_order_estimate(_data_from_key(key), index)
+
+
+def calculate_web_order_estimate(data: dict) -> dict:
+    """Web オーダーフォーム１件ぶんの単価・合計金額を返す (キャッシュ経由)"""
+    # 呼び出し側で書き換えられてもキャッシュが汚れないようコピーを返す
+    return dict(_cached_estimate(price_index.PRICE_INDEX, canonical_estimate_key(data)))
+
+
+def estimate_cache_info():
+    """キャッシュのヒット/ミス数などを返す"""
+    info = _cached_estimate.cache_info()
+    return {"hits": info.hits, "misses": info.misses,
+            "maxsize": info.maxsize, "currsize": info.currsize}
+
+
+@price_index.on_price_reload
+def clear_estimate_cache(index=None):
+    _cached_estimate.cache_clear()